@@ -0,0 +1,174 @@
+"""
+Replay of a BMD101 byte stream through the packet reader and the streaming parser.
+
+Raw ECG values (from the ecg_log.csv files in data/, or a synthetic trace) are packed
+into BMD101 raw-wave packets (AA AA 04 80 02 hi lo checksum), and laid out on a virtual
+57600 baud line at 512 packets/s. Bytes can be corrupted or dropped at random.
+
+  - packet: BMD101.read_data on a simulated serial port. Every call flushes the input
+    buffer first, so whatever arrived while the consumer was busy (`--stall-ms`, the
+    time spent putting results on queues and waiting for the GIL) is thrown away.
+  - stream: BMD101Parser.feed on the bytes that arrived between two reads, as
+    BMD101.read_samples does with read(in_waiting).
+
+`--rate` sets the true packet rate of the sensor, to simulate a crystal that is off
+from the nominal 512 Hz (e.g. 512.2 = +390 ppm).
+
+Reported: samples recovered out of those sent, parser counters, CPU per second of
+stream, and the error of the sample timestamps against the time each packet completed.
+The packet reader is stamped with the exact virtual arrival time here; on hardware its
+timestamps also carry the scheduling delay of the reading thread.
+
+Run from the repository root:
+    python -m benchmarks.bench_bmd101 --seconds 60 --corrupt 0.0005 --stall-ms 1.0 --rate 512.2
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from ecg.bmd101 import BMD101, BMD101Parser
+from utils.timebase import TimeBase
+
+BYTE_TIME = 10 / 57600  # 8N1: 10 bits per byte
+
+
+def load_raw(data_dir: str, count: int) -> np.ndarray:
+    values = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "patient_*", "ecg_log.csv"))):
+        if os.path.getsize(path):
+            values.append(np.loadtxt(path, delimiter=",", ndmin=2)[:, 1])
+        if sum(map(len, values)) >= count:
+            break
+    if not values:
+        t = np.arange(count) / 512
+        return (2000 + 800 * np.sin(2 * np.pi * 1.2 * t) ** 31).astype(int)
+    values = np.concatenate(values)
+    return np.resize(values, count).astype(int)
+
+
+def build_stream(raw: np.ndarray, corrupt: float, drop: float, rate: float = 512, seed: int = 0):
+    """:return: (stream bytes, arrival time of each byte, completion time of each packet)"""
+    rng = np.random.default_rng(seed)
+    packets = bytearray()
+    for value in raw:
+        value &= 0xFFFF
+        payload = bytes((0x80, 0x02, value >> 8, value & 0xFF))
+        packets += b"\xaa\xaa\x04" + payload + bytes(((255 - (sum(payload) & 0xFF)) & 0xFF,))
+    data = np.frombuffer(bytes(packets), dtype=np.uint8).copy()
+    # Byte k of packet n finishes arriving at n / rate + (k + 1) * BYTE_TIME
+    index = np.arange(len(data))
+    arrival = (index // 8) / rate + (index % 8 + 1) * BYTE_TIME
+    packet_done = np.arange(len(raw)) / rate + 8 * BYTE_TIME
+    flips = rng.random(len(data)) < corrupt
+    data[flips] ^= rng.integers(1, 256, np.count_nonzero(flips)).astype(np.uint8)
+    keep = rng.random(len(data)) >= drop
+    return data[keep].tobytes(), arrival[keep], packet_done
+
+
+class ReplaySerial:
+    """A serial port on a virtual clock: bytes become readable at their arrival time."""
+    def __init__(self, data: bytes, arrival: np.ndarray) -> None:
+        self.data = data
+        self.arrival = arrival
+        self.position = 0
+        self.now = 0.0
+
+    @property
+    def in_waiting(self) -> int:
+        return int(np.searchsorted(self.arrival, self.now, side="right")) - self.position
+
+    def reset_input_buffer(self) -> None:
+        self.position += max(0, self.in_waiting)
+
+    def read(self, size: int = 1) -> bytes:
+        end = min(self.position + size, len(self.data))
+        if end > self.position:
+            self.now = max(self.now, self.arrival[end - 1])
+        chunk = self.data[self.position:end]
+        self.position = end
+        return chunk
+
+
+def run_packet(data: bytes, arrival: np.ndarray, stall: float, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    port = ReplaySerial(data, arrival)
+    reader = BMD101.__new__(BMD101)
+    reader.serial_port = port
+    reader.timebase = TimeBase()  # read_data's own timestamps are not used here
+    samples = []
+    failures = 0
+    start = time.process_time()
+    while port.position < len(data) - 8:
+        try:
+            ret, _, raw_data, _ = reader.read_data()
+        except IndexError:
+            break
+        if ret == 0:
+            samples.append((port.now, raw_data))
+        else:
+            failures += 1
+        port.now += rng.exponential(stall) if stall else 0
+    return samples, {"failed_reads": failures}, time.process_time() - start
+
+
+def run_stream(data: bytes, arrival: np.ndarray, poll: float, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    parser = BMD101Parser()
+    samples = []
+    position = 0
+    now = 0.0
+    start = time.process_time()
+    while position < len(data):
+        now += poll * rng.uniform(0.5, 1.5)
+        end = int(np.searchsorted(arrival, now, side="right"))
+        if end > position:
+            samples.extend(parser.feed(data[position:end], now))
+            position = end
+    return samples, parser.stats(), time.process_time() - start
+
+
+def timestamp_error(samples: list, packet_done: np.ndarray, raw: np.ndarray) -> tuple:
+    """Match samples to packets in order by value, and compare their timestamps."""
+    errors = []
+    p = 0
+    for timestamp, value in samples:
+        while p < len(raw) and (raw[p] & 0xFFFF) != (value & 0xFFFF):
+            p += 1
+        if p == len(raw):
+            break
+        errors.append(timestamp - packet_done[p])
+        p += 1
+    errors = np.abs(np.array(errors)) * 1e3
+    return (np.median(errors), np.percentile(errors, 95)) if len(errors) else (float("nan"), float("nan"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="./data")
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--corrupt", type=float, default=0.0005, help="probability of a corrupted byte")
+    parser.add_argument("--drop", type=float, default=0.0001, help="probability of a lost byte")
+    parser.add_argument("--stall-ms", type=float, default=1.0, help="mean consumer stall between packet reads")
+    parser.add_argument("--poll-ms", type=float, default=20.0, help="mean interval between streaming reads")
+    parser.add_argument("--rate", type=float, default=512.0, help="true packet rate of the sensor in Hz")
+    args = parser.parse_args()
+
+    raw = load_raw(args.data, int(args.seconds * args.rate))
+    data, arrival, packet_done = build_stream(raw, args.corrupt, args.drop, args.rate)
+    print(f"{len(raw)} packets, {len(data)} bytes, {args.seconds:.0f} s of stream")
+
+    print(f"{'reader':<8}{'samples':>9}{'recovered':>11}{'cpu ms/s':>10}{'ts err p50 ms':>15}{'p95 ms':>9}  counters")
+    for name, (samples, stats, cpu) in (
+        ("packet", run_packet(data, arrival, args.stall_ms / 1e3)),
+        ("stream", run_stream(data, arrival, args.poll_ms / 1e3)),
+    ):
+        p50, p95 = timestamp_error(samples, packet_done, raw)
+        print(f"{name:<8}{len(samples):>9}{len(samples) / len(raw):>10.1%}{cpu / args.seconds * 1e3:>10.2f}"
+              f"{p50:>15.2f}{p95:>9.2f}  {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Frame rates, RGB/IR pairing and timestamp error of the camera capture loop, on simulated cameras.
+
+The simulated cameras run free like UVC devices: frame k is exposed at phase + k / fps and
+can be dequeued a transfer time later, the driver keeps only the newest buffer, `grab()`
+blocks until a frame newer than the last one is available, and CAP_PROP_POS_MSEC is the
+monotonic capture time (like the V4L2 buffer timestamp). `retrieve()` costs a decode time.
+
+Compared, per scenario:
+  - serial: the former loop, read() RGB then IR, stamped after each read
+  - threads: CameraCapture with one grab thread per camera, without and with the grab barrier
+Reported: fps of each camera, |RGB - nearest IR| capture-time distance of the published
+pairs p50 (how close the exposures of a pair are), and the |timestamp - capture time| p50.
+
+Run from the repository root:
+    python -m benchmarks.bench_camera_threads --seconds 10
+"""
+import argparse
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import global_vars
+from capture.camera import CameraCapture
+from utils.timebase import TimeBase
+
+SCENARIOS = {  # (rgb fps, ir fps, ir failure probability)
+    "both 30 fps": (30, 30, 0.0),
+    "ir 15 fps": (30, 15, 0.0),
+    "ir failing 30%": (30, 30, 0.3),
+}
+
+
+class SimulatedCamera:
+    def __init__(self, fps: float, phase: float, decode: float, failure: float = 0.0, seed: int = 0) -> None:
+        self.period = 1 / fps
+        self.start = time.monotonic() + phase
+        self.decode = decode
+        self.failure = failure
+        self.transfer = 0.3 * self.period
+        self.rng = np.random.default_rng(seed)
+        self.index = -1
+        self.position = 0.0
+        self.frame = np.zeros((120, 160, 3), dtype=np.uint8)
+
+    def isOpened(self) -> bool:
+        return True
+
+    def set(self, prop, value) -> bool:
+        return True
+
+    def get(self, prop) -> float:
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.position * 1000
+        if prop == cv2.CAP_PROP_FPS:
+            return 1 / self.period
+        return 0.0
+
+    def grab(self) -> bool:
+        newest = int((time.monotonic() - self.transfer - self.start) // self.period)
+        if newest <= self.index:
+            newest = self.index + 1
+            time.sleep(max(self.start + newest * self.period + self.transfer - time.monotonic(), 0))
+        if self.rng.random() < self.failure:
+            time.sleep(self.period)  # a failing device times out
+            return False
+        self.index = newest
+        self.position = self.start + newest * self.period
+        return True
+
+    def retrieve(self, frame=None):
+        time.sleep(self.decode)
+        return True, self.frame
+
+    def read(self, frame=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(frame)
+
+
+def serial_loop(cap, ir_cap, timebase: TimeBase, frame_queue: queue.Queue, ir_frame_queue: queue.Queue) -> None:
+    """The former CameraCapture.__call__: both cameras read in one loop, stamped after each read."""
+    while global_vars.pipeline_running:
+        success, frame = cap.read()
+        if not success:
+            continue
+        frame_queue.put((cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), timebase.now(), cap.position))
+        success, ir_frame = ir_cap.read()
+        if not success:
+            continue
+        ir_frame_queue.put((cv2.cvtColor(ir_frame, cv2.COLOR_BGR2RGB), timebase.now(), ir_cap.position))
+
+
+class RecordingQueue(queue.Queue):
+    """Queue that also records the capture time of the camera that put each frame."""
+    def __init__(self, camera: SimulatedCamera) -> None:
+        super().__init__()
+        self.camera = camera
+
+    def put(self, item, block=True, timeout=None):
+        super().put((*item, self.camera.position), block, timeout)
+
+
+def drain(q: queue.Queue) -> np.ndarray:
+    rows = []
+    while not q.empty():
+        _, timestamp, captured = q.get_nowait()[:3]
+        rows.append((timestamp, captured))
+    return np.array(rows).reshape(-1, 2)
+
+
+def run(mode: str, scenario: tuple, seconds: float, decode: float) -> dict:
+    rgb_fps, ir_fps, failure = scenario
+    cap = SimulatedCamera(rgb_fps, 0.0, decode, seed=1)
+    ir_cap = SimulatedCamera(ir_fps, 0.011, decode, failure, seed=2)
+    timebase = TimeBase()
+    if mode == "serial":
+        frame_queue, ir_frame_queue = queue.Queue(), queue.Queue()
+        target, args = serial_loop, (cap, ir_cap, timebase, frame_queue, ir_frame_queue)
+    else:
+        frame_queue, ir_frame_queue = RecordingQueue(cap), RecordingQueue(ir_cap)
+        capture = CameraCapture(cap, ir_cap, timebase, {"sync_grabs": mode == "threads + barrier"})
+        target, args = capture, (frame_queue, ir_frame_queue)
+    global_vars.pipeline_running = True
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    time.sleep(seconds)
+    global_vars.pipeline_running = False
+    thread.join()
+
+    rgb, ir = drain(frame_queue), drain(ir_frame_queue)
+    errors = np.abs(np.concatenate((rgb[:, 0] - timebase.to_session(rgb[:, 1]),
+                                    ir[:, 0] - timebase.to_session(ir[:, 1]))))
+    pairing = np.abs(rgb[:, 1][:, None] - ir[:, 1][None, :]).min(axis=1) if len(ir) else np.array([np.nan])
+    return {
+        "rgb_fps": len(rgb) / seconds,
+        "ir_fps": len(ir) / seconds,
+        "pairing_ms": np.median(pairing) * 1e3,
+        "error_ms": np.median(errors) * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--decode", type=float, default=0.008, help="seconds per retrieve (MJPG decode)")
+    args = parser.parse_args()
+
+    print(f"{'scenario':<16}{'mode':<20}{'rgb fps':>9}{'ir fps':>8}{'pair p50 ms':>13}{'ts err p50 ms':>15}")
+    for name, scenario in SCENARIOS.items():
+        for mode in ("serial", "threads", "threads + barrier"):
+            result = run(mode, scenario, args.seconds, args.decode)
+            print(f"{name:<16}{mode:<20}{result['rgb_fps']:>9.1f}{result['ir_fps']:>8.1f}"
+                  f"{result['pairing_ms']:>13.1f}{result['error_ms']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
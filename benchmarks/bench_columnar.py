@@ -0,0 +1,88 @@
+"""
+CSV against columnar session logs (log.columnar) on a synthetic session: 512 Hz ECG rows
+(int samples, as ECGChunk.rows gives them) and 30 fps rPPG rows (float16 values, as Step
+returns them), logged through DataLogger's flush in batches of 100 rows.
+
+Reported per log and format: write CPU per row, bytes on disk (what is uploaded), the load
+time of the whole log into arrays (pd.read_csv, as Normalizer does, against ColumnReader),
+and for the columnar store the on-demand CSV export.
+
+Run from the repository root:
+    python -m benchmarks.bench_columnar --minutes 10
+"""
+import argparse
+import os
+import queue
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from log.columnar import ECG_COLUMNS, RPPG_COLUMNS, ColumnReader, store_path
+from log.dlog import DataLogger
+
+ECG_RATE = 512
+FPS = 30
+BATCH = 100
+
+
+def session_rows(minutes: float) -> dict:
+    rng = np.random.default_rng(0)
+    start = 1.75e9
+    count = int(minutes * 60 * ECG_RATE)
+    ecg = list(zip((start + np.arange(count) / ECG_RATE).tolist(), rng.integers(-2000, 2000, count).tolist()))
+    count = int(minutes * 60 * FPS)
+    values = rng.normal(0, 0.3, count).astype(np.float16)
+    rppg = [[timestamp, value] for timestamp, value in zip((start + np.arange(count) / FPS).tolist(), values)]
+    return {"ecg": (ecg, ECG_COLUMNS), "rppg": (rppg, RPPG_COLUMNS)}
+
+
+def size(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def write(rows: list, log_path: str, log_format: str, columns: list) -> float:
+    """:return: CPU seconds to log `rows` through DataLogger's flush"""
+    logger = DataLogger({"log_path": log_path, "data_queue": queue.Queue(), "format": log_format, "columns": columns})
+    start = time.process_time()
+    for i in range(0, len(rows), BATCH):
+        logger.buffer = rows[i:i + BATCH]
+        logger._flush_buffer()
+    logger.close()
+    return time.process_time() - start
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10.0, help="session length")
+    args = parser.parse_args()
+
+    print(f"{'log':<6}{'format':<10}{'rows':>9}{'write us/row':>14}{'bytes':>12}{'load s':>9}{'export s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (rows, columns) in session_rows(args.minutes).items():
+            csv_path = os.path.join(directory, f"{name}_log.csv")
+            cpu = write(rows, csv_path, "csv", columns)
+            load = timed(lambda: pd.read_csv(csv_path, header=None).to_numpy())
+            print(f"{name:<6}{'csv':<10}{len(rows):>9}{cpu / len(rows) * 1e6:>14.2f}{size(csv_path):>12}{load:>9.3f}"
+                  f"{'-':>10}")
+            column_path = os.path.join(directory, "columnar", f"{name}_log.csv")
+            os.makedirs(os.path.dirname(column_path), exist_ok=True)
+            cpu = write(rows, column_path, "columnar", columns)
+            store = store_path(column_path)
+            load = timed(lambda: ColumnReader(store).read())
+            export = timed(lambda: ColumnReader(store).to_csv(column_path))
+            print(f"{name:<6}{'columnar':<10}{len(rows):>9}{cpu / len(rows) * 1e6:>14.2f}{size(store):>12}"
+                  f"{load:>9.3f}{export:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-frame cost of the crop_resize work that follows FaceMesh, before and after
+the vectorised fast path.
+
+FaceMesh runs once per frame up front and its results are cached, so only the
+landmark-to-box extraction, the frame copy and the crop/resize are timed:
+  - legacy: list of (x, y) tuples, np.copy of the frame, float32 before cv2.resize
+  - fast:   MediaPipePreprocess.landmark_box + crop_box (bulk landmark read,
+            no copy, uint8 resize into a reused buffer, one float32 conversion)
+
+Run from the repository root:
+    python -m benchmarks.bench_crop_resize --session data/patient_000001
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.bench_tracking import load_session_frames
+from preprocess.mp import MediaPipePreprocess
+
+
+def legacy_post_detection(image: np.ndarray, results, size: tuple) -> tuple:
+    height, width, _ = image.shape
+    raw_image = np.copy(image)
+    multi_landmarks = results.multi_face_landmarks[0]
+    landmarks = np.array([(landmark.x, landmark.y) for landmark in multi_landmarks.landmark])
+    x_min, y_min = np.min(landmarks, axis=0)
+    x_max, y_max = np.max(landmarks, axis=0)
+    box = np.clip(np.array([x_min, y_min, x_max, y_max]), 0, 1.0)
+    cropped_resized = cv2.resize(
+        image[int(box[1] * height):int(box[3] * height), int(box[0] * width):int(box[2] * width)].astype("float32"),
+        size,
+        interpolation=cv2.INTER_AREA
+    )
+    return cropped_resized, raw_image
+
+
+def fast_post_detection(preprocess: MediaPipePreprocess, image: np.ndarray, results, size: tuple) -> tuple:
+    box = preprocess.landmark_box(results.multi_face_landmarks[0])
+    return preprocess.crop_box(image, box, size), image
+
+
+def time_per_frame(fn, items: list, repeat: int) -> np.ndarray:
+    times = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            fn(*item)
+            times.append(time.perf_counter() - start)
+    return np.array(times) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--session", default="data/patient_000001")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--canvas", default="640x480")
+    parser.add_argument("--size", type=int, default=36)
+    args = parser.parse_args()
+
+    canvas = tuple(int(v) for v in args.canvas.split("x"))
+    size = (args.size, args.size)
+    frames = load_session_frames(args.session, canvas, 240, args.frames)
+    preprocess = MediaPipePreprocess({"target_size": size, "mesh_display": False})
+
+    detected = []
+    start = time.perf_counter()
+    for frame in frames:
+        results = preprocess.face_mesh.process(frame)
+        if results.multi_face_landmarks:
+            detected.append((frame, results))
+    facemesh_us = (time.perf_counter() - start) / len(frames) * 1e6
+    if not detected:
+        print("[bench_crop_resize] FaceMesh found no face in the frame set")
+        return
+
+    legacy = time_per_frame(lambda f, r: legacy_post_detection(f, r, size), detected, args.repeat)
+    fast = time_per_frame(lambda f, r: fast_post_detection(preprocess, f, r, size), detected, args.repeat)
+
+    max_diff = max(
+        float(np.abs(legacy_post_detection(f, r, size)[0] - fast_post_detection(preprocess, f, r, size)[0]).max())
+        for f, r in detected
+    )
+
+    print(f"[bench_crop_resize] {len(detected)}/{len(frames)} frames with a face, {canvas[0]}x{canvas[1]} -> {size}")
+    print(f"[bench_crop_resize] FaceMesh alone: {facemesh_us:.0f} us/frame")
+    print(f"{'path':<8}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}")
+    for name, times in (("legacy", legacy), ("fast", fast)):
+        print(f"{name:<8}{times.mean():>10.1f}{np.percentile(times, 50):>10.1f}{np.percentile(times, 95):>10.1f}")
+    print(f"[bench_crop_resize] speedup {legacy.mean() / fast.mean():.1f}x, max pixel difference {max_diff:.2f}")
+
+
+if __name__ == "__main__":
+    main()
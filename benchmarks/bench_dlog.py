@@ -0,0 +1,154 @@
+"""
+DataLogger at a 1 kHz sample rate: a producer thread puts one [timestamp, value] row per
+sample into the queue, as the BMD101 reader does per sample, for `--seconds`, after an idle
+phase without data. Compared:
+  - polling: the previous logger, which polls `empty()` with 10 ms sleeps and reopens the CSV
+    file in append mode at every flush
+  - blocking: DataLogger, blocking batched dequeue and one file handle, no fsync
+  - fsync=<s>: DataLogger with an fsync every <s> seconds
+
+Reported per logger: thread CPU per second while idle and while logging, rows written against
+rows produced, the time from the end of the pipeline to the file being closed, and
+DataLogger's counters (queue depth, flush latency, fsyncs).
+
+Run from the repository root:
+    python -m benchmarks.bench_dlog --seconds 10 --fsync 1 10
+"""
+import argparse
+import csv
+import os
+import queue
+import tempfile
+import threading
+import time
+from io import StringIO
+
+import global_vars
+from log.dlog import DataLogger
+
+
+class PollingLogger:
+    """The previous DataLogger engine (CSV only), for reference."""
+    def __init__(self, config: dict) -> None:
+        self.file_path = config["log_path"]
+        self.data_queue = config["data_queue"]
+        self.lock = threading.Lock()
+        self.batch_size = 100
+        self.flush_interval = 1.0
+        self.last_flush_time = time.time()
+        self.buffer = []
+        with open(self.file_path, 'w'):
+            pass
+
+    def data_log(self) -> None:
+        batch_data = []
+        while not self.data_queue.empty() and len(batch_data) < self.batch_size:
+            try:
+                batch_data.append(self.data_queue.get(block=False))
+                self.data_queue.task_done()
+            except queue.Empty:
+                break
+        if not batch_data:
+            if self.buffer and time.time() - self.last_flush_time >= self.flush_interval:
+                self._flush_buffer()
+            return
+        self.buffer.extend(batch_data)
+        if len(self.buffer) >= self.batch_size or time.time() - self.last_flush_time >= self.flush_interval:
+            self._flush_buffer()
+
+    def _flush_buffer(self) -> None:
+        if not self.buffer:
+            return
+        output = StringIO()
+        csv.writer(output).writerows(self.buffer)
+        with self.lock:
+            with open(self.file_path, 'a', newline='', buffering=8192) as csvfile:
+                csvfile.write(output.getvalue())
+        self.buffer = []
+        self.last_flush_time = time.time()
+
+    def __call__(self) -> None:
+        try:
+            while global_vars.pipeline_running or not self.data_queue.empty():
+                self.data_log()
+                if self.data_queue.empty():
+                    time.sleep(0.01)
+        finally:
+            self._flush_buffer()
+
+
+def produce(data_queue: queue.Queue, rate: float, seconds: float) -> int:
+    """Put `rate` rows per second for `seconds`, paced in 10 ms steps. :return: rows produced"""
+    produced = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        for _ in range(int(elapsed * rate) - produced):
+            data_queue.put([time.time(), produced % 4000 - 2000])
+            produced += 1
+        time.sleep(0.01)
+    return produced
+
+
+def thread_cpu_seconds(native_id: int) -> float:
+    """User + system CPU of a thread of this process (Linux, clock-tick resolution)."""
+    with open(f"/proc/self/task/{native_id}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def run(name: str, directory: str, rate: float, seconds: float, idle_seconds: float) -> dict:
+    data_queue = queue.Queue(maxsize=512)
+    log_path = os.path.join(directory, f"{name}.csv")
+    if name == "polling":
+        logger = PollingLogger({"log_path": log_path, "data_queue": data_queue})
+    else:
+        fsync_interval = float(name.split("=")[1]) if name.startswith("fsync") else None
+        logger = DataLogger({"log_path": log_path, "data_queue": data_queue, "fsync_interval": fsync_interval})
+
+    global_vars.pipeline_running = True
+    thread = threading.Thread(target=logger, daemon=True)
+    thread.start()
+    time.sleep(idle_seconds)
+    idle_cpu = thread_cpu_seconds(thread.native_id)
+    produced = produce(data_queue, rate, seconds)
+    busy_cpu = thread_cpu_seconds(thread.native_id) - idle_cpu
+    stopping = time.perf_counter()
+    global_vars.pipeline_running = False
+    thread.join()
+    stop_seconds = time.perf_counter() - stopping
+    with open(log_path) as f:
+        logged = sum(1 for _ in f)
+    record = {
+        "idle_cpu_ms_per_s": idle_cpu / idle_seconds * 1e3,
+        "cpu_ms_per_s": busy_cpu / seconds * 1e3,
+        "produced": produced,
+        "logged": logged,
+        "stop_ms": stop_seconds * 1e3,
+    }
+    if isinstance(logger, DataLogger):
+        record.update(logger.stats())
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=1000.0, help="rows per second")
+    parser.add_argument("--seconds", type=float, default=10.0, help="logging duration")
+    parser.add_argument("--idle-seconds", type=float, default=5.0, help="idle phase before the data")
+    parser.add_argument("--fsync", type=float, nargs="*", default=[1.0], help="fsync intervals to compare")
+    args = parser.parse_args()
+
+    names = ["polling", "blocking"] + [f"fsync={interval:g}" for interval in args.fsync]
+    print(f"{'logger':<12}{'idle cpu ms/s':>14}{'cpu ms/s':>10}{'produced':>10}{'logged':>8}{'stop ms':>9}"
+          f"{'max depth':>11}{'flush ms':>10}{'flush max':>11}{'fsyncs':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            record = run(name, directory, args.rate, args.seconds, args.idle_seconds)
+            print(f"{name:<12}{record['idle_cpu_ms_per_s']:>14.2f}{record['cpu_ms_per_s']:>10.1f}"
+                  f"{record['produced']:>10}{record['logged']:>8}{record['stop_ms']:>9.0f}"
+                  f"{record.get('max_queue_depth', float('nan')):>11}{record.get('flush_ms_mean', float('nan')):>10.2f}"
+                  f"{record.get('flush_ms_max', float('nan')):>11.2f}{record.get('fsyncs', '-'):>8}")
+
+
+if __name__ == "__main__":
+    main()
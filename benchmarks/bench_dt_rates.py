@@ -0,0 +1,188 @@
+"""
+Heart-rate accuracy of Step when frames are dropped or skipped on purpose.
+
+Three ways of running the same frames are compared:
+  - legacy:  dt = 1/30 and the heart rate computed as if the signal were sampled at 30 Hz
+  - fs:      dt = 1/30, heart rate computed at the sampling rate measured from the timestamps
+  - dynamic: Step(dynamic_dt=True) and the measured sampling rate (what the pipeline does now)
+Every run is thinned to each target rate with the same FrameDecimator the preprocess stages use.
+
+Sources:
+  - synthetic (default): a recorded face crop with a known pulse added to it, "captured" at
+    30 fps with a fraction of the frames dropped at random, so the true heart rate is known.
+  - sessions: the recorded sessions in data/. Frame timestamps come from video_timestamps.csv
+    (stream-mode recordings) or rppg_log.csv (one row per frame); the reference is the median
+    R-R interval of ecg_log.csv over the same span. The serial reader loses ECG samples and the
+    sessions are short, so this reference is only approximate.
+
+Run from the repository root:
+    python -m benchmarks.bench_dt_rates --rates 0 25 20 15 10
+    python -m benchmarks.bench_dt_rates --source sessions --max-sessions 10
+(rate 0 means every captured frame)
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+from scipy.signal import butter, filtfilt, find_peaks
+
+from model.step import Step
+from preprocess.base import FrameDecimator
+from utils.hr import bandpass_filter, get_hr
+
+MODES = ("legacy", "fs", "dynamic")
+
+
+def read_crops(video_path: str, max_frames: int) -> list:
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).astype(np.float32))
+    cap.release()
+    return frames
+
+
+def synthetic_recordings(data_dir: str, heart_rates: list, duration: float, drop: float, seed: int = 0):
+    """
+    :return: (name, frames, timestamps, true heart rate) for every heart rate
+    """
+    rng = np.random.default_rng(seed)
+    videos = sorted(glob.glob(os.path.join(data_dir, "patient_*", "video.mp4")))
+    base = read_crops(videos[0], 1)[0] if videos else np.full((36, 36, 3), 128, dtype=np.float32)
+    # Skin-like pulse amplitude per channel (strongest in green)
+    amplitude = np.array([0.3, 1.0, 0.2], dtype=np.float32) * 0.01
+    for heart_rate in heart_rates:
+        timestamps = np.arange(0, duration, 1 / 30)
+        timestamps = timestamps[rng.random(len(timestamps)) >= drop]
+        frames = [
+            np.clip(base * (1 + amplitude * np.sin(2 * np.pi * heart_rate / 60 * t)) + rng.normal(0, 0.5, base.shape),
+                    0, 255).astype(np.float32)
+            for t in timestamps
+        ]
+        yield f"synthetic {heart_rate:g} BPM", frames, timestamps, float(heart_rate)
+
+
+def ecg_heart_rate(times: np.ndarray, values: np.ndarray, start: float, end: float):
+    """
+    Heart rate from the median R-R interval between `start` and `end`.
+    ECG samples arrive in bursts, so their timestamps are read times; the samples are
+    spaced evenly at the effective rate of the recording instead.
+    """
+    fs = (len(times) - 1) / (times[-1] - times[0])
+    signal = values[(times >= start) & (times <= end)]
+    if len(signal) < fs * 2:
+        return None
+    b, a = butter(3, [5, 20], fs=fs, btype="band")
+    signal = filtfilt(b, a, signal)
+    # R peaks may be inverted depending on electrode placement
+    if np.abs(signal.min()) > np.abs(signal.max()):
+        signal = -signal
+    peaks, _ = find_peaks(signal, distance=int(0.33 * fs), prominence=np.percentile(signal, 99) * 0.4)
+    if len(peaks) < 3:
+        return None
+    return 60.0 / np.median(np.diff(peaks) / fs)
+
+
+def session_recordings(data_dir: str):
+    """
+    :return: (name, frames, timestamps, ECG heart rate) for every usable session
+    """
+    for session_dir in sorted(glob.glob(os.path.join(data_dir, "patient_*"))):
+        ecg_path = os.path.join(session_dir, "ecg_log.csv")
+        video_path = os.path.join(session_dir, "video.mp4")
+        if not (os.path.exists(video_path) and os.path.exists(ecg_path) and os.path.getsize(ecg_path)):
+            continue
+        sidecar = os.path.join(session_dir, "video_timestamps.csv")
+        if os.path.exists(sidecar):
+            timestamps = np.loadtxt(sidecar, delimiter=",", ndmin=2)[:, 1]
+        else:
+            timestamps = np.loadtxt(os.path.join(session_dir, "rppg_log.csv"), delimiter=",", ndmin=2)[:, 0]
+        frames = read_crops(video_path, len(timestamps))
+        if len(frames) < 64:
+            continue
+        timestamps = timestamps[:len(frames)]
+        ecg = np.loadtxt(ecg_path, delimiter=",", ndmin=2)
+        reference = ecg_heart_rate(ecg[:, 0], ecg[:, 1], timestamps[0], timestamps[-1])
+        if reference is None:
+            continue
+        yield os.path.basename(session_dir), frames, timestamps, reference
+
+
+def heart_rate(frames: list, timestamps: np.ndarray, mode: str, state_path: str, settle: int) -> float:
+    model = Step(
+        model_path="./model/models/onnx/step.onnx",
+        state_path=state_path,
+        dt=1 / 30,
+        dynamic_dt=mode == "dynamic",
+    )
+    bvp = np.array([model.infer(frame, timestamp) for frame, timestamp in zip(frames, timestamps)], dtype=np.float64)
+    bvp = bvp[settle:]
+    fs = 30 if mode == "legacy" else (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+    return get_hr(bandpass_filter(bvp, fs=fs), sr=fs)
+
+
+def decimate(timestamps: np.ndarray, rate: float) -> np.ndarray:
+    decimator = FrameDecimator(rate or None)
+    return np.array([i for i, t in enumerate(timestamps) if decimator.accept(t)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="synthetic", choices=["synthetic", "sessions"])
+    parser.add_argument("--data", default="./data")
+    parser.add_argument("--rates", nargs="+", type=float, default=[0, 25, 20, 15, 10])
+    parser.add_argument("--heart-rates", nargs="+", type=float, default=[60, 75, 90, 110])
+    parser.add_argument("--duration", type=float, default=20.0, help="synthetic recording length in seconds")
+    parser.add_argument("--drop", type=float, default=0.2, help="fraction of synthetic frames dropped at capture")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds of model output skipped at the start")
+    parser.add_argument("--max-sessions", type=int, default=0)
+    args = parser.parse_args()
+    ort.set_default_logger_severity(3)
+
+    if args.source == "synthetic":
+        recordings = synthetic_recordings(args.data, args.heart_rates, args.duration, args.drop)
+    else:
+        recordings = session_recordings(args.data)
+
+    workdir = tempfile.mkdtemp(prefix="bench_dt_")
+    state_path = os.path.join(workdir, "state.pkl")
+    errors = {(rate, mode): [] for rate in args.rates for mode in MODES}
+    used = 0
+    print("absolute heart-rate error in BPM per target rate (legacy / fs / dynamic)")
+    for name, frames, timestamps, reference in recordings:
+        used += 1
+        span = timestamps[-1] - timestamps[0]
+        line = f"{name:<22}{len(frames) / span:>5.1f} fps  ref {reference:6.1f}"
+        for rate in args.rates:
+            keep = decimate(timestamps, rate)
+            settle = int(args.settle * len(keep) / span)
+            if len(keep) - settle < 48:
+                line += f" | {rate or 'all':>4}: too short"
+                continue
+            for mode in MODES:
+                shutil.copy("./model/models/onnx/state.pkl", state_path)
+                estimate = heart_rate([frames[i] for i in keep], timestamps[keep], mode, state_path, settle)
+                errors[(rate, mode)].append(abs(estimate - reference))
+            line += f" | {rate or 'all':>4}: " + " / ".join(f"{errors[(rate, mode)][-1]:5.1f}" for mode in MODES)
+        print(line)
+        if args.max_sessions and used >= args.max_sessions:
+            break
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{used} recordings, mean absolute error in BPM")
+    print(f"{'rate':>6}" + "".join(f"{mode:>10}" for mode in MODES))
+    for rate in args.rates:
+        if errors[(rate, MODES[0])]:
+            print(f"{rate or 'all':>6}" + "".join(f"{np.mean(errors[(rate, mode)]):>10.1f}" for mode in MODES))
+
+
+if __name__ == "__main__":
+    main()
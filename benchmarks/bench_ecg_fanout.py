@@ -0,0 +1,135 @@
+"""
+Maximum sustainable ECG sample rate through parser, queues, logger and quality monitor.
+
+The ECG thread is replaced by a producer that parses a prebuilt BMD101 byte stream
+with BMD101Parser (10 packets per read, as read(in_waiting) returns them) as fast as it
+can, and hands the samples to the pipeline queues (bounded at 512 items like Pipeline):
+  - per-sample: one [timestamp, raw] put per sample into each queue (the old ECG.stream)
+  - chunks:     ChunkPublisher fan-out of ECGChunk items
+The real DataLogger writes the raw queue to a temporary CSV file, and a monitor thread
+drains the other queue into a RingBuffer range every 33 ms like
+Pipeline._process_ecg_quality. The rate is the number of samples that reached both
+consumers per second of wall time; anything above 512/s is headroom.
+
+Run from the repository root:
+    python -m benchmarks.bench_ecg_fanout --seconds 5 --chunk-sizes 16 64 256
+"""
+import argparse
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import global_vars
+from ecg.bmd101 import BMD101Parser
+from ecg.publisher import ChunkPublisher, ECGChunk
+from log.dlog import DataLogger
+from utils.ringbuffer import RingBuffer
+
+
+def build_packets(count: int) -> bytes:
+    t = np.arange(count) / 512
+    values = (2000 + 800 * np.sin(2 * np.pi * 1.2 * t) ** 31).astype(int)
+    stream = bytearray()
+    for value in values:
+        payload = bytes((0x80, 0x02, value >> 8, value & 0xFF))
+        stream += b"\xaa\xaa\x04" + payload + bytes(((255 - (sum(payload) & 0xFF)) & 0xFF,))
+    return bytes(stream)
+
+
+def monitor(monitor_queue: queue.Queue, counter: list) -> None:
+    buffer = RingBuffer(512, track_extrema=True)
+    while global_vars.pipeline_running or not monitor_queue.empty():
+        values = []
+        while not monitor_queue.empty():
+            try:
+                item = monitor_queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, ECGChunk):
+                values.extend(item.values.tolist())
+            else:
+                values.append(float(item[1]))
+        buffer.extend(values)
+        counter[0] += len(values)
+        if buffer.full:
+            buffer.max() - buffer.min()
+        time.sleep(0.033)
+
+
+def run(chunk_size: int, stream: bytes, seconds: float, read_size: int = 80) -> dict:
+    raw_queue = queue.Queue(maxsize=512)
+    monitor_queue = queue.Queue(maxsize=512)
+    log_path = os.path.join(tempfile.mkdtemp(prefix="bench_ecg_"), "ecg_log.csv")
+    logger = DataLogger({"log_path": log_path, "data_queue": raw_queue})
+    monitored = [0]
+
+    global_vars.pipeline_running = True
+    threads = [
+        threading.Thread(target=logger, daemon=True),
+        threading.Thread(target=monitor, args=(monitor_queue, monitored), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    parser = BMD101Parser()
+    publisher = None
+    if chunk_size:
+        publisher = ChunkPublisher(chunk_size)
+        publisher.subscribe(raw_queue)
+        publisher.subscribe(monitor_queue, drop_when_full=True)
+    produced = 0
+    position = 0
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    while time.perf_counter() - start < seconds:
+        if position + read_size > len(stream):
+            position = 0
+        samples = parser.feed(stream[position:position + read_size], time.time())
+        position += read_size
+        if publisher is not None:
+            publisher.extend(samples)
+        else:
+            for sample in samples:
+                raw_queue.put(sample)
+                monitor_queue.put(sample)
+        produced += len(samples)
+    if publisher is not None:
+        publisher.flush()
+    global_vars.pipeline_running = False
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    with open(log_path) as f:
+        logged = sum(1 for _ in f)
+    return {
+        "rate": logged / elapsed,
+        "logged": logged,
+        "monitored": monitored[0],
+        "produced": produced,
+        "cpu_us": cpu / max(logged, 1) * 1e6,
+        "dropped": publisher.dropped if publisher is not None else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[16, 64, 256])
+    args = parser.parse_args()
+
+    stream = build_packets(512 * 10)
+    print(f"{'mode':<12}{'samples/s':>11}{'x 512 Hz':>10}{'cpu us/sample':>15}{'logged':>9}{'monitored':>11}{'dropped':>9}")
+    for chunk_size in [0] + args.chunk_sizes:
+        result = run(chunk_size, stream, args.seconds)
+        name = f"chunk {chunk_size}" if chunk_size else "per-sample"
+        print(f"{name:<12}{result['rate']:>11.0f}{result['rate'] / 512:>10.1f}{result['cpu_us']:>15.2f}"
+              f"{result['logged']:>9}{result['monitored']:>11}{result['dropped']:>9}")
+
+
+if __name__ == "__main__":
+    main()
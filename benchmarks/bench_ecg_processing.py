@@ -0,0 +1,102 @@
+"""
+R-peak detection accuracy and CPU cost of ECGProcessor on synthetic ECG.
+
+The synthetic trace has known beat times: P-QRS-T Gaussians at a heart rate with
+respiratory variation and jitter, on top of baseline wander, powerline interference and
+white noise (all in raw BMD101 units). The recorded ecg_log.csv files cannot serve as
+a reference: the packet reader lost samples and stamped them in bursts.
+
+The trace is fed to ECGProcessor.process in blocks of each size (1 = per sample, 64 =
+the ECG chunk size), and reported are:
+  - sensitivity and positive predictivity, with a detection within 50 ms of a beat
+  - |detected - true R time| p50/p95 in ms, and the mean |HR error| against the true RR
+  - CPU ms per second of ECG, and how many times faster than real time at 512 Hz
+
+Run from the repository root:
+    python -m benchmarks.bench_ecg_processing --seconds 300 --noise 50 --mains 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ecg.processing import ECGProcessor
+
+WAVES = (  # (offset s, amplitude, width s) of P, Q, R, S, T
+    (-0.2, 80, 0.025), (-0.03, -100, 0.008), (0.0, 1000, 0.01), (0.03, -200, 0.008), (0.25, 250, 0.04),
+)
+
+
+def synthetic_ecg(seconds: float, fs: int, hr: float, noise: float, wander: float, mains: float, seed: int = 0):
+    """:return: (timestamps, raw values, true beat times)"""
+    rng = np.random.default_rng(seed)
+    beats = []
+    t = 0.5
+    while t < seconds:
+        beats.append(t)
+        t += 60 / hr * (1 + 0.05 * np.sin(2 * np.pi * 0.25 * t)) + rng.normal(0, 0.02)
+    beats = np.array(beats)
+    times = np.arange(int(seconds * fs)) / fs
+    values = 2000 + wander * np.sin(2 * np.pi * 0.2 * times) + mains * np.sin(2 * np.pi * 50 * times)
+    values += rng.normal(0, noise, len(times))
+    for beat in beats:
+        for offset, amplitude, width in WAVES:
+            lo, hi = np.searchsorted(times, (beat + offset - 5 * width, beat + offset + 5 * width))
+            values[lo:hi] += amplitude * np.exp(-0.5 * ((times[lo:hi] - beat - offset) / width) ** 2)
+    return times, np.round(values).astype(np.int16), beats
+
+
+def score(rows: list, beats: np.ndarray, learning: float) -> dict:
+    detected = np.array([row[0] for row in rows])
+    beats = beats[beats > learning]
+    if not len(detected):
+        return {"sensitivity": 0.0, "ppv": 0.0, "p50": np.nan, "p95": np.nan, "hr_error": np.nan}
+    nearest = np.abs(detected[:, None] - beats[None, :])
+    matched = nearest.min(axis=1) <= 0.05
+    errors = nearest.min(axis=1)[matched] * 1e3
+    # True HR over the same number of RR intervals as the processor averages
+    true_rr = np.diff(beats)
+    hr_error = []
+    for row in rows:
+        if np.isnan(row[2]):
+            continue
+        index = np.searchsorted(beats, row[0] + 0.05) - 1
+        if index >= 8:
+            hr_error.append(abs(row[2] - 60 / true_rr[index - 8:index].mean()))
+    return {
+        "sensitivity": len(set(nearest.argmin(axis=1)[matched].tolist())) / len(beats),
+        "ppv": matched.mean(),
+        "p50": np.median(errors) if len(errors) else np.nan,
+        "p95": np.percentile(errors, 95) if len(errors) else np.nan,
+        "hr_error": np.mean(hr_error) if hr_error else np.nan,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=300.0)
+    parser.add_argument("--fs", type=int, default=512)
+    parser.add_argument("--hr", type=float, default=72.0)
+    parser.add_argument("--noise", type=float, default=50.0, help="white noise standard deviation")
+    parser.add_argument("--wander", type=float, default=500.0, help="0.2 Hz baseline wander amplitude")
+    parser.add_argument("--mains", type=float, default=200.0, help="50 Hz interference amplitude")
+    parser.add_argument("--block-sizes", nargs="+", type=int, default=[1, 16, 64, 256])
+    args = parser.parse_args()
+
+    times, values, beats = synthetic_ecg(args.seconds, args.fs, args.hr, args.noise, args.wander, args.mains)
+    print(f"{len(beats)} beats, {args.seconds:.0f} s at {args.fs} Hz")
+    print(f"{'block':>6}{'Se':>8}{'+P':>8}{'err p50 ms':>12}{'p95 ms':>8}{'|HR err|':>10}{'cpu ms/s':>10}{'x realtime':>12}")
+    for block in args.block_sizes:
+        processor = ECGProcessor({"fs": args.fs})
+        rows = []
+        start = time.process_time()
+        for i in range(0, len(values), block):
+            rows.extend(processor.process(times[i:i + block], values[i:i + block]))
+        cpu = time.process_time() - start
+        result = score(rows, beats, processor.learning)
+        print(f"{block:>6}{result['sensitivity']:>8.1%}{result['ppv']:>8.1%}{result['p50']:>12.2f}{result['p95']:>8.2f}"
+              f"{result['hr_error']:>10.2f}{cpu / args.seconds * 1e3:>10.2f}{args.seconds / cpu:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
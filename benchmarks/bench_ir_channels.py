@@ -0,0 +1,117 @@
+"""
+CPU and memory of the IR path per frame and per session: 3-channel (former) vs single-channel.
+
+A synthetic 640x480 IR frame (smooth face-like blob plus sensor noise) is encoded as the
+camera would deliver it, MJPG or packed YUYV, and taken through the IR path:
+  - rgb3: decode to BGR, BGR->RGB into the frame ring, crop/resize 3 channels, RGB->BGR
+          in the picture logger (the former path; FaceMesh ran on top of it)
+  - gray: decode to luma only (grayscale JPEG decode, or every other YUYV byte) copied
+          into the frame ring, crop/resize 1 channel, written as is
+The crops are written to a VideoWriter like the streaming PictureLogger.
+
+Reported: CPU ms per frame and per session, frame-ring memory, and the bytes moved
+through the ring per session. FaceMesh on the IR frames, which the single-channel mode
+drops entirely, is timed too when mediapipe is installed.
+
+Run from the repository root:
+    python -m benchmarks.bench_ir_channels --frames 300 --session 60
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from capture.camera import CameraStream
+from log.plog import PictureLogger
+from preprocess.base import BoxCropper
+
+WIDTH, HEIGHT = 640, 480
+BOX = np.array([0.3, 0.2, 0.7, 0.8], dtype=np.float32)
+
+
+def synthetic_ir(seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:HEIGHT, :WIDTH]
+    face = 160 * np.exp(-(((x - 320) / 110) ** 2 + ((y - 240) / 150) ** 2))
+    image = 40 + face + rng.normal(0, 6, (HEIGHT, WIDTH))
+    gray = np.clip(image, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def to_yuyv(bgr: np.ndarray) -> np.ndarray:
+    """Packed YUYV (H, W, 2) as V4L2 delivers it with the RGB conversion off."""
+    yuv = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV)
+    packed = np.empty((HEIGHT, WIDTH, 2), dtype=np.uint8)
+    packed[:, :, 0] = yuv[:, :, 0]
+    packed[:, 0::2, 1] = yuv[:, 0::2, 1]
+    packed[:, 1::2, 1] = yuv[:, 0::2, 2]
+    return packed
+
+
+def run(path: str, fourcc: str, frames: int, jpeg: np.ndarray, yuyv: np.ndarray, directory: str) -> dict:
+    stream = CameraStream("ir", None, {"fourcc": fourcc, "gray": path == "gray"})
+    cropper = BoxCropper()
+    slot = np.empty((HEIGHT, WIDTH) if path == "gray" else (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    logger = PictureLogger({"video_path": os.path.join(directory, f"{path}_{fourcc}.mp4"), "data_queue": None,
+                            "image_path": os.path.join(directory, "images"), "mode": "stream"})
+    start = time.process_time()
+    for index in range(frames):
+        if path == "gray":
+            frame = stream.luma(jpeg.reshape(1, -1) if fourcc == "MJPG" else yuyv)
+            np.copyto(slot, frame)
+        else:
+            frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR) if fourcc == "MJPG" else \
+                cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV)
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=slot)
+        cropped = cropper(slot, BOX, (36, 36))
+        logger.stream_image(index, cropped, index / 30)
+    cpu = time.process_time() - start
+    logger.close_stream()
+    return {"cpu_ms": cpu / frames * 1e3, "slot_bytes": slot.nbytes}
+
+
+def facemesh_ms(image: np.ndarray, frames: int) -> float:
+    try:
+        import mediapipe as mp
+    except ImportError:
+        return float("nan")
+    face_mesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1)
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    start = time.process_time()
+    for _ in range(frames):
+        face_mesh.process(rgb)
+    return (time.process_time() - start) / frames * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--session", type=float, default=60.0, help="session length in seconds, at 30 fps")
+    parser.add_argument("--slots", type=int, default=16, help="frame ring slots")
+    args = parser.parse_args()
+
+    image = synthetic_ir()
+    jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1]
+    yuyv = to_yuyv(image)
+    session_frames = args.session * 30
+    print(f"{'path':<6}{'format':<7}{'cpu ms/frame':>13}{'cpu s/session':>15}{'ring MB':>9}{'ring MB/session':>17}")
+    with tempfile.TemporaryDirectory() as directory:
+        for fourcc in ("MJPG", "YUYV"):
+            for path in ("rgb3", "gray"):
+                result = run(path, fourcc, args.frames, jpeg, yuyv, directory)
+                print(f"{path:<6}{fourcc:<7}{result['cpu_ms']:>13.2f}{result['cpu_ms'] * session_frames / 1e3:>15.1f}"
+                      f"{result['slot_bytes'] * args.slots / 2 ** 20:>9.1f}"
+                      f"{result['slot_bytes'] * session_frames / 2 ** 20:>17.0f}")
+    mesh = facemesh_ms(image, min(args.frames, 50))
+    if np.isnan(mesh):
+        print("FaceMesh on IR (removed in gray mode): not measured, mediapipe is not installed")
+    else:
+        print(f"FaceMesh on IR (removed in gray mode): {mesh:.2f} ms/frame, {mesh * session_frames / 1e3:.1f} s/session "
+              "(lower bound: no face on the synthetic frame)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+IR face ROI from the RGB stream: calibration accuracy, box error of the timestamp matching,
+and preprocess CPU against a FaceMesh run on the IR frames.
+
+  - calibration: FaceMesh-like landmark correspondences (468 points per pair, landmark
+    noise and a few outliers) under a known RGB->IR homography; ROIMapping.estimate fits
+    a homography and an affine transform, reported is the corner error of mapped face boxes
+  - matching: a face moving at up to `--speed` face widths per second, RGB and IR at 30 fps
+    with an 11 ms exposure offset, RGB boxes arriving `--latency` s late; the IR box error
+    (pixels at 640x480) of the latest RGB box and of SharedROI.match
+  - cpu: per IR frame, FaceMesh (static, and tracking with re-detection every 10 frames)
+    against match + map + crop (ROIPreprocess.crop). The synthetic frame has no face, so
+    the FaceMesh figures are lower bounds.
+
+Run from the repository root:
+    python -m benchmarks.bench_ir_roi --seconds 20
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from preprocess.roi import ROIMapping, ROIPreprocess, SharedROI
+
+WIDTH, HEIGHT = 640, 480
+TRUE_MAPPING = np.array([[0.92, 0.01, 0.05], [-0.015, 0.94, 0.03], [0.02, -0.01, 1.0]])
+
+
+def face_box(t: float, speed: float) -> np.ndarray:
+    """Normalized face box at time t: a 0.3 x 0.4 box swaying left-right and nodding."""
+    width, height = 0.3, 0.4
+    x = 0.35 + speed * width / (2 * np.pi * 0.5) * np.sin(2 * np.pi * 0.5 * t)
+    y = 0.3 + 0.3 * speed * height / (2 * np.pi * 0.3) * np.sin(2 * np.pi * 0.3 * t)
+    return np.array([x, y, x + width, y + height], dtype=np.float32)
+
+
+def box_error(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean corner distance in pixels."""
+    scale = np.array([WIDTH, HEIGHT, WIDTH, HEIGHT])
+    return float(np.abs((a - b) * scale).mean())
+
+
+def calibration(pairs: int, noise: float, rng) -> dict:
+    truth = ROIMapping(TRUE_MAPPING, "homography")
+    rgb_points, ir_points = [], []
+    for _ in range(pairs):
+        center = rng.uniform(0.3, 0.7, 2)
+        points = center + rng.normal(0, 0.08, (468, 2))
+        ir = truth.map_points(points) + rng.normal(0, noise, (468, 2))
+        outliers = rng.random(468) < 0.03
+        ir[outliers] = rng.uniform(0, 1, (outliers.sum(), 2))
+        rgb_points.append(points)
+        ir_points.append(ir)
+    boxes = [face_box(t, 1.0) for t in np.linspace(0, 10, 50)]
+    results = {}
+    for model in ("homography", "affine"):
+        mapping = ROIMapping.estimate(np.concatenate(rgb_points), np.concatenate(ir_points), model)
+        results[model] = np.mean([box_error(mapping.map_box(box), truth.map_box(box)) for box in boxes])
+    results["identity"] = np.mean([box_error(box, truth.map_box(box)) for box in boxes])
+    return results
+
+
+def matching(seconds: float, speed: float, latency: float) -> dict:
+    """IR box error with the latest RGB box and with the timestamp-matched one, RGB boxes arriving `latency` late."""
+    rgb_times = np.arange(0, seconds, 1 / 30)
+    ir_times = np.arange(0.011, seconds, 1 / 30)
+    errors = {}
+    for mode in ("latest", "matched"):
+        roi = SharedROI()
+        published = 0
+        errors[mode] = []
+        for t in ir_times:
+            # The IR frame is cropped as soon as it is read (10 ms after exposure), when the RGB
+            # boxes up to t + 0.01 - latency are known; match() waits for the RGB preprocess
+            # to get past t instead
+            horizon = t + 0.01 - latency if mode == "latest" else t + 1 / 30
+            while published < len(rgb_times) and rgb_times[published] <= horizon:
+                roi.update(face_box(rgb_times[published], speed), rgb_times[published])
+                published += 1
+            box = roi.latest()[0] if mode == "latest" else roi.match(t, 0.05)
+            if box is not None:
+                errors[mode].append(box_error(box, face_box(t, speed)))
+    return {mode: np.percentile(values, [50, 95]) for mode, values in errors.items()}
+
+
+def cpu(frames: int) -> dict:
+    image = np.full((HEIGHT, WIDTH), 90, dtype=np.uint8)
+    results = {}
+    roi = SharedROI()
+    preprocess = ROIPreprocess({"target_size": (36, 36), "mapping": ROIMapping(TRUE_MAPPING, "homography"),
+                                "fallback": False}, roi)
+    start = time.process_time()
+    for i in range(frames):
+        roi.update(face_box(i / 30, 1.0), i / 30)
+        preprocess.crop(image, i / 30 - 0.005)
+    results["roi"] = (time.process_time() - start) / frames * 1e3
+    try:
+        from preprocess.mp import MediaPipePreprocess
+    except ImportError:
+        return results
+    for name, params in (("facemesh", {}), ("facemesh tracking", {"tracking": True, "redetect_interval": 10})):
+        detector = MediaPipePreprocess(dict(params, target_size=(36, 36), mesh_display=False))
+        start = time.process_time()
+        for _ in range(frames):
+            # As ROIPreprocess.detect: the luma frame goes to FaceMesh as RGB
+            detector.crop_resize(cv2.cvtColor(image, cv2.COLOR_GRAY2RGB), (36, 36))
+        results[name] = (time.process_time() - start) / frames * 1e3
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--pairs", type=int, default=30)
+    parser.add_argument("--noise", type=float, default=0.004, help="landmark noise, normalized")
+    parser.add_argument("--speed", type=float, default=1.0, help="peak face speed, face widths per second")
+    parser.add_argument("--latency", type=float, default=0.06, help="RGB preprocess latency, seconds")
+    parser.add_argument("--frames", type=int, default=100)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    errors = calibration(args.pairs, args.noise, rng)
+    print("calibration: mean box corner error (px) " + ", ".join(f"{k} {v:.2f}" for k, v in errors.items()))
+    result = matching(args.seconds, args.speed, args.latency)
+    print(f"matching: IR box error p50/p95 (px) latest RGB box {result['latest'][0]:.1f}/{result['latest'][1]:.1f}, "
+          f"timestamp-matched {result['matched'][0]:.1f}/{result['matched'][1]:.1f}")
+    print("cpu per IR frame (ms): " + ", ".join(f"{k} {v:.2f}" for k, v in cpu(args.frames).items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Merging the session logs on synthetic sessions of growing length (512 Hz ECG and 30 fps
+rPPG logs as DataLogger writes them), with rows/sec and peak RSS of the merge and the time
+from stop to upload-ready (merge and normalize left at stop):
+  - heap: FileMerger loading every row and heap-sorting them, then Normalizer
+  - stream: FileMerger with lazy per-file readers and heapq.merge, then Normalizer
+  - online: OnlineMerger fed the rows as the loggers flush them (one second at a time) during
+    the "capture"; at stop the pending rows and the rescale pass of OnlineNormalizer
+  - online-factors: as online, keeping only the normalization factors at stop
+
+Every mode runs in a fresh process, so its RSS growth is its own. The merged logs of all
+modes are compared by hash.
+
+Run from the repository root:
+    python -m benchmarks.bench_merge --minutes 1 10 60
+    python -m benchmarks.bench_merge --minutes 60 --modes stream online --output benchmarks/results/merge.json
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.harness import Report, RSSSampler, summarize
+
+ECG_RATE = 512
+FPS = 30
+
+
+def write_session(directory: str, minutes: float) -> tuple:
+    """:return: paths of the rPPG and ECG logs covering `minutes`"""
+    rng = np.random.default_rng(0)
+    start = 1.75e9
+    seconds = minutes * 60
+    rppg_path, ecg_path = os.path.join(directory, "rppg_log.csv"), os.path.join(directory, "ecg_log.csv")
+    count = int(seconds * FPS)
+    # Frame intervals jitter like a real camera; ECG samples come at the sensor rate
+    times = start + np.cumsum(rng.uniform(0.8, 1.2, count)) / FPS
+    np.savetxt(rppg_path, np.column_stack([times, np.round(rng.normal(0, 0.3, count), 4)]), delimiter=",",
+               fmt=["%.7f", "%.4f"])
+    count = int(seconds * ECG_RATE)
+    np.savetxt(ecg_path, np.column_stack([start + np.arange(count) / ECG_RATE, rng.integers(-2000, 2000, count)]),
+               delimiter=",", fmt=["%.7f", "%d"])
+    return rppg_path, ecg_path
+
+
+def flushes(inputs: list):
+    """:return: generator of (input index, rows) as the DataLoggers flush them, one second of each input at a time"""
+    readers = [csv.reader(open(path, newline="")) for path in inputs]
+    rows = [next(reader, None) for reader in readers]
+    end = min(float(row[0]) for row in rows if row is not None)
+    while any(row is not None for row in rows):
+        end += 1.0
+        for idx, reader in enumerate(readers):
+            batch = []
+            while rows[idx] is not None and float(rows[idx][0]) < end:
+                batch.append(rows[idx])
+                rows[idx] = next(reader, None)
+            if batch:
+                yield idx, batch
+
+
+def run_merge(mode: str, inputs: list, output_path: str) -> tuple:
+    """Runs in a child process. :return: (stage record, MD5 of the merged log)"""
+    from log.merge import FileMerger, OnlineMerger
+    from log.normalize import Normalizer, OnlineNormalizer
+    normalized_path = os.path.splitext(output_path)[0] + "_normalized.csv"
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), RSSSampler() as sampler:
+        cpu_start, start = time.process_time(), time.perf_counter()
+        if mode.startswith("online"):
+            normalizer = OnlineNormalizer(output_path, normalized_path, normalized_path + ".json",
+                                          rescale=mode == "online")
+            merger = OnlineMerger(inputs, output_path, normalizer)
+            for idx, rows in flushes(inputs):
+                merger.add(idx, rows)
+        else:
+            merger = FileMerger(inputs, output_path, mode=mode)
+            merger()
+            normalizer = Normalizer(output_path, normalized_path)
+        seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - cpu_start
+        stopping = time.perf_counter()
+        if mode.startswith("online"):
+            merger()
+        normalizer()
+        stop_seconds = time.perf_counter() - stopping + (0 if mode.startswith("online") else seconds)
+    digest = hashlib.md5()
+    with open(output_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    record = summarize([], merger.rows_written, seconds, cpu_seconds, sampler, "row")
+    record["stop_seconds"] = stop_seconds
+    return record, digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 60], help="session lengths")
+    parser.add_argument("--modes", nargs="+", choices=("heap", "stream", "online", "online-factors"),
+                        default=["heap", "stream", "online", "online-factors"])
+    parser.add_argument("--output", help="also write the results as a JSON report")
+    args = parser.parse_args()
+
+    report = Report(vars(args))
+    context = multiprocessing.get_context("spawn")
+    print(f"{'minutes':>8}{'mode':>16}{'rows':>10}{'merge s':>9}{'rows/s':>10}{'rss peak MB':>13}{'rss growth MB':>15}"
+          f"{'stop s':>8}")
+    for minutes in args.minutes:
+        with tempfile.TemporaryDirectory() as directory:
+            inputs = list(write_session(directory, minutes))
+            digests = set()
+            for mode in args.modes:
+                with context.Pool(1) as pool:
+                    record, digest = pool.apply(run_merge, (mode, inputs, os.path.join(directory, f"merged_{mode}.csv")))
+                digests.add(digest)
+                report.add(f"merge_{mode}_{minutes:g}min", record)
+                print(f"{minutes:>8g}{mode:>16}{record['items']:>10}{record['seconds']:>9.2f}{record['throughput']:>10.0f}"
+                      f"{record['rss_peak_mb']:>13.1f}{record['rss_growth_mb']:>15.1f}{record['stop_seconds']:>8.2f}")
+            if len(digests) > 1:
+                print(f"Warning: the modes wrote different logs for {minutes:g} min")
+    if args.output:
+        report.write(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Wall time, CPU and peak RSS of normalizing large merged logs ([timestamp, rPPG, ECG] rows
+at the 512 Hz ECG rate, as FileMerger writes them): the previous pandas implementation
+(read_csv, (rest - mean) / std, concat, to_csv) against the chunked numpy Normalizer in its
+"zscore", "robust" and "window" modes. Also the import time of log.normalize and of pandas.
+
+Every run is a fresh process, so its RSS growth is its own.
+
+Run from the repository root:
+    python -m benchmarks.bench_normalize --minutes 10 60
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.harness import RSSSampler, summarize
+
+ECG_RATE = 512
+FPS = 30
+MODES = ("pandas", "zscore", "robust", "window")
+
+
+def write_merged(path: str, minutes: float) -> int:
+    """:return: rows written"""
+    rng = np.random.default_rng(0)
+    count = int(minutes * 60 * ECG_RATE)
+    timestamps = 1.75e9 + np.arange(count) / ECG_RATE
+    # The rPPG value holds between its 30 fps samples, as in the merge
+    rppg = np.repeat(rng.normal(0, 0.3, count // (ECG_RATE // FPS) + 1), ECG_RATE // FPS)[:count]
+    ecg = rng.integers(-2000, 2000, count).astype(np.float64)
+    np.savetxt(path, np.column_stack([timestamps, rppg, ecg]), delimiter=",", fmt=["%.7f", "%.4f", "%.1f"])
+    return count
+
+
+def pandas_normalize(rawpath: str, outpath: str) -> None:
+    import pandas as pd
+    data = pd.read_csv(rawpath, header=None)
+    rest = data.iloc[:, 1:]
+    pd.concat([data.iloc[:, 0], (rest - rest.mean()) / rest.std()], axis=1).to_csv(outpath, index=False)
+
+
+def run(mode: str, rawpath: str, outpath: str, rows: int) -> dict:
+    """Runs in a child process. :return: stage record (one item per row)"""
+    from log.normalize import Normalizer
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), RSSSampler() as sampler:
+        cpu_start, start = time.process_time(), time.perf_counter()
+        if mode == "pandas":
+            pandas_normalize(rawpath, outpath)
+        else:
+            Normalizer(rawpath, outpath, mode=mode)()
+        seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - cpu_start
+    return summarize([], rows, seconds, cpu_seconds, sampler, "row")
+
+
+def import_seconds(module: str) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    return float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 60], help="session lengths")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    for module in ("log.normalize", "pandas"):
+        print(f"import {module}: {import_seconds(module) * 1e3:.0f} ms")
+    context = multiprocessing.get_context("spawn")
+    print(f"{'minutes':>8}{'mode':>8}{'rows':>10}{'seconds':>9}{'cpu s':>8}{'rss peak MB':>13}{'rss growth MB':>15}")
+    for minutes in args.minutes:
+        with tempfile.TemporaryDirectory() as directory:
+            rawpath = os.path.join(directory, "merged_log.csv")
+            rows = write_merged(rawpath, minutes)
+            for mode in args.modes:
+                with context.Pool(1) as pool:
+                    record = pool.apply(run, (mode, rawpath, os.path.join(directory, f"normalized_{mode}.csv"), rows))
+                print(f"{minutes:>8g}{mode:>8}{rows:>10}{record['seconds']:>9.2f}{record['cpu_seconds']:>8.2f}"
+                      f"{record['rss_peak_mb']:>13.1f}{record['rss_growth_mb']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
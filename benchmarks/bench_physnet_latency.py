@@ -0,0 +1,114 @@
+"""
+Frame-to-BVP latency of PhysNet with non-overlapping and sliding windows.
+
+Face crops from a recorded session are resized to 32x32 and fed to PhysNet one frame at
+a time at the capture rate, stamped with the time they are queued. For every BVP sample
+that comes out of the result queue, the latency is the time of arrival minus the time
+its frame was queued. The first window has to fill before anything comes out, so the time
+to the first sample is reported separately and the percentiles cover the frames after it.
+
+Run from the repository root:
+    python -m benchmarks.bench_physnet_latency --seconds 20 --configs 128:0 16 16:0 32:0
+(each config is stride[:emit_delay]; without a delay every sample is fully stitched)
+"""
+import argparse
+import glob
+import os
+import threading
+import time
+from queue import Queue, Empty
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+import global_vars
+from model.physnet import PhysNet
+
+
+def load_crops(data_dir: str, size: int, count: int) -> list:
+    crops = []
+    for video_path in sorted(glob.glob(os.path.join(data_dir, "patient_*", "video.mp4"))):
+        cap = cv2.VideoCapture(video_path)
+        while len(crops) < count:
+            success, frame = cap.read()
+            if not success:
+                break
+            crops.append(cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), (size, size)).astype(np.float32))
+        cap.release()
+        if len(crops) >= count:
+            break
+    if not crops:
+        crops = [np.random.default_rng(0).uniform(0, 255, (size, size, 3)).astype(np.float32)]
+    return [crops[i % len(crops)] for i in range(count)]
+
+
+def run(stride: int, emit_delay, crops: list, fps: float, session_config: dict) -> dict:
+    model = PhysNet("./model/models/onnx/physnet.onnx", session_config, window=128, stride=stride, emit_delay=emit_delay)
+    preprocess_queue = Queue()
+    result_queue = Queue()
+    latencies = []
+
+    def collect():
+        while global_vars.pipeline_running or not result_queue.empty():
+            try:
+                values, timestamps = result_queue.get(timeout=0.1)
+            except Empty:
+                continue
+            now = time.time()
+            latencies.extend(now - t for t in timestamps)
+
+    global_vars.pipeline_running = True
+    model_thread = threading.Thread(target=model, args=(preprocess_queue, result_queue), daemon=True)
+    collector = threading.Thread(target=collect, daemon=True)
+    model_thread.start()
+    collector.start()
+    start = time.time()
+    for i, crop in enumerate(crops):
+        delay = start + i / fps - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        preprocess_queue.put(([crop], [time.time()]))
+    # Give the last window time to finish
+    time.sleep(1.0)
+    global_vars.pipeline_running = False
+    model_thread.join()
+    collector.join()
+    latencies = np.array(latencies) * 1e3
+    steady = latencies[model.window:]
+    return {
+        "samples": len(latencies),
+        "windows": model.windows_run,
+        "skipped": model.windows_skipped,
+        "first": latencies[0] if len(latencies) else float("nan"),
+        "p50": np.percentile(steady, 50) if len(steady) else float("nan"),
+        "p95": np.percentile(steady, 95) if len(steady) else float("nan"),
+        "max": steady.max() if len(steady) else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="./data")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--configs", nargs="+", default=["128:0", "16", "16:0", "32:0"])
+    parser.add_argument("--intra-op-threads", type=int, default=0)
+    args = parser.parse_args()
+    ort.set_default_logger_severity(3)
+
+    crops = load_crops(args.data, 32, int(args.seconds * args.fps))
+    session_config = {"intra_op_num_threads": args.intra_op_threads}
+    print(f"{'stride':>7}{'delay':>7}{'samples':>9}{'windows':>9}{'skipped':>9}{'first ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for config in args.configs:
+        stride, _, delay = config.partition(":")
+        stride = int(stride)
+        emit_delay = int(delay) if delay else None
+        result = run(stride, emit_delay, crops, args.fps, session_config)
+        shown_delay = emit_delay if emit_delay is not None else 128 - stride
+        print(f"{stride:>7}{shown_delay:>7}{result['samples']:>9}{result['windows']:>9}{result['skipped']:>9}"
+              f"{result['first']:>10.0f}{result['p50']:>10.0f}{result['p95']:>10.0f}{result['max']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Per-stage benchmark of the pipeline: items/sec, p50/p95/p99 latency per item, CPU and
+peak RSS of every stage, run one after the other on the same input, written as JSON so
+that runs of two commits can be compared with `python -m benchmarks.compare`.
+
+Input: the face crops of a recorded session (`--session`) pasted onto a drifting 640x480
+frame as in bench_tracking, or a synthetic frame without a face (`--synthetic`; FaceMesh
+figures are then lower bounds). The frames are encoded into a temporary MJPG file, so
+the capture stage decodes them like the camera's MJPG stream.
+
+Stages (item in brackets):
+  - capture [frame]: grab + timestamp + retrieve (MJPG decode) + BGR->RGB publish, as a
+    CameraCapture grab thread does
+  - preprocess [frame]: MediaPipePreprocess.crop_resize with the main.py tracking settings
+  - step [frame]: Step.infer with IOBinding and the timestamp-derived dt
+  - physnet [window]: one 128-frame PhysNet window (run every 16 frames in main.py)
+  - hr_offline [update]: bandpass_filter + get_hr over 15 s, every 10 samples (utils.hr)
+  - hr_streaming [sample]: StreamingHR.update, as in Pipeline.results
+  - data_logger [row]: DataLogger put + data_log, 512 Hz ECG rows
+  - picture_logger_stream / picture_logger_png [frame]: PictureLogger streaming writer / PNG per frame
+  - file_merger, normalizer [run]: FileMerger and Normalizer over the rPPG and ECG logs
+
+End-to-end numbers of the whole pipeline come from the replay: `python replay.py <session> --json <path>`.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline --session data/patient_000020 --frames 300
+    python -m benchmarks.compare benchmarks/results/<base>.json benchmarks/results/<new>.json
+"""
+import argparse
+import contextlib
+import os
+import queue
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.bench_tracking import load_session_frames
+from benchmarks.harness import Report, measure
+from capture.camera import CameraCapture
+from log.dlog import DataLogger
+from log.merge import FileMerger
+from log.normalize import Normalizer
+from log.plog import PictureLogger
+from preprocess.base import BoxCropper
+from utils.hr import bandpass_filter, get_hr
+from utils.streaming_hr import StreamingHR
+from utils.timebase import TimeBase
+
+STAGES = ("capture", "preprocess", "step", "physnet", "hr_offline", "hr_streaming", "data_logger",
+          "picture_logger_stream", "picture_logger_png", "file_merger", "normalizer")
+CANVAS = (640, 480)
+FPS = 30
+ECG_RATE = 512
+CENTER = np.array([0.3, 0.2, 0.7, 0.8], dtype=np.float32)
+
+
+def synthetic_frames(count: int) -> list:
+    """RGB frames with a smooth drifting blob and sensor noise; FaceMesh finds no face in them."""
+    rng = np.random.default_rng(0)
+    width, height = CANVAS
+    y, x = np.mgrid[:height, :width]
+    frames = []
+    for i in range(count):
+        cx, cy = width / 2 + 40 * np.sin(i / 45), height / 2 + 20 * np.sin(i / 70)
+        blob = 120 * np.exp(-(((x - cx) / 100) ** 2 + ((y - cy) / 130) ** 2))
+        gray = np.clip(60 + blob + rng.normal(0, 4, (height, width)), 0, 255).astype(np.uint8)
+        frames.append(cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB))
+    return frames
+
+
+def write_mjpg(frames: list, path: str) -> None:
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, CANVAS)
+    for frame in frames:
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    writer.release()
+
+
+def bench_capture(video_path: str, frames: int) -> dict:
+    cap = cv2.VideoCapture(video_path)
+    capture = CameraCapture(cap, cap, TimeBase(), {"sync_grabs": False})
+    target = queue.Queue()
+    buffer = {"frame": None}
+
+    def step(_):
+        cap.grab()
+        timestamp = capture.timestamp("rgb", cap, time.monotonic())
+        success, buffer["frame"] = cap.retrieve(buffer["frame"])
+        capture.publish(target, buffer["frame"], timestamp, cv2.COLOR_BGR2RGB)
+        target.get_nowait()
+
+    record = measure(step, range(frames), unit="frame")
+    cap.release()
+    return record
+
+
+def bench_preprocess(frames: list) -> tuple:
+    """:return: (stage record, 36x36 float32 crops; the centre of the frame where no face was found)"""
+    from preprocess.mp import MediaPipePreprocess
+    preprocess = MediaPipePreprocess({"target_size": (36, 36), "mesh_display": False,
+                                      "tracking": True, "redetect_interval": 10})
+    cropper = BoxCropper()
+    crops = []
+    found = []
+
+    def step(frame):
+        crop, _ = preprocess.crop_resize(frame, (36, 36))
+        found.append(crop is not None)
+        crops.append(crop if crop is not None else cropper(frame, CENTER, (36, 36)))
+
+    record = measure(step, frames, unit="frame")
+    record["faces_found"] = int(sum(found))
+    return record, crops
+
+
+def bench_step(crops: list, directory: str) -> tuple:
+    """:return: (stage record, BVP samples)"""
+    from model.step import Step
+    state_path = os.path.join(directory, "state.pkl")
+    shutil.copyfile("./model/models/onnx/state.pkl", state_path)
+    model = Step("./model/models/onnx/step.onnx", state_path, dt=1 / FPS, io_binding=True, dynamic_dt=True)
+    bvp = []
+    record = measure(lambda item: bvp.append(model.infer(item[1], item[0] / FPS)), enumerate(crops),
+                     warmup=10, unit="frame")
+    return record, np.array(bvp[10:], dtype=np.float64)
+
+
+def bench_physnet(crops: list, windows: int) -> dict:
+    from model.physnet import PhysNet
+    model = PhysNet("./model/models/onnx/physnet.onnx", window=128, stride=16)
+    frames = [cv2.resize(crop, (32, 32)) for crop in crops]
+    batch = np.stack([frames[i % len(frames)] for i in range(128)])[None].astype(np.float64) / 255.0
+    return measure(lambda _: model.model.run(None, {PhysNet.INPUT_NAME: batch}), range(windows), warmup=2,
+                   unit="window")
+
+
+def bvp_signal(bvp: np.ndarray, seconds: float) -> np.ndarray:
+    """`seconds` of BVP at 30 fps: the model output repeated, or a noisy 72 BPM sine without one."""
+    count = int(seconds * FPS)
+    if len(bvp) < FPS:
+        t = np.arange(count) / FPS
+        return np.sin(2 * np.pi * 1.2 * t) + np.random.default_rng(1).normal(0, 0.3, count)
+    return np.resize(bvp, count)
+
+
+def bench_hr(signal: np.ndarray) -> tuple:
+    window = 450
+    offline = measure(lambda end: get_hr(bandpass_filter(signal[end - window:end], fs=FPS), FPS),
+                      range(window, len(signal) + 1, 10), unit="update")
+    estimator = StreamingHR({"fs": FPS, "window": 6, "update_interval": 1.0})
+    streaming = measure(lambda i: estimator.update(signal[i], i / FPS), range(len(signal)), unit="sample")
+    return offline, streaming
+
+
+def bench_data_logger(rows: list, directory: str) -> dict:
+    data_queue = queue.Queue()
+    logger = DataLogger({"log_path": os.path.join(directory, "ecg_bench.csv"), "data_queue": data_queue})
+
+    def step(row):
+        data_queue.put(row)
+        logger.data_log()
+
+    record = measure(step, rows, unit="row")
+    logger.close()
+    return record
+
+
+def bench_picture_logger(crops: list, mode: str, directory: str) -> dict:
+    logger = PictureLogger({"video_path": os.path.join(directory, f"{mode}.mp4"), "data_queue": None,
+                            "image_path": os.path.join(directory, f"{mode}_images"), "mode": mode, "fps": FPS})
+    write = logger.stream_image if mode == "stream" else logger.save_image
+    record = measure(lambda item: write(item[0], item[1], item[0] / FPS), enumerate(crops), unit="frame")
+    if mode == "stream":
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            logger.close_stream()
+    return record
+
+
+def write_logs(signal: np.ndarray, directory: str) -> tuple:
+    """rPPG and ECG logs covering the same time span, as the loggers write them."""
+    start = 1.75e9
+    rppg_path, ecg_path = os.path.join(directory, "rppg_log.csv"), os.path.join(directory, "ecg_log.csv")
+    np.savetxt(rppg_path, np.column_stack([start + np.arange(len(signal)) / FPS, np.round(signal, 4)]),
+               delimiter=",", fmt=["%.7f", "%.4f"])
+    count = int(len(signal) / FPS * ECG_RATE)
+    ecg = np.random.default_rng(2).integers(-2000, 2000, count)
+    np.savetxt(ecg_path, np.column_stack([start + np.arange(count) / ECG_RATE, ecg]), delimiter=",",
+               fmt=["%.7f", "%d"])
+    return rppg_path, ecg_path, len(signal) + count
+
+
+def bench_merge(rppg_path: str, ecg_path: str, rows: int, repeat: int, directory: str) -> tuple:
+    merged_path, normalized_path = os.path.join(directory, "merged_log.csv"), os.path.join(directory, "normalized_log.csv")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        merger = measure(lambda _: FileMerger([rppg_path, ecg_path], merged_path)(), range(repeat), unit="run")
+        normalizer = measure(lambda _: Normalizer(merged_path, normalized_path)(), range(repeat), unit="run")
+    merger["rows"] = normalizer["rows"] = rows
+    return merger, normalizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--session", default="data/patient_000020", help="recorded session for the face crops")
+    source.add_argument("--synthetic", action="store_true", help="synthetic frames without a face")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--physnet-windows", type=int, default=20)
+    parser.add_argument("--hr-seconds", type=float, default=120.0, help="BVP signal length for the HR stages")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of the merge and normalize stages")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--output", help="JSON results (default: benchmarks/results/pipeline-<commit>.json)")
+    args = parser.parse_args()
+
+    report = Report(vars(args))
+    output = args.output or os.path.join("benchmarks", "results", f"pipeline-{report.meta['commit'] or 'local'}.json")
+    if args.synthetic:
+        frames = synthetic_frames(args.frames)
+    else:
+        frames = load_session_frames(args.session, CANVAS, 200, args.frames)
+    stages = set(args.stages)
+    with tempfile.TemporaryDirectory() as directory:
+        if "capture" in stages:
+            video_path = os.path.join(directory, "capture.avi")
+            write_mjpg(frames, video_path)
+            report.add("capture", bench_capture(video_path, len(frames)))
+        if stages & {"preprocess", "step", "physnet", "hr_offline", "hr_streaming", "picture_logger_stream",
+                     "picture_logger_png", "file_merger", "normalizer"}:
+            record, crops = bench_preprocess(frames)
+            if "preprocess" in stages:
+                report.add("preprocess", record)
+        bvp = np.empty(0)
+        if stages & {"step", "hr_offline", "hr_streaming", "file_merger", "normalizer"}:
+            record, bvp = bench_step(crops, directory)
+            if "step" in stages:
+                report.add("step", record)
+        if "physnet" in stages:
+            report.add("physnet", bench_physnet(crops, args.physnet_windows))
+        signal = bvp_signal(bvp, args.hr_seconds)
+        if stages & {"hr_offline", "hr_streaming"}:
+            offline, streaming = bench_hr(signal)
+            for name, record in (("hr_offline", offline), ("hr_streaming", streaming)):
+                if name in stages:
+                    report.add(name, record)
+        if "data_logger" in stages:
+            count = int(args.hr_seconds * ECG_RATE)
+            rows = [[1.75e9 + i / ECG_RATE, int(value)]
+                    for i, value in enumerate(np.random.default_rng(3).integers(-2000, 2000, count))]
+            report.add("data_logger", bench_data_logger(rows, directory))
+        for mode in ("stream", "png"):
+            if f"picture_logger_{mode}" in stages:
+                report.add(f"picture_logger_{mode}", bench_picture_logger(crops, mode, directory))
+        if stages & {"file_merger", "normalizer"}:
+            rppg_path, ecg_path, rows = write_logs(signal, directory)
+            merger, normalizer = bench_merge(rppg_path, ecg_path, rows, args.repeat, directory)
+            for name, record in (("file_merger", merger), ("normalizer", normalizer)):
+                if name in stages:
+                    report.add(name, record)
+    report.print()
+    report.write(output)
+
+
+if __name__ == "__main__":
+    main()
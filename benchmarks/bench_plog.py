@@ -0,0 +1,122 @@
+"""
+Compare the PNG + ffmpeg and the streaming modes of PictureLogger.
+
+For each mode the logger is fed the same frames through its queue. Once every
+frame has been consumed, the bytes written so far are recorded and
+``global_vars.pipeline_running`` is cleared; the time until the logger thread
+returns is the stop-to-upload-ready latency.
+
+Run from the repository root:
+    python -m benchmarks.bench_plog --frames 1800
+    python -m benchmarks.bench_plog --session data/patient_000001
+"""
+import argparse
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import global_vars
+from log.plog import PictureLogger
+
+
+def load_frames(session_dir: str, count: int, size: int) -> list:
+    frames = []
+    if session_dir:
+        cap = cv2.VideoCapture(os.path.join(session_dir, "video.mp4"))
+        while True:
+            success, frame = cap.read()
+            if not success:
+                break
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).astype(np.float32))
+        cap.release()
+    if not frames:
+        rng = np.random.default_rng(0)
+        base = rng.uniform(60, 200, (size, size, 3)).astype(np.float32)
+        frames = [np.clip(base + rng.normal(0, 4, base.shape), 0, 255).astype(np.float32) for _ in range(64)]
+    return [frames[i % len(frames)] for i in range(count)]
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def run_mode(mode: str, frames: list, fps: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"plog_{mode}_")
+    data_queue = queue.Queue()
+    logger = PictureLogger({
+        "video_path": os.path.join(workdir, "video.mp4"),
+        "data_queue": data_queue,
+        "image_path": os.path.join(workdir, "images"),
+        "mode": mode,
+        "fps": fps,
+    })
+    global_vars.pipeline_running = True
+    thread = threading.Thread(target=logger, daemon=True)
+    thread.start()
+
+    start = time.perf_counter()
+    t0 = time.time()
+    for i, frame in enumerate(frames):
+        data_queue.put(([frame], [t0 + i / fps]))
+    while logger.frame_count < len(frames) and thread.is_alive():
+        time.sleep(0.01)
+    capture_time = time.perf_counter() - start
+    capture_bytes = directory_size(workdir)
+
+    stop = time.perf_counter()
+    global_vars.pipeline_running = False
+    thread.join()
+    stop_latency = time.perf_counter() - stop
+
+    video_path = os.path.join(workdir, "video.mp4")
+    result = {
+        "mode": mode,
+        "frames": len(frames),
+        "capture_s": capture_time,
+        "stop_to_ready_s": stop_latency,
+        "bytes_during_capture": capture_bytes,
+        "video_bytes": os.path.getsize(video_path) if os.path.exists(video_path) else 0,
+    }
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=1800, help="number of frames (1800 = 1 min at 30 fps)")
+    parser.add_argument("--size", type=int, default=36, help="synthetic frame size")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--session", default="", help="recorded session directory to take frames from")
+    parser.add_argument("--modes", nargs="+", default=["png", "stream"])
+    args = parser.parse_args()
+
+    frames = load_frames(args.session, args.frames, args.size)
+    results = []
+    for mode in args.modes:
+        try:
+            results.append(run_mode(mode, frames, args.fps))
+        except Exception as e:
+            print(f"[bench_plog] Mode {mode} failed: {e}")
+
+    print()
+    print(f"{'mode':<8}{'frames':>8}{'capture s':>12}{'stop->ready s':>16}{'capture bytes':>16}{'video bytes':>14}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['frames']:>8}{r['capture_s']:>12.3f}{r['stop_to_ready_s']:>16.3f}"
+              f"{r['bytes_during_capture']:>16}{r['video_bytes']:>14}")
+
+
+if __name__ == "__main__":
+    main()
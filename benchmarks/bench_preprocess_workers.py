@@ -0,0 +1,84 @@
+"""
+Throughput of the preprocess stage as a thread and with 1..N worker processes.
+
+Frames from a recorded session (pasted onto a camera-sized canvas, see
+bench_tracking) are written into a shared FrameRing as fast as the stage
+consumes them, and the number of crops coming out per second is measured.
+
+Run from the repository root:
+    python -m benchmarks.bench_preprocess_workers --workers 0 1 2 3 4
+"""
+import argparse
+import queue
+import threading
+import time
+
+import global_vars
+from benchmarks.bench_tracking import load_session_frames
+from capture.ring import FrameRing
+from preprocess.mp import MediaPipePreprocess
+from preprocess.workers import ProcessPreprocess
+
+
+def run(workers: int, frames: list, duration: float, tracking: bool) -> dict:
+    params = {"target_size": (36, 36), "mesh_display": False, "tracking": tracking}
+    stage = ProcessPreprocess(dict(params, workers=workers)) if workers > 0 else MediaPipePreprocess(params)
+    ring = FrameRing(16, "drop_newest", shared=True)
+    out_queue = queue.Queue()
+
+    global_vars.pipeline_running = True
+    thread = threading.Thread(target=stage, args=(ring, None, out_queue, 1), daemon=True)
+    thread.start()
+
+    def feed():
+        i = 0
+        while global_vars.pipeline_running:
+            frame = frames[i % len(frames)]
+            acquired = ring.acquire(frame.shape)
+            if acquired is None:
+                time.sleep(0.0005)
+                continue
+            slot, view = acquired
+            view[:] = frame
+            ring.commit(slot, float(i))
+            i += 1
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    time.sleep(1.0)  # warm-up
+    while not out_queue.empty():
+        out_queue.get_nowait()
+    start = time.perf_counter()
+    time.sleep(duration)
+    produced = []
+    while not out_queue.empty():
+        produced.extend(out_queue.get_nowait()[1])
+    elapsed = time.perf_counter() - start
+    global_vars.pipeline_running = False
+    thread.join(timeout=3)
+    feeder.join(timeout=1)
+    if workers > 0:
+        stage.close()
+    ring.close()
+    ordered = all(a < b for a, b in zip(produced, produced[1:]))
+    return {"workers": workers, "fps": len(produced) / elapsed, "ordered": ordered}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--session", default="data/patient_000001")
+    parser.add_argument("--workers", nargs="+", type=int, default=[0, 1, 2, 3, 4])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--tracking", action="store_true")
+    args = parser.parse_args()
+
+    frames = load_session_frames(args.session, (640, 480), 240, 120)
+    results = [run(workers, frames, args.duration, args.tracking) for workers in args.workers]
+    baseline = results[0]["fps"]
+    print(f"{'workers':>8}{'fps':>10}{'speedup':>10}{'in order':>10}")
+    for r in results:
+        print(f"{r['workers']:>8}{r['fps']:>10.1f}{r['fps'] / baseline:>10.2f}{str(r['ordered']):>10}")
+
+
+if __name__ == "__main__":
+    main()
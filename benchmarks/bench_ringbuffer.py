@@ -0,0 +1,68 @@
+"""
+Per-tick cost of the ECG quality range with the old list buffer and with RingBuffer.
+
+Each tick appends a few ECG samples (the samples that arrive between two rPPG results)
+and then takes the range of the last `window` samples:
+  - list:       list.append + pop(0), then np.array(buffer) and max - min
+  - ringbuffer: RingBuffer(track_extrema=True).extend, then max() - min() from the monotonic deques
+
+Run from the repository root:
+    python -m benchmarks.bench_ringbuffer --window 512 --ticks 20000 --samples-per-tick 17
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.ringbuffer import RingBuffer
+
+
+def run_list(samples: np.ndarray, window: int, per_tick: int) -> tuple:
+    buffer = []
+    ranges = []
+    start = time.perf_counter()
+    for i in range(0, len(samples), per_tick):
+        for value in samples[i:i + per_tick]:
+            buffer.append(value)
+            if len(buffer) > window:
+                buffer.pop(0)
+        if len(buffer) >= window:
+            array = np.array(buffer)
+            ranges.append(np.max(array) - np.min(array))
+    return time.perf_counter() - start, ranges
+
+
+def run_ring(samples: np.ndarray, window: int, per_tick: int) -> tuple:
+    buffer = RingBuffer(window, track_extrema=True)
+    ranges = []
+    start = time.perf_counter()
+    for i in range(0, len(samples), per_tick):
+        buffer.extend(samples[i:i + per_tick])
+        if buffer.full:
+            ranges.append(buffer.max() - buffer.min())
+    return time.perf_counter() - start, ranges
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--window", type=int, default=512)
+    parser.add_argument("--ticks", type=int, default=20000)
+    parser.add_argument("--samples-per-tick", type=int, default=17, help="512 Hz ECG / 30 fps rPPG")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    samples = (2000 + 800 * np.sin(np.arange(args.ticks * args.samples_per_tick) / 40)
+               + rng.normal(0, 50, args.ticks * args.samples_per_tick)).tolist()
+
+    list_time, list_ranges = run_list(samples, args.window, args.samples_per_tick)
+    ring_time, ring_ranges = run_ring(samples, args.window, args.samples_per_tick)
+    assert np.allclose(list_ranges, ring_ranges)
+
+    print(f"{'buffer':<12}{'us/tick':>10}")
+    print(f"{'list':<12}{list_time / args.ticks * 1e6:>10.1f}")
+    print(f"{'ringbuffer':<12}{ring_time / args.ticks * 1e6:>10.1f}")
+    print(f"speedup: {list_time / ring_time:.1f}x, ranges identical over {len(ring_ranges)} ticks")
+
+
+if __name__ == "__main__":
+    main()
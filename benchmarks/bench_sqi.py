@@ -0,0 +1,91 @@
+"""
+CPU cost and grade separation of the SignalQuality indices, with the pipeline's settings.
+
+  - ECG: synthetic ECG (benchmarks.bench_ecg_processing) at increasing white-noise levels,
+    plus pure noise and a flat line, fed in 64-sample chunks at 512 Hz.
+  - rPPG: a 1.2 Hz pulse with respiration at increasing noise levels, plus pure noise,
+    fed one sample at a time at 30 Hz like Pipeline.results; then the recorded
+    rppg_log.csv files in data/ (at least 20 s long).
+
+Reported per case: median SNR / kurtosis / flatline / clipping, seconds graded good/fair/poor,
+and the CPU time per second of signal (the samples are only buffered between the 1 s updates).
+
+Run from the repository root:
+    python -m benchmarks.bench_sqi --seconds 60
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from benchmarks.bench_ecg_processing import synthetic_ecg
+from utils.sqi import SignalQuality
+
+ECG_SQI = {
+    "fs": 512, "low_cut": 0.5, "high_cut": 40, "harmonics": 0,
+    "rails": (-32768, 32767), "snr": None, "kurtosis": (3.5, 5),
+}
+RPPG_SQI = {"fs": 30}
+
+
+def run(params: dict, times: np.ndarray, values: np.ndarray, block: int) -> dict:
+    quality = SignalQuality(params)
+    results = []
+    start = time.process_time()
+    if block == 1:
+        for timestamp, value in zip(times.tolist(), values.tolist()):
+            indices = quality.update(value, timestamp)
+            if indices is not None:
+                results.append(indices)
+    else:
+        for i in range(0, len(values), block):
+            indices = quality.update(values[i:i + block], times[i:i + block])
+            if indices is not None:
+                results.append(indices)
+    cpu = time.process_time() - start
+    grades = {grade: sum(r["grade"] == grade for r in results) for grade in ("good", "fair", "poor")}
+    median = {key: float(np.nanmedian([r[key] for r in results])) if results else np.nan
+              for key in ("snr", "kurtosis", "flatline", "clipping")}
+    return dict(median, grades=grades, cpu_ms=cpu / (times[-1] - times[0]) * 1e3)
+
+
+def report(name: str, result: dict) -> None:
+    grades = result["grades"]
+    print(f"{name:<22}{result['snr']:>8.1f}{result['kurtosis']:>10.2f}{result['flatline']:>10.2f}{result['clipping']:>10.3f}"
+          f"{grades['good']:>6}{grades['fair']:>6}{grades['poor']:>6}{result['cpu_ms']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="./data")
+    parser.add_argument("--seconds", type=float, default=60.0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'case':<22}{'snr dB':>8}{'kurtosis':>10}{'flatline':>10}{'clipping':>10}{'good':>6}{'fair':>6}{'poor':>6}{'cpu ms/s':>10}")
+    for noise in (50, 300, 1000):
+        times, values, _ = synthetic_ecg(args.seconds, 512, 72, noise, 500, 200)
+        report(f"ecg noise {noise}", run(ECG_SQI, times, values, 64))
+    times = np.arange(int(args.seconds * 512)) / 512
+    report("ecg pure noise", run(ECG_SQI, times, rng.normal(2000, 300, len(times)).round(), 64))
+    report("ecg flat line", run(ECG_SQI, times, np.full(len(times), 2000.0), 64))
+
+    times = np.arange(int(args.seconds * 30)) / 30
+    pulse = np.sin(2 * np.pi * 1.2 * times) + 0.3 * np.sin(2 * np.pi * 0.25 * times)
+    for noise in (0.3, 1.0, 3.0):
+        report(f"rppg noise {noise}", run(RPPG_SQI, times, pulse + rng.normal(0, noise, len(times)), 1))
+    report("rppg pure noise", run(RPPG_SQI, times, rng.normal(0, 1, len(times)), 1))
+
+    for path in sorted(glob.glob(os.path.join(args.data, "patient_*", "rppg_log.csv"))):
+        if not os.path.getsize(path):
+            continue
+        log = np.loadtxt(path, delimiter=",", ndmin=2)
+        if log[-1, 0] - log[0, 0] < 20:
+            continue
+        report(os.path.basename(os.path.dirname(path)), run(RPPG_SQI, log[:, 0], log[:, 1], 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Per-frame latency of Step inference with plain session.run and with IOBinding.
+
+Synthetic 36x36 frames are run through model/models/onnx/step.onnx. The state
+file is copied to a temporary location, so the shipped state.pkl is not touched.
+
+Run from the repository root:
+    python -m benchmarks.bench_step --frames 2000 --intra-op-threads 1 2 4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from model.step import Step
+
+
+def run(io_binding: bool, session_config: dict, frames: list, warmup: int, state_path: str) -> np.ndarray:
+    model = Step(
+        model_path="./model/models/onnx/step.onnx",
+        state_path=state_path,
+        dt=1 / 30,
+        session_config=session_config,
+        io_binding=io_binding,
+    )
+    for frame in frames[:warmup]:
+        model.infer(frame)
+    times = np.empty(len(frames))
+    for i, frame in enumerate(frames):
+        start = time.perf_counter()
+        model.infer(frame)
+        times[i] = time.perf_counter() - start
+    return times * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--intra-op-threads", nargs="+", type=int, default=[0])
+    parser.add_argument("--inter-op-threads", type=int, default=0)
+    parser.add_argument("--graph-optimization-level", default="all", choices=["disable", "basic", "extended", "all"])
+    parser.add_argument("--execution-mode", default="sequential", choices=["sequential", "parallel"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    base = rng.uniform(50, 200, (36, 36, 3)).astype(np.float32)
+    frames = [np.clip(base * (1 + 0.01 * np.sin(i / 5)) + rng.normal(0, 1, base.shape), 0, 255).astype(np.float32)
+              for i in range(args.frames)]
+
+    workdir = tempfile.mkdtemp(prefix="bench_step_")
+    state_path = os.path.join(workdir, "state.pkl")
+    shutil.copy("./model/models/onnx/state.pkl", state_path)
+
+    print(f"{'mode':<12}{'intra':>6}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'fps':>10}")
+    for intra in args.intra_op_threads:
+        session_config = {
+            "intra_op_num_threads": intra,
+            "inter_op_num_threads": args.inter_op_threads,
+            "graph_optimization_level": args.graph_optimization_level,
+            "execution_mode": args.execution_mode,
+        }
+        for name, io_binding in (("run", False), ("io_binding", True)):
+            times = run(io_binding, session_config, frames, args.warmup, state_path)
+            print(f"{name:<12}{intra:>6}{times.mean():>10.3f}{np.percentile(times, 50):>10.3f}"
+                  f"{np.percentile(times, 95):>10.3f}{np.percentile(times, 99):>10.3f}{1e3 / times.mean():>10.1f}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+CPU cost and agreement of the streaming heart-rate estimator against the per-sample one.
+
+legacy:    what Pipeline.results used to do - for every sample, once the window is full,
+           redesign the Butterworth, filtfilt the window and run welch (nfft = 1e5 / fs),
+           at the sampling rate measured from the window's timestamps.
+streaming: utils.streaming_hr.StreamingHR (causal sosfilt, FFT once per update interval),
+           with and without peak-interval refinement.
+
+The signal is a synthetic BVP at `--fps` with jittered timestamps, a heart rate that drifts
+between `--hr-low` and `--hr-high` BPM, a second harmonic, baseline wander and noise; and
+optionally the recorded rppg_log.csv sessions in data/. Agreement is reported against the
+legacy estimate at the same sample and, for the synthetic signal, against the true rate.
+
+Run from the repository root:
+    python -m benchmarks.bench_streaming_hr --seconds 600
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from utils.hr import bandpass_filter, get_hr
+from utils.streaming_hr import StreamingHR
+
+
+def synthetic_bvp(seconds: float, fps: float, hr_low: float, hr_high: float, seed: int = 0):
+    """:return: (values, timestamps, true heart rate per sample)"""
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(0, seconds, 1 / fps) + rng.normal(0, 0.003, int(np.ceil(seconds * fps)))[:int(np.ceil(seconds * fps))]
+    timestamps = np.sort(timestamps)
+    hr = hr_low + (hr_high - hr_low) * (0.5 + 0.5 * np.sin(2 * np.pi * timestamps / 120))
+    phase = 2 * np.pi * np.cumsum(np.r_[0, np.diff(timestamps)] * hr / 60)
+    values = (np.sin(phase) + 0.3 * np.sin(2 * phase + 0.5) + 0.5 * np.sin(2 * np.pi * 0.1 * timestamps)
+              + rng.normal(0, 0.4, len(timestamps)))
+    return values, timestamps, hr
+
+
+def legacy(values: np.ndarray, timestamps: np.ndarray, window: float, fps: float):
+    """Per-sample estimate as in the old Pipeline.results; :return: (estimates per sample, cpu seconds)"""
+    estimates = np.full(len(values), np.nan)
+    start = time.process_time()
+    first = 0
+    for i in range(len(values)):
+        while timestamps[i] - timestamps[first] > window:
+            first += 1
+        span = timestamps[i] - timestamps[first]
+        if i - first > 16 and span >= window * 0.95:
+            fs = (i - first) / span
+            estimates[i] = get_hr(bandpass_filter(values[first:i + 1], fs=fs), sr=fs)
+    return estimates, time.process_time() - start
+
+
+def streaming(values: np.ndarray, timestamps: np.ndarray, params: dict):
+    """:return: (sample index and estimate of every update, cpu seconds)"""
+    estimator = StreamingHR(params)
+    updates = []
+    start = time.process_time()
+    for i, (value, timestamp) in enumerate(zip(values, timestamps)):
+        hr = estimator.update(value, timestamp)
+        if hr is not None:
+            updates.append((i, hr))
+    elapsed = time.process_time() - start
+    return np.array(updates).reshape(-1, 2), elapsed
+
+
+def compare(name: str, values: np.ndarray, timestamps: np.ndarray, truth, window: float, fps: float) -> None:
+    seconds = timestamps[-1] - timestamps[0]
+    reference, legacy_cpu = legacy(values, timestamps, window, fps)
+    rows = [("legacy", legacy_cpu, None, reference[~np.isnan(reference)], np.flatnonzero(~np.isnan(reference)))]
+    for label, refine in (("streaming", False), ("streaming+peaks", True)):
+        updates, cpu = streaming(values, timestamps, {"fs": fps, "window": window, "peak_refine": refine})
+        index = updates[:, 0].astype(int)
+        rows.append((label, cpu, np.abs(updates[:, 1] - reference[index]), updates[:, 1], index))
+    print(f"\n{name}: {seconds:.0f} s of signal")
+    print(f"{'estimator':<18}{'updates':>9}{'cpu ms/s':>10}{'|d legacy|':>12}{'|d truth|':>11}")
+    for label, cpu, diff, estimates, index in rows:
+        vs_legacy = f"{np.nanmean(diff):>12.2f}" if diff is not None and len(diff) else f"{'-':>12}"
+        vs_truth = f"{np.mean(np.abs(estimates - truth[index])):>11.2f}" if truth is not None and len(index) else f"{'-':>11}"
+        print(f"{label:<18}{len(estimates):>9}{cpu / seconds * 1e3:>10.3f}{vs_legacy}{vs_truth}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=300.0)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--window", type=float, default=6.0)
+    parser.add_argument("--hr-low", type=float, default=60.0)
+    parser.add_argument("--hr-high", type=float, default=100.0)
+    parser.add_argument("--sessions", default=None, help="also replay rppg_log.csv from the sessions in this directory")
+    args = parser.parse_args()
+
+    values, timestamps, truth = synthetic_bvp(args.seconds, args.fps, args.hr_low, args.hr_high)
+    compare("synthetic", values, timestamps, truth, args.window, args.fps)
+
+    if args.sessions:
+        logs = []
+        for path in sorted(glob.glob(os.path.join(args.sessions, "patient_*", "rppg_log.csv"))):
+            if os.path.getsize(path):
+                logs.append(np.loadtxt(path, delimiter=",", ndmin=2))
+        # Sessions are short: chain them on one clock so the estimators see a continuous stream
+        chained, offset = [], 0.0
+        for log in logs:
+            times = log[:, 0] - log[0, 0] + offset
+            chained.append(np.column_stack((times, log[:, 1])))
+            offset = times[-1] + 1 / args.fps
+        if chained:
+            stream = np.concatenate(chained)
+            compare("recorded sessions", stream[:, 1], stream[:, 0], None, args.window, args.fps)
+
+
+if __name__ == "__main__":
+    main()
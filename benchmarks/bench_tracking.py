@@ -0,0 +1,126 @@
+"""
+Frames/sec and box jitter of MediaPipePreprocess with and without tracking mode.
+
+The recorded sessions store 36x36 face crops, so each crop is upscaled to
+``--face-size`` and pasted onto a ``--canvas`` frame that drifts slowly, which
+approximates the full camera frame FaceMesh sees on the device.
+
+The reference box is full FaceMesh detection on every frame. For each
+re-detect interval the script reports:
+  - fps: frames per second of face localisation (the crop itself is identical)
+  - center_err: mean distance (px) between the box center and the reference
+  - iou: mean IoU with the reference box
+  - jitter: mean frame-to-frame change (px) of the box center after removing the drift
+
+Run from the repository root:
+    python -m benchmarks.bench_tracking --sessions data/patient_000001 data/patient_000002
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from preprocess.mp import MediaPipePreprocess
+
+
+def load_session_frames(session_dir: str, canvas: tuple, face_size: int, max_frames: int) -> list:
+    width, height = canvas
+    cap = cv2.VideoCapture(os.path.join(session_dir, "video.mp4"))
+    frames = []
+    while len(frames) < max_frames:
+        success, crop = cap.read()
+        if not success:
+            break
+        i = len(frames)
+        face = cv2.resize(crop, (face_size, face_size), interpolation=cv2.INTER_CUBIC)
+        x = int((width - face_size) / 2 + 40 * np.sin(i / 45))
+        y = int((height - face_size) / 2 + 20 * np.sin(i / 70))
+        frame = np.full((height, width, 3), 90, dtype=np.uint8)
+        frame[y:y + face_size, x:x + face_size] = face
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames
+
+
+def run(frames: list, tracking: bool, interval: int) -> tuple:
+    preprocess = MediaPipePreprocess({
+        "target_size": (36, 36),
+        "mesh_display": False,
+        "tracking": tracking,
+        "redetect_interval": interval,
+    })
+    height, width, _ = frames[0].shape
+    scale = np.array([width, height, width, height])
+    boxes = []
+    start = time.perf_counter()
+    for frame in frames:
+        box, _ = preprocess.locate_face(frame)
+        boxes.append(None if box is None else box * scale)
+    elapsed = time.perf_counter() - start
+    return boxes, len(frames) / elapsed, preprocess.detections, preprocess.tracking_losses
+
+
+def iou(a, b) -> float:
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x1 - x0) * max(0.0, y1 - y0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare(boxes: list, reference: list) -> dict:
+    errors, ious, deltas = [], [], []
+    for i, (box, ref) in enumerate(zip(boxes, reference)):
+        if box is None or ref is None:
+            continue
+        center, ref_center = (box[:2] + box[2:]) / 2, (ref[:2] + ref[2:]) / 2
+        errors.append(np.linalg.norm(center - ref_center))
+        ious.append(iou(box, ref))
+        if i > 0 and boxes[i - 1] is not None and reference[i - 1] is not None:
+            # Change of the offset to the reference: removes the true motion of the face
+            prev = (boxes[i - 1][:2] + boxes[i - 1][2:]) / 2 - (reference[i - 1][:2] + reference[i - 1][2:]) / 2
+            deltas.append(np.linalg.norm((center - ref_center) - prev))
+    return {
+        "coverage": sum(b is not None for b in boxes) / len(boxes),
+        "center_err": float(np.mean(errors)) if errors else float("nan"),
+        "iou": float(np.mean(ious)) if ious else float("nan"),
+        "jitter": float(np.mean(deltas)) if deltas else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", nargs="*", default=None, help="session directories (default: all data/patient_*)")
+    parser.add_argument("--intervals", nargs="+", type=int, default=[5, 10, 20, 30])
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--canvas", default="640x480")
+    parser.add_argument("--face-size", type=int, default=240)
+    args = parser.parse_args()
+
+    canvas = tuple(int(v) for v in args.canvas.split("x"))
+    sessions = args.sessions or sorted(glob.glob("data/patient_*"))
+    frames = []
+    for session in sessions:
+        frames.extend(load_session_frames(session, canvas, args.face_size, args.max_frames))
+    if not frames:
+        print("[bench_tracking] No frames loaded")
+        return
+    print(f"[bench_tracking] {len(frames)} frames from {len(sessions)} sessions")
+
+    reference, ref_fps, _, _ = run(frames, tracking=False, interval=1)
+    print(f"{'mode':<14}{'fps':>8}{'detections':>12}{'losses':>8}{'coverage':>10}{'center_err':>12}{'iou':>8}{'jitter':>8}")
+    ref_stats = compare(reference, reference)
+    print(f"{'detect-all':<14}{ref_fps:>8.1f}{len(frames):>12}{0:>8}{ref_stats['coverage']:>10.3f}"
+          f"{0.0:>12.2f}{1.0:>8.3f}{0.0:>8.2f}")
+    for interval in args.intervals:
+        boxes, fps, detections, losses = run(frames, tracking=True, interval=interval)
+        stats = compare(boxes, reference)
+        print(f"{'track/' + str(interval):<14}{fps:>8.1f}{detections:>12}{losses:>8}{stats['coverage']:>10.3f}"
+              f"{stats['center_err']:>12.2f}{stats['iou']:>8.3f}{stats['jitter']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
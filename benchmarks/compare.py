@@ -0,0 +1,91 @@
+"""
+Compare two benchmark reports (benchmarks.harness JSON, e.g. of bench_pipeline or
+`replay.py --json`) stage by stage and flag regressions.
+
+A metric regresses when it is worse than the base by more than `--threshold` (relative):
+throughput lower, latency p95/p99, CPU per item or peak RSS higher. The exit status is 1
+if any metric regressed, so the comparison can gate a change.
+
+Run from the repository root:
+    python -m benchmarks.compare benchmarks/results/pipeline-<base>.json benchmarks/results/pipeline-<new>.json
+"""
+import argparse
+import json
+import sys
+
+# (label, path into the stage record, True if higher is better)
+METRICS = (
+    ("items/s", ("throughput",), True),
+    ("p95 ms", ("latency_ms", "p95"), False),
+    ("p99 ms", ("latency_ms", "p99"), False),
+    ("cpu ms/item", ("cpu_ms_per_item",), False),
+    ("rss MB", ("rss_peak_mb",), False),
+)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def value(record: dict, keys: tuple):
+    for key in keys:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def compare(base: dict, new: dict, threshold: float) -> list:
+    """
+    :return: rows (stage, metric, base value, new value, relative change, regressed) of the stages in both reports
+    """
+    rows = []
+    for stage, new_record in new["stages"].items():
+        base_record = base["stages"].get(stage)
+        if base_record is None:
+            continue
+        for label, keys, higher_is_better in METRICS:
+            old, current = value(base_record, keys), value(new_record, keys)
+            if old is None or current is None or old == 0:
+                continue
+            change = (current - old) / abs(old)
+            worse = -change if higher_is_better else change
+            rows.append((stage, label, old, current, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base", help="report of the reference commit")
+    parser.add_argument("new", help="report of the commit under test")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    print(f"base: {base['meta'].get('commit')} ({base['meta'].get('created')}), "
+          f"new: {new['meta'].get('commit')} ({new['meta'].get('created')})")
+    if base["meta"].get("platform") != new["meta"].get("platform") or base["meta"].get("cpus") != new["meta"].get("cpus"):
+        print("Warning: the reports come from different machines")
+    inputs = {key: value for key, value in new["meta"].get("args", {}).items() if key not in ("output", "stages")}
+    if any(base["meta"].get("args", {}).get(key) != value for key, value in inputs.items()):
+        print("Warning: the reports were run with different arguments")
+    for name in ("base", "new"):
+        report = base if name == "base" else new
+        other = new if name == "base" else base
+        missing = sorted(set(report["stages"]) - set(other["stages"]))
+        if missing:
+            print(f"Only in {name}: {', '.join(missing)}")
+
+    rows = compare(base, new, args.threshold)
+    print(f"{'stage':<22}{'metric':<13}{'base':>11}{'new':>11}{'change':>9}")
+    for stage, label, old, current, change, regressed in rows:
+        print(f"{stage:<22}{label:<13}{old:>11.3f}{current:>11.3f}{change * 100:>8.1f}%"
+              + ("  REGRESSION" if regressed else ""))
+    regressions = sum(row[-1] for row in rows)
+    print(f"{regressions} regression(s) beyond {args.threshold * 100:.0f}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Shared measurement helpers of the benchmark suite: per-item latency percentiles,
+throughput, CPU time and peak RSS of a stage, and the JSON report that
+`python -m benchmarks.compare` diffs between commits.
+
+A report is a JSON object:
+    {"meta": {"commit", "python", "platform", "cpus", "created", "args"},
+     "stages": {"<stage>": {"unit", "items", "seconds", "throughput", "latency_ms": {"p50", "p95", "p99",
+                "mean", "max"}, "cpu_seconds", "cpu_ms_per_item", "cpu_utilization", "rss_peak_mb",
+                "rss_growth_mb", ...}}}
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak instead of current RSS (kilobytes on Linux), better than nothing
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSSampler:
+    """Samples the RSS on a background thread while a stage runs and keeps the peak."""
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.start_rss = 0
+        self.peak = 0
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self) -> "RSSSampler":
+        self.start_rss = self.peak = rss_bytes()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="RSSSampler")
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def summarize(latencies, items: int, seconds: float, cpu_seconds: float, sampler: RSSSampler, unit: str) -> dict:
+    """The stage record of a report; latencies in seconds."""
+    latencies = np.asarray(latencies, dtype=np.float64) * 1e3
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        latency = {"p50": p50, "p95": p95, "p99": p99, "mean": latencies.mean(), "max": latencies.max()}
+    else:
+        latency = {key: None for key in ("p50", "p95", "p99", "mean", "max")}
+    return {
+        "unit": unit,
+        "items": items,
+        "seconds": seconds,
+        "throughput": items / seconds if seconds > 0 else None,
+        "latency_ms": {key: None if value is None else float(value) for key, value in latency.items()},
+        "cpu_seconds": cpu_seconds,
+        "cpu_ms_per_item": cpu_seconds / items * 1e3 if items else None,
+        # Above 1 when the stage keeps more than one core busy (e.g. ONNX Runtime threads)
+        "cpu_utilization": cpu_seconds / seconds if seconds > 0 else None,
+        "rss_peak_mb": sampler.peak / 2 ** 20,
+        "rss_growth_mb": (sampler.peak - sampler.start_rss) / 2 ** 20,
+    }
+
+
+def measure(function, items, warmup: int = 0, unit: str = "item") -> dict:
+    """
+    Run `function(item)` for every item, timing each call.
+    :param warmup: leading items run first without being measured
+    :return: stage record (see `summarize`)
+    """
+    items = list(items)
+    for item in items[:warmup]:
+        function(item)
+    latencies = np.empty(len(items))
+    with RSSSampler() as sampler:
+        cpu_start, start = time.process_time(), time.perf_counter()
+        for i, item in enumerate(items):
+            call_start = time.perf_counter()
+            function(item)
+            latencies[i] = time.perf_counter() - call_start
+        seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - cpu_start
+    return summarize(latencies, len(items), seconds, cpu_seconds, sampler, unit)
+
+
+class Report:
+    """Stage records of one benchmark run, written as JSON."""
+    def __init__(self, args: dict = None) -> None:
+        self.meta = {
+            "commit": self.commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "args": args or {},
+        }
+        self.stages = {}
+
+    @staticmethod
+    def commit():
+        """:return: the current git commit (with "-dirty" for local changes), or None outside a checkout"""
+        try:
+            commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                    check=True).stdout.strip()
+            dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                   text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return commit + ("-dirty" if dirty else "")
+
+    def add(self, name: str, record: dict) -> dict:
+        self.stages[name] = record
+        return record
+
+    def print(self, file=sys.stdout) -> None:
+        print(f"{'stage':<22}{'unit':<8}{'items':>7}{'items/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'cpu ms/item':>12}{'cpu %':>7}{'rss MB':>8}", file=file)
+        for name, record in self.stages.items():
+            latency = record["latency_ms"]
+            cells = [record["throughput"], latency["p50"], latency["p95"], latency["p99"], record["cpu_ms_per_item"]]
+            text = "".join(f"{value:>{width}.{digits}f}" if value is not None else f"{'-':>{width}}"
+                           for value, width, digits in zip(cells, (10, 9, 9, 9, 12), (1, 2, 2, 2, 3)))
+            print(f"{name:<22}{record['unit']:<8}{record['items']:>7}{text}"
+                  f"{(record['cpu_utilization'] or 0) * 100:>7.0f}{record['rss_peak_mb']:>8.0f}", file=file)
+
+    def write(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"meta": self.meta, "stages": self.stages}, f, indent=2)
+        print(f"Results written to {path}")
@@ -1,31 +1,244 @@
 from queue import Queue
 import cv2
 import sys
+import threading
 import time
+import numpy as np
 from .base import CaptureBase
+from .ring import FrameRing
 import global_vars
+from utils.timebase import TimeBase
+
+
+class CameraStream:
+    """
+    One camera of CameraCapture: the device, its V4L2 settings and its counters.
+
+    params (all optional, applied with `cap.set` before the first grab):
+      - "fourcc": pixel format, e.g. "MJPG" (less USB bandwidth, decoded on the CPU) or "YUYV"
+      - "width", "height": resolution
+      - "fps": frame rate requested from the driver
+      - "buffer_size": V4L2 buffers queued in the driver; 1 keeps the grabbed frame the newest
+      - "gray": deliver single-channel luma frames (for the IR camera). With YUYV/UYVY or MJPG
+        the driver's RGB conversion is turned off: the luma bytes are taken straight from
+        the packed YUV buffer, or the JPEG is decoded to grayscale only
+    """
+    def __init__(self, name: str, cap: cv2.VideoCapture, params: dict = None) -> None:
+        self.name = name
+        self.cap = cap
+        self.params = params or {}
+        self.gray = self.params.get("gray", False)
+        # Reused decode buffers, so `retrieve` does not allocate a new frame each time
+        self.frame = None
+        self.gray_frame = None
+        self.period = None
+        self.reset()
+
+    def configure(self) -> None:
+        """Apply the V4L2 settings and print what the driver accepted."""
+        if not self.cap.isOpened():
+            return
+        if self.params.get("fourcc"):
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.params["fourcc"]))
+        for key, prop in (("width", cv2.CAP_PROP_FRAME_WIDTH), ("height", cv2.CAP_PROP_FRAME_HEIGHT),
+                          ("fps", cv2.CAP_PROP_FPS), ("buffer_size", cv2.CAP_PROP_BUFFERSIZE)):
+            if self.params.get(key):
+                self.cap.set(prop, self.params[key])
+        if self.gray and self.params.get("fourcc") in ("YUYV", "UYVY", "MJPG"):
+            self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, "little").decode("ascii", errors="replace")
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.period = 1 / fps if fps > 0 else None
+        print(f"[Camera] {self.name}: {fourcc.strip(chr(0)) or 'default format'} "
+              f"{int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))} "
+              f"@ {fps:.1f} fps, {int(self.cap.get(cv2.CAP_PROP_BUFFERSIZE))} buffers")
+
+    def luma(self, frame: np.ndarray):
+        """:return: the single-channel frame of what `retrieve` returned, or None if it cannot be decoded"""
+        if frame.ndim == 3 and frame.shape[2] == 2:
+            # Packed 4:2:2 (YUYV: Y U Y V, UYVY: U Y V Y), every other byte is luma
+            return frame[:, :, 1 if self.params.get("fourcc") == "UYVY" else 0]
+        if frame.ndim == 2 and frame.shape[0] == 1:
+            # Compressed buffer (MJPG): decode the luma plane only
+            return cv2.imdecode(frame, cv2.IMREAD_GRAYSCALE)
+        if frame.ndim == 3:
+            self.gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray_frame)
+            return self.gray_frame
+        return frame
+
+    def reset(self) -> None:
+        self.started = None
+        self.last_timestamp = None
+        self.latencies = []
+        self.consecutive_timeouts = 0
+        # counters
+        self.frames = 0
+        self.failures = 0
+        self.dropped = 0  # frames missing between consecutive timestamps, or refused by the queue
+        self.sync_timeouts = 0
+
+    def count(self, timestamp: float, published_at: float, published: bool) -> None:
+        if self.started is None:
+            self.started = timestamp
+        self.frames += 1
+        if not published:
+            self.dropped += 1
+        if self.period and self.last_timestamp is not None:
+            missed = int(round((timestamp - self.last_timestamp) / self.period)) - 1
+            self.dropped += max(missed, 0)
+        self.last_timestamp = timestamp
+        self.latencies.append(published_at - timestamp)
+        if len(self.latencies) > 1000:
+            del self.latencies[:500]
+
+    def stats(self) -> dict:
+        elapsed = self.last_timestamp - self.started if self.frames > 1 else 0.0
+        latency = np.percentile(self.latencies, [50, 95]) * 1e3 if self.latencies else (np.nan, np.nan)
+        return {
+            "frames": self.frames,
+            "fps": (self.frames - 1) / elapsed if elapsed > 0 else 0.0,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "sync_timeouts": self.sync_timeouts,
+            "latency_p50_ms": float(latency[0]),
+            "latency_p95_ms": float(latency[1]),
+        }
 
 
 class CameraCapture(CaptureBase):
-    def __init__(self, cap: cv2.VideoCapture, ir_cap: cv2.VideoCapture) -> None:
+    """
+    RGB and IR capture with one grab thread per camera, so a slow or failing camera
+    does not hold back the other one.
+
+    Each thread `grab()`s a frame, stamps it, then `retrieve()`s (decodes) and publishes it.
+    With `sync_grabs` the two threads meet at a barrier before grabbing, so both cameras
+    dequeue their newest buffer at the same moment and the decoding happens afterwards. A
+    camera that does not reach the barrier within `sync_timeout` seconds is not waited for;
+    after `max_sync_timeouts` consecutive misses the threads stop synchronizing for the
+    session. Frames of both cameras carry their capture timestamps (see `timestamp`), so
+    consumers pair RGB and IR frames by timestamp rather than by arrival order.
+
+    config (optional):
+      - "rgb", "ir": CameraStream params (V4L2 format, resolution, frame rate, buffer size)
+      - "sync_grabs": synchronize the grabs of both cameras (default True)
+      - "sync_timeout": seconds to wait for the other camera at the barrier (default 0.05)
+      - "max_sync_timeouts": consecutive timeouts before synchronization is dropped (default 10)
+    """
+    def __init__(self, cap: cv2.VideoCapture, ir_cap: cv2.VideoCapture, timebase: TimeBase = None,
+                 config: dict = None) -> None:
         super().__init__()
+        config = config or {}
         self.cap = cap
         self.ir_cap = ir_cap
+        self.rgb = CameraStream("rgb", cap, config.get("rgb"))
+        self.ir = CameraStream("ir", ir_cap, config.get("ir"))
+        self.sync_grabs = config.get("sync_grabs", True)
+        self.sync_timeout = config.get("sync_timeout", 0.05)
+        self.max_sync_timeouts = config.get("max_sync_timeouts", 10)
+        self.barrier = threading.Barrier(2)
+        self.syncing = False
+        # Frames are stamped with session times; see `timestamp`
+        self.timebase = timebase or TimeBase()
+        self.last_position = {}
+        for stream in (self.rgb, self.ir):
+            stream.configure()
 
-    def __call__(self, frame_queue: Queue, ir_frame_queue: Queue) -> None:
-        while global_vars.pipeline_running and self.cap.isOpened():
-            success, frame = self.cap.read()
-            timestamp = time.time()
-            if not success:
-                print("[Camera] Unable to read a frame", file=sys.stderr)
-                continue
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame_queue.put((frame, timestamp))
+    def timestamp(self, name: str, cap: cv2.VideoCapture, host_time: float) -> float:
+        """
+        Session time of the frame just grabbed from `cap`, at host monotonic `host_time`.
+
+        The V4L2 backend reports the buffer timestamp of the frame as CAP_PROP_POS_MSEC. The
+        kernel takes it on the monotonic clock when the frame is captured, so it is used as
+        is; a buffer clock of another origin is mapped through the time base's `name` clock.
+        Without a buffer timestamp (other backends, or a repeated one) the read time is used.
+        """
+        position = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if position <= 0 or position == self.last_position.get(name):
+            return self.timebase.to_session(host_time)
+        self.last_position[name] = position
+        if 0 <= host_time - position < 1.0:
+            return self.timebase.to_session(position)
+        return self.timebase.from_device(name, position, host_time)
+
+    @staticmethod
+    def publish(target, frame, timestamp: float, code: int = None) -> bool:
+        """
+        Convert `frame` with `code` (None: copy as is) and hand it to `target`.
+        A FrameRing receives the conversion in place in one of its slots; a Queue gets a new array.
+        :return: False if the FrameRing dropped the frame
+        """
+        if isinstance(target, FrameRing):
+            slot = target.acquire(frame.shape)
+            if slot is None:
+                return False
+            index, view = slot
+            if code is None:
+                np.copyto(view, frame)
+            else:
+                cv2.cvtColor(frame, code, dst=view)
+            target.commit(index, timestamp)
+        else:
+            target.put((frame.copy() if code is None else cv2.cvtColor(frame, code), timestamp))
+        return True
 
-            success, ir_frame = self.ir_cap.read()
-            timestamp = time.time()
+    def _sync(self, stream: CameraStream) -> None:
+        """Wait at the barrier for the other camera's grab, unless synchronization was dropped."""
+        if not self.syncing:
+            return
+        try:
+            self.barrier.wait(timeout=self.sync_timeout)
+            stream.consecutive_timeouts = 0
+        except threading.BrokenBarrierError:
+            stream.sync_timeouts += 1
+            stream.consecutive_timeouts += 1
+            if stream.consecutive_timeouts >= self.max_sync_timeouts and self.syncing:
+                self.syncing = False
+                print(f"[Camera] {stream.name}: the other camera keeps missing the grab barrier, "
+                      "grabbing unsynchronized", file=sys.stderr)
+            self.barrier.reset()
+
+    def run(self, stream: CameraStream, target, code: int) -> None:
+        """Grab loop of one camera, run in its own thread."""
+        while global_vars.pipeline_running and stream.cap.isOpened():
+            self._sync(stream)
+            if not stream.cap.grab():
+                stream.failures += 1
+                print(f"[Camera] Unable to grab a {stream.name} frame", file=sys.stderr)
+                time.sleep(0.01)
+                continue
+            timestamp = self.timestamp(stream.name, stream.cap, time.monotonic())
+            success, frame = stream.cap.retrieve(stream.frame)
             if not success:
-                print("[Camera] Unable to read an IR frame", file=sys.stderr)
+                stream.failures += 1
+                print(f"[Camera] Unable to retrieve a {stream.name} frame", file=sys.stderr)
                 continue
-            ir_frame = cv2.cvtColor(ir_frame, cv2.COLOR_BGR2RGB) # TODO: color conversion may not be necessary for IR frames
-            ir_frame_queue.put((ir_frame, timestamp))
+            stream.frame = frame
+            if stream.gray:
+                frame = stream.luma(frame)
+                if frame is None:
+                    stream.failures += 1
+                    continue
+            published = self.publish(target, frame, timestamp, code)
+            stream.count(timestamp, self.timebase.now(), published)
+        # The other camera must not wait for this one any more
+        self.syncing = False
+        self.barrier.abort()
+
+    def stats(self) -> dict:
+        return {stream.name: stream.stats() for stream in (self.rgb, self.ir)}
+
+    def __call__(self, frame_queue: Queue, ir_frame_queue: Queue) -> None:
+        self.rgb.reset()
+        self.ir.reset()
+        self.barrier.reset()
+        self.syncing = self.sync_grabs
+        threads = [
+            threading.Thread(target=self.run, args=(stream, target, None if stream.gray else cv2.COLOR_BGR2RGB),
+                             daemon=True, name=f"{stream.name.upper()}GrabThread")
+            for stream, target in ((self.rgb, frame_queue), (self.ir, ir_frame_queue))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"[Camera] Stats: {self.stats()}")
@@ -0,0 +1,150 @@
+import csv
+import os
+import threading
+import time
+from queue import Queue
+
+import cv2
+import numpy as np
+
+import global_vars
+from utils.replay import ReplayClock
+from .camera import CameraCapture, CameraStream
+
+# Video of each stream in a session directory, as written by the PictureLoggers
+VIDEOS = {"rgb": "video.mp4", "ir": "ir_video.mp4"}
+
+
+def first_timestamp(path: str):
+    """:return: the timestamp in the first column of the first row of a log CSV, or None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            try:
+                return float(row[0])
+            except (IndexError, ValueError):
+                continue
+    return None
+
+
+class VideoTimestamps:
+    """
+    Capture timestamps of the frames of a recorded video, in order.
+
+    Videos written in the streaming mode of PictureLogger have the real timestamps in
+    their `<video>_timestamps.csv` sidecar. For older recordings (PNG mode, assembled by
+    ffmpeg) only the frame durations survive in the presentation timestamps: those are
+    anchored at `anchor` (the first rPPG or ECG timestamp of the session), which puts
+    the first frame within a frame or two of its real time. Gaps longer than `max_gap`
+    seconds in the presentation timestamps are taken as stalls and cut to one frame period.
+    """
+    def __init__(self, video_path: str, anchor: float, fps: float, max_gap: float = 1.0) -> None:
+        self.path = os.path.splitext(video_path)[0] + "_timestamps.csv"
+        self.anchor = anchor
+        self.period = 1 / fps if fps > 0 else 1 / 30
+        self.max_gap = max_gap
+        self.recorded = None
+        if os.path.exists(self.path):
+            with open(self.path, newline="") as f:
+                self.recorded = np.array([float(row[1]) for row in csv.reader(f) if len(row) >= 2], dtype=np.float64)
+        self.reset()
+
+    def reset(self) -> None:
+        self.last_position = None
+        self.cut = 0.0
+
+    @property
+    def first(self) -> float:
+        return float(self.recorded[0]) if self.recorded is not None and len(self.recorded) else self.anchor
+
+    def __call__(self, index: int, position: float):
+        """
+        :param index: frame number
+        :param position: presentation timestamp of the frame in seconds (CAP_PROP_POS_MSEC / 1000)
+        :return: timestamp of the frame, or None past the end of the sidecar
+        """
+        if self.recorded is not None:
+            return float(self.recorded[index]) if index < len(self.recorded) else None
+        if self.last_position is not None and position - self.last_position > self.max_gap:
+            self.cut += position - self.last_position - self.period
+        self.last_position = position
+        return self.anchor + position - self.cut
+
+
+class ReplayCapture(CameraCapture):
+    """
+    Plays the RGB and IR videos of a recorded session (`video.mp4`, `ir_video.mp4`) into
+    the pipeline's frame queues, in place of the cameras.
+
+    Each video runs in its own thread like a camera: a frame is decoded, held until it is
+    due on the shared ReplayClock and published with its recorded timestamp (see
+    VideoTimestamps). Publishing into a Queue blocks when it is full, so with the clock
+    unpaced every frame reaches the preprocess as fast as it can take them. `done` is set
+    once both videos have been played to the end.
+
+    The recordings hold the face crops, not the camera frames; run them through
+    preprocess.passthrough.PassthroughPreprocess rather than the face detection.
+
+    config (optional):
+      - "rgb", "ir": CameraStream params; only "gray" (publish single-channel frames) applies
+      - "max_gap": longest presentation-timestamp gap taken as is, in seconds (default 1.0)
+    """
+    def __init__(self, session_dir: str, clock: ReplayClock, config: dict = None) -> None:
+        config = config or {}
+        self.session_dir = session_dir
+        self.clock = clock
+        cap = cv2.VideoCapture(os.path.join(session_dir, VIDEOS["rgb"]))
+        ir_cap = cv2.VideoCapture(os.path.join(session_dir, VIDEOS["ir"]))
+        super().__init__(cap, ir_cap, config={"rgb": config.get("rgb"), "ir": config.get("ir"), "sync_grabs": False})
+        anchor = first_timestamp(os.path.join(session_dir, "rppg_log.csv"))
+        if anchor is None:
+            anchor = first_timestamp(os.path.join(session_dir, "ecg_log.csv")) or 0.0
+        self.timestamps = {
+            stream.name: VideoTimestamps(os.path.join(session_dir, VIDEOS[stream.name]), anchor,
+                                         stream.cap.get(cv2.CAP_PROP_FPS), config.get("max_gap", 1.0))
+            for stream in (self.rgb, self.ir)
+        }
+        for stream in (self.rgb, self.ir):
+            if stream.cap.isOpened():
+                clock.register(self.timestamps[stream.name].first)
+        # Host monotonic time at which each RGB frame was published, by timestamp (end-to-end latency)
+        self.release_times = {}
+        self.done = threading.Event()
+
+    def run(self, stream: CameraStream, target, code: int) -> None:
+        """Playback loop of one video, run in its own thread."""
+        timestamps = self.timestamps[stream.name]
+        timestamps.reset()
+        stream.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        index = 0
+        while global_vars.pipeline_running and stream.cap.isOpened():
+            success, frame = stream.cap.read(stream.frame)
+            if not success:
+                break
+            stream.frame = frame
+            timestamp = timestamps(index, stream.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+            index += 1
+            if timestamp is None:
+                break
+            if stream.gray:
+                frame = stream.luma(frame)
+            due = self.clock.wait(timestamp)
+            if due is None:
+                break
+            released = time.monotonic()
+            if stream is self.rgb:
+                self.release_times[timestamp] = released
+            published = self.publish(target, frame, timestamp, code)
+            # Latency here is how late the frame went out against its schedule
+            stream.count(timestamp, timestamp + released - due, published)
+
+    def __call__(self, frame_queue: Queue, ir_frame_queue: Queue) -> None:
+        self.done.clear()
+        self.release_times.clear()
+        super().__call__(frame_queue, ir_frame_queue)
+        self.done.set()
+
+    def release(self) -> None:
+        self.cap.release()
+        self.ir_cap.release()
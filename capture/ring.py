@@ -0,0 +1,149 @@
+import threading
+from collections import deque
+from multiprocessing import shared_memory
+from queue import Empty
+
+import numpy as np
+
+
+class FrameRing:
+    """
+    A fixed-slot frame buffer shared between a capture thread and a preprocess thread.
+
+    All slots are views over one preallocated array, so the capture loop writes
+    frames in place (e.g. with ``cv2.cvtColor(..., dst=slot)``) and the consumer
+    reads them without copying. The buffer is allocated on the first ``acquire``
+    because the frame shape is only known once the camera delivers a frame.
+
+    Producer:
+        slot = ring.acquire(shape)    # (index, view) or None if the frame is dropped
+        ... fill view ...
+        ring.commit(index, timestamp)
+
+    Consumer:
+        index, frame, timestamp = ring.get(timeout=0.5)
+        ... use frame ...
+        ring.release(index)
+
+    When every slot is in use, ``policy`` decides what happens to a new frame:
+      - "overwrite_oldest": the oldest frame that is not being read is reused.
+      - "drop_newest": the new frame is discarded.
+
+    With ``shared=True`` the slots live in a multiprocessing SharedMemory block, so
+    worker processes can map them by ``shm_name`` and read frames without a copy.
+    """
+    POLICIES = ("overwrite_oldest", "drop_newest")
+
+    def __init__(self, slots: int, policy: str = "overwrite_oldest", dtype=np.uint8, shared: bool = False) -> None:
+        if slots < 2:
+            raise ValueError("FrameRing needs at least 2 slots")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown FrameRing policy: {policy}")
+        self.slots = slots
+        self.policy = policy
+        self.dtype = dtype
+        self.shared = shared
+        self.shm = None
+        self.buffer = None
+        self.timestamps = np.zeros(slots, dtype=np.float64)
+        self._free = deque(range(slots))
+        self._ready = deque()
+        self._cond = threading.Condition()
+
+        # counters
+        self.written = 0
+        self.overwritten = 0
+        self.dropped = 0
+
+    @property
+    def shm_name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def _allocate(self, shape: tuple) -> None:
+        shape = (self.slots, *shape)
+        if self.shared:
+            nbytes = int(np.prod(shape)) * np.dtype(self.dtype).itemsize
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.buffer = np.ndarray(shape, dtype=self.dtype, buffer=self.shm.buf)
+        else:
+            self.buffer = np.empty(shape, dtype=self.dtype)
+        print(f"[FrameRing] Allocated {self.slots} slots of {shape} ({self.buffer.nbytes / 1024 / 1024:.1f} MB)")
+
+    def acquire(self, shape: tuple):
+        """
+        Reserve a slot for writing.
+        :param shape: shape of the frame to be written
+        :return: (index, view) of the reserved slot, or None if the frame has to be dropped
+        """
+        with self._cond:
+            if self.buffer is None:
+                self._allocate(shape)
+            elif self.buffer.shape[1:] != tuple(shape):
+                raise ValueError(f"Frame shape {shape} does not match ring slots {self.buffer.shape[1:]}")
+            if self._free:
+                index = self._free.popleft()
+            elif self.policy == "overwrite_oldest" and self._ready:
+                index = self._ready.popleft()
+                self.overwritten += 1
+            else:
+                self.dropped += 1
+                return None
+        return index, self.buffer[index]
+
+    def commit(self, index: int, timestamp: float) -> None:
+        with self._cond:
+            self.timestamps[index] = timestamp
+            self._ready.append(index)
+            self.written += 1
+            self._cond.notify()
+
+    def abort(self, index: int) -> None:
+        """Give back a slot obtained by ``acquire`` without publishing it."""
+        with self._cond:
+            self._free.append(index)
+
+    def get(self, timeout: float = None):
+        """
+        Take the oldest committed frame.
+        :return: (index, view, timestamp); the slot stays reserved until ``release(index)``
+        :raises queue.Empty: if no frame arrives within ``timeout``
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._ready, timeout=timeout):
+                raise Empty
+            index = self._ready.popleft()
+            return index, self.buffer[index], float(self.timestamps[index])
+
+    def release(self, index: int) -> None:
+        with self._cond:
+            self._free.append(index)
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._ready)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def clear(self) -> None:
+        """Drop every committed frame. Slots that are currently being written or read are left alone."""
+        with self._cond:
+            while self._ready:
+                self._free.append(self._ready.popleft())
+
+    def close(self) -> None:
+        """Free a shared buffer. The ring must not be used afterwards."""
+        if self.shm is not None:
+            self.buffer = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "written": self.written,
+                "overwritten": self.overwritten,
+                "dropped": self.dropped,
+                "pending": len(self._ready),
+            }
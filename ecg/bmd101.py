@@ -2,10 +2,189 @@ import threading
 import serial
 import time
 
+import numpy as np
+
+from utils.timebase import ClockMapper, TimeBase
+
+
+SYNC = 0xAA
+MAX_PAYLOAD_LENGTH = 169
+SAMPLE_RATE = 512  # raw ECG samples per second
+RAW_PACKET_SIZE = 8  # 0xAA 0xAA 0x04 0x80 0x02 high low checksum
+
+
+def _parse_payload(payload) -> tuple:
+    """
+    Unpack the data rows of a packet payload.
+    :return: (heart_rate, raw_data); raw_data is None if the packet has no raw ECG row
+    """
+    i = 0
+    error_rate = 0
+    heart_rate = 0
+    raw_data = None
+
+    while i < len(payload):
+        byte_val = payload[i]
+        if byte_val == 0x02:
+            i += 1
+            if i < len(payload):
+                error_rate = payload[i]
+        elif byte_val == 0x03:
+            i += 1
+            if i < len(payload):
+                heart_rate = payload[i]
+            i += 14
+        elif byte_val == 0x80:
+            i += 1
+            if i < len(payload):
+                v_length = payload[i]
+                i += 1
+                raw_data = 0
+                # Big-endian value, sign-extended from 16 bits
+                for j in range(v_length):
+                    if i + v_length - j - 1 < len(payload):
+                        raw_data = raw_data | (payload[i + v_length - j - 1] << (8 * j))
+
+                if raw_data >= 32768:  # 0x8000
+                    raw_data = raw_data - 65536  # Convert to negative
+
+                i += v_length
+                continue
+        i += 1
+    return heart_rate, raw_data
+
+
+class BMD101Parser:
+    """
+    Incremental parser for the BMD101 byte stream.
+
+    Bytes are fed in whatever chunks the serial port delivers; complete packets
+    (0xAA 0xAA, length, payload, checksum) are taken out of an internal buffer and
+    bytes that do not start a packet are skipped until the next sync. A packet with a
+    bad checksum is dropped and parsing resumes right after its first sync byte, so a
+    corrupted length cannot swallow the packets behind it.
+
+    Every raw sample is timestamped from the sample clock: its count since the last reset
+    divided by sample_rate, mapped onto the time base of `t_read` by a ClockMapper. Bytes
+    skipped or dropped before a sample count as lost raw packets, so the count keeps up
+    with the sensor across corrupted stretches. The mapper treats the read time of the
+    latest sample as an upper bound of its arrival and follows the lower envelope of those
+    bounds, so the crystal's offset and drift against the host are estimated over a minute
+    of reads; what the lost-packet estimate misses is caught up within a second.
+    """
+    def __init__(self, sample_rate: float = SAMPLE_RATE, clock: ClockMapper = None) -> None:
+        self.sample_rate = sample_rate
+        self.clock = clock or ClockMapper(max_step=0.0015)
+        self.buffer = bytearray()
+        self.sample_index = 0
+        self.gap_bytes = 0  # bytes discarded since the last sample
+        self.heart_rate = 0
+        # counters
+        self.packets = 0
+        self.samples = 0
+        self.lost_samples = 0
+        self.sync_losses = 0
+        self.skipped_bytes = 0
+        self.checksum_failures = 0
+        self.length_errors = 0
+
+    def _skip(self, count: int) -> None:
+        if count > 0:
+            del self.buffer[:count]
+            self.skipped_bytes += count
+            self.gap_bytes += count
+            self.sync_losses += 1
+
+    def _packets(self):
+        """Yield the payload of every complete packet in the buffer."""
+        buffer = self.buffer
+        while True:
+            start = buffer.find(b"\xaa\xaa")
+            if start < 0:
+                # Keep a trailing 0xAA: it may be the first half of the next sync
+                self._skip(len(buffer) - 1 if buffer[-1:] == b"\xaa" else len(buffer))
+                return
+            self._skip(start)
+            # Extra 0xAA bytes before the length are part of the sync
+            position = 2
+            while position < len(buffer) and buffer[position] == SYNC:
+                position += 1
+            if position >= len(buffer):
+                return
+            length = buffer[position]
+            if length > MAX_PAYLOAD_LENGTH:
+                self.length_errors += 1
+                self._skip(1)
+                continue
+            end = position + 1 + length
+            if end >= len(buffer):
+                return  # wait for the rest of the packet
+            payload = bytes(buffer[position + 1:end])
+            if buffer[end] != (255 - (sum(payload) & 0xFF)) & 0xFF:
+                self.checksum_failures += 1
+                self._skip(1)
+                continue
+            del buffer[:end + 1]
+            self.packets += 1
+            yield payload
+
+    def feed(self, data: bytes, t_read: float) -> list:
+        """
+        Parse a chunk of the byte stream.
+        :param data: bytes read from the serial port
+        :param t_read: time at which the read returned
+        :return: [timestamp, raw_data] for every raw sample completed by this chunk
+        """
+        self.buffer += data
+        raws = []
+        indices = []
+        for payload in self._packets():
+            heart_rate, raw_data = _parse_payload(payload)
+            if heart_rate:
+                self.heart_rate = heart_rate
+            if raw_data is None:
+                continue
+            if self.gap_bytes:
+                lost = int(round(self.gap_bytes / RAW_PACKET_SIZE))
+                self.sample_index += lost
+                self.lost_samples += lost
+                self.gap_bytes = 0
+            raws.append(raw_data)
+            indices.append(self.sample_index)
+            self.sample_index += 1
+        if not raws:
+            return []
+        # Sample clock: device time of each sample from the packet count
+        device_times = np.array(indices) / self.sample_rate
+        self.clock.observe(device_times[-1], t_read)
+        self.samples += len(raws)
+        return [list(sample) for sample in zip(self.clock.map(device_times).tolist(), raws)]
+
+    def reset(self) -> None:
+        self.buffer.clear()
+        self.sample_index = 0
+        self.gap_bytes = 0
+        self.clock.reset()
+
+    def stats(self) -> dict:
+        return {
+            "packets": self.packets,
+            "samples": self.samples,
+            "lost_samples": self.lost_samples,
+            "sync_losses": self.sync_losses,
+            "skipped_bytes": self.skipped_bytes,
+            "checksum_failures": self.checksum_failures,
+            "length_errors": self.length_errors,
+            "clock": self.clock.stats(),
+        }
+
 
 class BMD101:
-    def __init__(self, serial_port):
+    def __init__(self, serial_port, timebase: TimeBase = None):
         # self.lock = threading.RLock()
+        # Timestamps are session times; the sample clock is registered with the time base as "ecg"
+        self.timebase = timebase or TimeBase()
+        self.parser = BMD101Parser(clock=self.timebase.clock("ecg", max_step=0.0015))
         try:
             self.serial_port = serial.Serial(
                 port=serial_port,
@@ -24,6 +203,16 @@ class BMD101:
         
     def flush_buffer(self):
         self.serial_port.reset_input_buffer()
+        self.parser.reset()
+
+    def read_samples(self) -> list:
+        """
+        Streaming read: take every byte already queued by the serial port (waiting up to
+        the port timeout for the first one) and parse it.
+        return value: list of [timestamp, raw_data], possibly empty
+        """
+        data = self.serial_port.read(max(1, self.serial_port.in_waiting))
+        return self.parser.feed(data, self.timebase.now())
 
     def read_data(self):
         """
@@ -53,7 +242,7 @@ class BMD101:
         while payload_length == 0xAA:
             payload_length = self.serial_port.read(1)[0]
 
-        if payload_length > 169:
+        if payload_length > MAX_PAYLOAD_LENGTH:
             # illegal
             return -1, None, None, None
 
@@ -74,49 +263,12 @@ class BMD101:
             # check
             return -1, None, None, None
 
-        # unpack payload
-        i = 0
-        big_packet = False
-        new_raw_data = False
-        error_rate = 0
-        heart_rate = 0
-        raw_data = 0
-
-        while i < len(payload_data):
-            byte_val = payload_data[i]
-            if byte_val == 0x02:
-                big_packet = True
-                i += 1
-                if i < len(payload_data):
-                    error_rate = payload_data[i]
-            elif byte_val == 0x03:
-                i += 1
-                if i < len(payload_data):
-                    heart_rate = payload_data[i]
-                i += 14
-            elif byte_val == 0x80:
-                new_raw_data = True
-                i += 1
-                if i < len(payload_data):
-                    v_length = payload_data[i]
-                    i += 1
-                    raw_data = 0
-                    # Use little-endian parsing
-                    for j in range(v_length):
-                        if i + v_length - j - 1 < len(payload_data):
-                            raw_data = raw_data | (payload_data[i + v_length - j - 1] << (8 * j))
-
-                    if raw_data >= 32768:  # 0x8000
-                        raw_data = raw_data - 65536  # Convert to negative
-                        
-                    i += v_length - 1  # Adjust index
-                    continue
-            i += 1
+        heart_rate, raw_data = _parse_payload(payload_data)
 
         # 在数据读取完成后生成时间戳
-        end_time = time.time()
+        end_time = self.timebase.now()
         
-        if new_raw_data == False:
-            return -1, heart_rate, raw_data, None
+        if raw_data is None:
+            return -1, heart_rate, 0, None
         else:
-            return 0, heart_rate, raw_data, end_time
\ No newline at end of file
+            return 0, heart_rate, raw_data, end_time
@@ -1,4 +1,5 @@
 from .bmd101 import BMD101
+from .publisher import ChunkPublisher
 import time
 from queue import Queue
 from .base import ECGBase
@@ -6,8 +7,14 @@ import global_vars
 
 class ECG(ECGBase):
     def __init__(self, config: dict) -> None:
-        self.bmd101 = BMD101(config["bmd101"]["serial_port"])
+        # Shared session clock (utils.timebase.TimeBase); the BMD101 creates its own if None
+        self.bmd101 = BMD101(config["bmd101"]["serial_port"], config.get("timebase"))
         self.max_queue_size = 512
+        # "stream": bulk reads through BMD101Parser; "packet": one packet per read (flushes the port each time)
+        self.mode = config["bmd101"].get("mode", "packet")
+        # Samples are published to the queues in chunks of `chunk_size` (0: one [timestamp, raw] item per sample)
+        self.chunk_size = config.get("chunk_size", 0)
+        self.chunk_latency = config.get("chunk_latency", 0.1)
 
     def read_bmd101(self) -> None:
         ret, heart_rate, raw_data, timestamp = self.bmd101.read_data()
@@ -15,15 +22,47 @@ class ECG(ECGBase):
             return [timestamp, raw_data]
         return None
 
-    def filter_data(self, raw_ecg_queue: Queue, filtered_ecg_queue) -> None:
-        # TODO: Implement filtering logic
-        pass
-
-    def __call__(self, raw_ecg_queue: Queue, monitor_ecg_queue: Queue) -> None:
+    def __call__(self, raw_ecg_queue: Queue, monitor_ecg_queue: Queue, processing_queue: Queue = None) -> None:
+        """
+        :param processing_queue: optional queue for the ECGProcessor stage; like the raw log queue
+                                 it receives every sample, since its filters need a gapless signal
+        """
         self.bmd101.flush_buffer()
+        queues = [q for q in (raw_ecg_queue, monitor_ecg_queue, processing_queue) if q is not None]
+        if self.chunk_size:
+            self.publish_chunks(raw_ecg_queue, monitor_ecg_queue, processing_queue)
+            return
+        if self.mode == "stream":
+            self.stream(queues)
+            return
         while global_vars.pipeline_running:
             ecg_data = self.read_bmd101()
             if ecg_data is not None:
-                raw_ecg_queue.put(ecg_data)
-                monitor_ecg_queue.put(ecg_data)
-            # TODO: self.filter_data(self.side_raw_queue, filtered_ecg_queue)
\ No newline at end of file
+                for q in queues:
+                    q.put(ecg_data)
+
+    def stream(self, queues: list) -> None:
+        while global_vars.pipeline_running:
+            for ecg_data in self.bmd101.read_samples():
+                for q in queues:
+                    q.put(ecg_data)
+        print(f"[ECG] Parser stats: {self.bmd101.parser.stats()}")
+
+    def publish_chunks(self, raw_ecg_queue: Queue, monitor_ecg_queue: Queue, processing_queue: Queue = None) -> None:
+        publisher = ChunkPublisher(self.chunk_size, self.chunk_latency)
+        # The logger and the processor must see every sample; the quality monitor can miss a chunk
+        publisher.subscribe(raw_ecg_queue)
+        publisher.subscribe(monitor_ecg_queue, drop_when_full=True)
+        if processing_queue is not None:
+            publisher.subscribe(processing_queue)
+        while global_vars.pipeline_running:
+            if self.mode == "stream":
+                publisher.extend(self.bmd101.read_samples())
+            else:
+                ecg_data = self.read_bmd101()
+                if ecg_data is not None:
+                    publisher.append(*ecg_data)
+        publisher.flush()
+        if self.mode == "stream":
+            print(f"[ECG] Parser stats: {self.bmd101.parser.stats()}")
+        print(f"[ECG] Publisher stats: {publisher.stats()}")
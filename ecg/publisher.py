@@ -0,0 +1,111 @@
+import time
+from queue import Queue, Full
+
+import numpy as np
+
+
+class ECGChunk:
+    """
+    A block of consecutive ECG samples: `timestamps` (float64 seconds) and `values` (int16).
+    The arrays are read-only and shared by every subscriber that receives the chunk.
+    """
+    __slots__ = ("timestamps", "values")
+
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        timestamps.flags.writeable = False
+        values.flags.writeable = False
+        self.timestamps = timestamps
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def rows(self) -> list:
+        """The samples as [timestamp, value] rows, e.g. for csv.writer."""
+        return list(zip(self.timestamps.tolist(), self.values.tolist()))
+
+
+class ChunkPublisher:
+    """
+    Collects ECG samples into fixed-size chunks and fans every chunk out to all subscribers,
+    so each consumer gets one queue item per `chunk_size` samples instead of one per sample.
+
+    A partly filled chunk is published anyway once its first sample is `max_latency` seconds
+    old (checked on every append), so slow sample rates do not stall the consumers.
+
+    Subscribers that must see every sample (the logger) block the publisher when their queue
+    is full; subscribers registered with `drop_when_full=True` (monitors) lose the chunk instead.
+    """
+    def __init__(self, chunk_size: int = 64, max_latency: float = 0.1) -> None:
+        self.chunk_size = chunk_size
+        self.max_latency = max_latency
+        self.subscribers = []
+        self._new_chunk()
+        # counters
+        self.published = 0
+        self.dropped = 0
+
+    def _new_chunk(self) -> None:
+        self.timestamps = np.empty(self.chunk_size, dtype=np.float64)
+        self.values = np.empty(self.chunk_size, dtype=np.int16)
+        self.count = 0
+        self.started = None
+
+    def subscribe(self, queue: Queue, drop_when_full: bool = False) -> None:
+        self.subscribers.append((queue, drop_when_full))
+
+    def append(self, timestamp: float, value: int) -> None:
+        if self.count == 0:
+            self.started = time.time()
+        self.timestamps[self.count] = timestamp
+        self.values[self.count] = value
+        self.count += 1
+        if self.count == self.chunk_size or time.time() - self.started >= self.max_latency:
+            self.flush()
+
+    def extend(self, samples: list) -> None:
+        """Append a list of [timestamp, value] samples."""
+        if not samples:
+            self.flush_if_stale()
+            return
+        timestamps, values = zip(*samples)
+        self.extend_arrays(np.asarray(timestamps, dtype=np.float64), np.asarray(values))
+
+    def extend_arrays(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        start = 0
+        while start < len(values):
+            if self.count == 0:
+                self.started = time.time()
+            n = min(self.chunk_size - self.count, len(values) - start)
+            self.timestamps[self.count:self.count + n] = timestamps[start:start + n]
+            self.values[self.count:self.count + n] = values[start:start + n]
+            self.count += n
+            start += n
+            if self.count == self.chunk_size:
+                self.flush()
+        self.flush_if_stale()
+
+    def flush_if_stale(self) -> None:
+        """Publish a partly filled chunk whose first sample is older than `max_latency`."""
+        if self.count and time.time() - self.started >= self.max_latency:
+            self.flush()
+
+    def flush(self) -> None:
+        """Publish the samples collected so far, if any."""
+        if not self.count:
+            return
+        chunk = ECGChunk(self.timestamps[:self.count], self.values[:self.count])
+        # Fresh arrays for the next chunk: the published ones now belong to the subscribers
+        self._new_chunk()
+        for queue, drop_when_full in self.subscribers:
+            if drop_when_full:
+                try:
+                    queue.put_nowait(chunk)
+                except Full:
+                    self.dropped += 1
+            else:
+                queue.put(chunk)
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {"published": self.published, "dropped": self.dropped}
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from utils.replay import ReplayClock
+from .ecg import ECG
+
+
+class ECGLogReader:
+    """
+    Stands in for the BMD101 reader: hands out the [timestamp, raw] samples of a recorded
+    `ecg_log.csv`, each block once it is due on the ReplayClock.
+
+    `read_samples` returns up to `block` samples per call, like a streaming serial read
+    (16 samples are about 31 ms at 512 Hz); `read_data` returns one sample per call.
+    Once the log is exhausted the reads return nothing and `done` is set.
+    """
+    def __init__(self, log_path: str, clock: ReplayClock, block: int = 16) -> None:
+        self.clock = clock
+        self.block = block
+        recorded = os.path.exists(log_path) and os.path.getsize(log_path) > 0
+        data = np.loadtxt(log_path, delimiter=",", ndmin=2) if recorded else np.empty((0, 2))
+        self.timestamps = data[:, 0].astype(np.float64)
+        self.values = data[:, 1].astype(np.int16)
+        if len(self.timestamps):
+            clock.register(float(self.timestamps[0]))
+        self.position = 0
+        self.done = threading.Event()
+
+    @property
+    def parser(self):
+        # The ECG stage prints `bmd101.parser.stats()` in stream mode
+        return self
+
+    def flush_buffer(self) -> None:
+        """Called by the ECG stage at start: play the log from its first sample again."""
+        self.position = 0
+        self.done.clear()
+
+    def _take(self, count: int):
+        start = self.position
+        end = min(start + count, len(self.values))
+        if start == end:
+            self.done.set()
+            time.sleep(0.05)  # as a serial read timing out
+            return None
+        if self.clock.wait(float(self.timestamps[end - 1])) is None:
+            return None
+        self.position = end
+        return start, end
+
+    def read_samples(self) -> list:
+        """:return: list of [timestamp, raw_data], possibly empty"""
+        taken = self._take(self.block)
+        if taken is None:
+            return []
+        start, end = taken
+        return [list(sample) for sample in zip(self.timestamps[start:end].tolist(), self.values[start:end].tolist())]
+
+    def read_data(self):
+        """:return: (ret, heart_rate, raw_data, timestamp) as BMD101.read_data; ret is -1 past the end"""
+        taken = self._take(1)
+        if taken is None:
+            return -1, None, None, None
+        return 0, None, int(self.values[taken[0]]), float(self.timestamps[taken[0]])
+
+    @property
+    def played(self):
+        """:return: timestamp of the last sample handed out, or None"""
+        return float(self.timestamps[self.position - 1]) if self.position else None
+
+    def stats(self) -> dict:
+        return {"samples": int(self.position), "total": len(self.values)}
+
+
+class ReplayECG(ECG):
+    """
+    The ECG stage fed from a recorded session instead of the BMD101: the same publishing
+    paths (per sample or in ChunkPublisher chunks) and queues, with `ecg_log.csv` as source.
+
+    config:
+      - "log_path": the recorded `ecg_log.csv` (a missing or empty log replays no samples)
+      - "block": samples per streaming read (default 16)
+      - "mode", "chunk_size", "chunk_latency": as for ECG ("mode" defaults to "stream")
+    """
+    def __init__(self, config: dict, clock: ReplayClock) -> None:
+        self.bmd101 = ECGLogReader(config["log_path"], clock, config.get("block", 16))
+        self.max_queue_size = 512
+        self.mode = config.get("mode", "stream")
+        self.chunk_size = config.get("chunk_size", 0)
+        self.chunk_latency = config.get("chunk_latency", 0.1)
+
+    @property
+    def done(self) -> threading.Event:
+        return self.bmd101.done
@@ -0,0 +1,172 @@
+"""
+Columnar binary session logs: an append-only directory per log with one raw little-endian
+file per typed column and a `schema.json`, e.g. `ecg_log.cols/`:
+
+    schema.json       {"version": 1, "columns": [{"name": "timestamp", "dtype": "<f8"}, ...]}
+    timestamp.bin     float64 session timestamps
+    value.bin         int16 ECG samples (float32 for rPPG)
+
+Rows are appended in chunks (ColumnWriter), so a column file only ever grows; the row count
+is the shortest column, which also holds after a crash mid-chunk. ColumnReader maps the
+columns with np.memmap, and `to_csv` exports the rows in DataLogger's CSV format on demand:
+    python -m log.columnar export data/patient_000001/ecg_log.cols [ecg_log.csv]
+    python -m log.columnar info data/patient_000001/ecg_log.cols
+"""
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+SCHEMA = "schema.json"
+VERSION = 1
+# Column layouts of the pipeline's logs
+ECG_COLUMNS = [("timestamp", "<f8"), ("value", "<i2")]
+RPPG_COLUMNS = [("timestamp", "<f8"), ("value", "<f4")]
+RPEAK_COLUMNS = [("timestamp", "<f8"), ("rr", "<f8"), ("hr", "<f8")]
+
+
+def store_path(log_path: str) -> str:
+    """:return: the columnar store next to a CSV log path (ecg_log.csv -> ecg_log.cols)"""
+    return os.path.splitext(log_path)[0] + ".cols"
+
+
+class ColumnWriter:
+    """
+    Appends rows to a columnar store, `chunk_rows` rows at a time per column file.
+    The store is created empty (an existing one is replaced), like DataLogger's CSV.
+    """
+    def __init__(self, path: str, columns: list, chunk_rows: int = 4096) -> None:
+        self.path = path
+        self.names = [name for name, _ in columns]
+        self.dtypes = [np.dtype(dtype) for _, dtype in columns]
+        self.chunk_rows = chunk_rows
+        self.chunks = [np.empty(chunk_rows, dtype=dtype) for dtype in self.dtypes]
+        self.filled = 0
+        self.rows = 0
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith(".bin"):
+                os.remove(os.path.join(path, name))
+        with open(os.path.join(path, SCHEMA), "w") as f:
+            json.dump({"version": VERSION, "columns": [{"name": name, "dtype": dtype.str}
+                                                       for name, dtype in zip(self.names, self.dtypes)]}, f)
+        self.files = [open(os.path.join(path, f"{name}.bin"), "ab") for name in self.names]
+
+    def append(self, rows) -> None:
+        """Append rows ([timestamp, values...] sequences)."""
+        if not len(rows):
+            return
+        table = np.asarray(rows, dtype=np.float64)
+        self.append_columns(*(table[:, i] for i in range(len(self.names))))
+
+    def append_columns(self, *columns) -> None:
+        """Append one array per column, all of the same length."""
+        count = len(columns[0])
+        start = 0
+        while start < count:
+            take = min(count - start, self.chunk_rows - self.filled)
+            for chunk, column in zip(self.chunks, columns):
+                chunk[self.filled:self.filled + take] = column[start:start + take]
+            self.filled += take
+            start += take
+            if self.filled == self.chunk_rows:
+                self._write_chunk()
+        self.rows += count
+
+    def _write_chunk(self) -> None:
+        for chunk, f in zip(self.chunks, self.files):
+            chunk[:self.filled].tofile(f)
+        self.filled = 0
+
+    def flush(self) -> None:
+        """Write the partial chunk and flush the files, e.g. at every DataLogger flush."""
+        if self.files is None:
+            return
+        if self.filled:
+            self._write_chunk()
+        for f in self.files:
+            f.flush()
+
+    def sync(self) -> None:
+        """Flush, then force the column files to the storage (os.fsync)."""
+        self.flush()
+        for f in self.files or ():
+            os.fsync(f.fileno())
+
+    def close(self) -> None:
+        if self.files is None:
+            return
+        self.flush()
+        for f in self.files:
+            f.close()
+        self.files = None
+
+
+class ColumnReader:
+    """Reads a columnar store; columns are read-only memory maps."""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(os.path.join(path, SCHEMA)) as f:
+            schema = json.load(f)
+        if schema.get("version") != VERSION:
+            raise ValueError(f"Unsupported columnar store version {schema.get('version')} in {path}")
+        self.names = [column["name"] for column in schema["columns"]]
+        self.dtypes = [np.dtype(column["dtype"]) for column in schema["columns"]]
+        sizes = [os.path.getsize(os.path.join(path, f"{name}.bin")) // dtype.itemsize
+                 for name, dtype in zip(self.names, self.dtypes)]
+        self.rows = min(sizes, default=0)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        dtype = self.dtypes[self.names.index(name)]
+        if not self.rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, f"{name}.bin"), dtype=dtype, mode="r", shape=(self.rows,))
+
+    def read(self) -> dict:
+        """:return: every column as an in-memory array"""
+        return {name: np.array(self[name]) for name in self.names}
+
+    def iter_chunks(self, chunk_rows: int = 65536):
+        """:return: generator of lists of column arrays, `chunk_rows` rows each"""
+        columns = [self[name] for name in self.names]
+        for start in range(0, self.rows, chunk_rows):
+            yield [column[start:start + chunk_rows] for column in columns]
+
+    def to_csv(self, out_path: str, chunk_rows: int = 65536) -> int:
+        """
+        Export the rows in DataLogger's CSV format: float64 and integer columns read back exactly as
+        logged, float32 columns are written with their shortest float32 representation.
+        :return: rows written
+        """
+        with open(out_path, "w", newline="", buffering=1 << 20) as f:
+            writer = csv.writer(f)
+            for chunk in self.iter_chunks(chunk_rows):
+                writer.writerows(zip(*(column.astype(str).tolist() if column.dtype == np.float32 else column.tolist()
+                                       for column in chunk)))
+        return self.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or export a columnar session log")
+    parser.add_argument("command", choices=("info", "export"))
+    parser.add_argument("store", help="columnar log directory, e.g. ecg_log.cols")
+    parser.add_argument("output", nargs="?", help="CSV path for export (default: the store name with .csv)")
+    args = parser.parse_args()
+    reader = ColumnReader(args.store)
+    if args.command == "info":
+        size = sum(os.path.getsize(os.path.join(args.store, f"{name}.bin")) for name in reader.names)
+        columns = ", ".join(f"{name} {dtype}" for name, dtype in zip(reader.names, reader.dtypes))
+        print(f"[Columnar] {args.store}: {reader.rows} rows ({columns}), {size} bytes")
+        return
+    output = args.output or os.path.splitext(os.path.normpath(args.store))[0] + ".csv"
+    rows = reader.to_csv(output)
+    print(f"[Columnar] Exported {rows} rows to {output}")
+
+
+if __name__ == "__main__":
+    main()
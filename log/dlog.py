@@ -1,11 +1,27 @@
 import threading
 import csv
-from queue import Queue
+import os
+from queue import Empty
 import global_vars
 import time
-from io import StringIO
+from log.columnar import ColumnReader, ColumnWriter, store_path
+
+# Longest wait on the queue, so that the thread notices the end of the pipeline
+STOP_POLL = 0.1
 
 class DataLogger():
+    """
+    Logs the rows of a queue from its own thread, as CSV or as a columnar store.
+
+    The thread blocks on the queue and drains what has piled up behind the first item, up to
+    `batch_size` items, so an idle logger does not poll. Rows are written in batches to one file
+    handle kept open for the session; the file is flushed to the OS every `flush_interval`
+    seconds (when the rows are also handed to `row_sink`), and synced to the storage with fsync
+    every `fsync_interval` seconds: shorter loses fewer rows on a power cut, longer writes the
+    SD card less often; None leaves the write-back to the OS. At the end of the pipeline the
+    queue is drained (after the `producers` threads have ended) and the file synced and closed.
+    `stats()` gives the counters.
+    """
     def __init__(self, config: dict) -> None:
         self.config = config
         self.file_path = config["log_path"]
@@ -13,62 +29,166 @@ class DataLogger():
         self.lock = threading.Lock()
         self.batch_size = config.get("batch_size", 100)  # Default batch size
         self.flush_interval = config.get("flush_interval", 1.0)  # Seconds
-        self.last_flush_time = time.time()
+        self.fsync_interval = config.get("fsync_interval")  # Seconds, None: no fsync
+        # Optional callable given every batch of rows written, e.g. OnlineMerger.add
+        self.row_sink = config.get("row_sink")
+        # Threads filling the queue that keep working after the pipeline stops (e.g. the ECG
+        # processing draining its input); the logger drains the queue once they have ended
+        self.producers = config.get("producers", [])
+        self.last_flush_time = time.monotonic()
+        self.last_fsync_time = self.last_flush_time
         self.buffer = []
-        with open(self.file_path, 'w'):
+        self.unflushed = 0  # rows written since the last flush
+        # "csv": text rows in log_path; "columnar": typed column files in log_path's .cols store
+        # (log.columnar), with "columns" as [(name, dtype), ...]
+        self.format = config.get("format", "csv")
+        self.store = None
+        # The CSV file is opened at the first write and kept open until close
+        self.file = None
+        self.writer = None
+        if self.format == "columnar":
+            self.store = ColumnWriter(store_path(self.file_path), config["columns"])
+        else:
+            with open(self.file_path, 'w'):
+                pass
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.start_time = time.monotonic()
+        self.rows_written = 0
+        self.max_queue_depth = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.fsyncs = 0
+        self.max_fsync_seconds = 0.0
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.start_time
+        return {
+            "rows": self.rows_written,
+            "rows_per_second": self.rows_written / elapsed if elapsed > 0 else 0.0,
+            "queue_depth": self.data_queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "flushes": self.flushes,
+            "flush_ms_mean": self.flush_seconds / self.flushes * 1e3 if self.flushes else 0.0,
+            "flush_ms_max": self.max_flush_seconds * 1e3,
+            "fsyncs": self.fsyncs,
+            "fsync_ms_max": self.max_fsync_seconds * 1e3,
+        }
+
+    # log the queued data in batches
+    def data_log(self, timeout: float = 0.0) -> int:
+        """
+        Take the next item, waiting up to `timeout` seconds for it, and the items queued behind it
+        up to `batch_size`; write the rows when a batch is full, flush when the interval has passed.
+        :return: number of items taken
+        """
+        self.max_queue_depth = max(self.max_queue_depth, self.data_queue.qsize())
+        taken = 0
+        try:
+            data = self.data_queue.get(timeout=timeout) if timeout > 0 else self.data_queue.get_nowait()
+            while True:
+                # Chunked items (e.g. ECGChunk) are expanded into rows
+                if hasattr(data, "rows"):
+                    self.buffer.extend(data.rows())
+                else:
+                    self.buffer.append(data)
+                taken += 1
+                if taken >= self.batch_size:
+                    break
+                data = self.data_queue.get_nowait()
+        except Empty:
             pass
 
-    # log data to a CSV file in batches
-    def data_log(self) -> None:
-        # Collect data from queue without holding the file lock
-        batch_data = []
-        while not self.data_queue.empty() and len(batch_data) < self.batch_size:
-            try:
-                data = self.data_queue.get(block=False)
-                batch_data.append(data)
-                self.data_queue.task_done()
-            except:
-                break
-        
-        if not batch_data:
-            return
-            
-        # Append to internal buffer
-        self.buffer.extend(batch_data)
-        
-        # Determine if we should flush based on buffer size or time
-        current_time = time.time()
-        should_flush = (len(self.buffer) >= self.batch_size or 
-                        (current_time - self.last_flush_time) >= self.flush_interval)
-        
-        if should_flush:
+        if len(self.buffer) >= self.batch_size:
             self._flush_buffer()
-    
+        # Rows buffered before the input went idle are written after the flush interval too
+        if time.monotonic() - self.last_flush_time >= self.flush_interval:
+            self.flush()
+        return taken
+
+    def _open(self):
+        if self.writer is None:
+            self.file = open(self.file_path, 'a', newline='', buffering=1 << 16)
+            self.writer = csv.writer(self.file)
+        return self.writer
+
     def _flush_buffer(self) -> None:
+        """Write the buffered rows to the file (or store) buffers and hand them over."""
         if not self.buffer:
             return
-            
-        # Use StringIO for in-memory buffer before writing to disk
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerows(self.buffer)
-        
-        # Only lock when actually writing to file
         with self.lock:
-            with open(self.file_path, 'a', newline='', buffering=8192) as csvfile:
-                csvfile.write(output.getvalue())
-        
+            if self.store is not None:
+                self.store.append(self.buffer)
+            else:
+                self._open().writerows(self.buffer)
+        self.rows_written += len(self.buffer)
+        self.unflushed += len(self.buffer)
+        if self.row_sink is not None:
+            self.row_sink(self.buffer)
         self.buffer = []
-        self.last_flush_time = time.time()
+
+    def flush(self, sync: bool = False) -> None:
+        """Write the buffered rows and flush the file to the OS; fsync when due (or `sync`)."""
+        start = time.monotonic()
+        self._flush_buffer()
+        if not self.unflushed and not sync:
+            self.last_flush_time = start
+            return
+        self.unflushed = 0
+        fsync = self.fsync_interval is not None and (sync or start - self.last_fsync_time >= self.fsync_interval)
+        with self.lock:
+            if self.store is not None:
+                self.store.flush()
+            elif self.file is not None:
+                self.file.flush()
+            if fsync:
+                synced = time.monotonic()
+                if self.store is not None:
+                    self.store.sync()
+                elif self.file is not None:
+                    os.fsync(self.file.fileno())
+                self.fsyncs += 1
+                self.max_fsync_seconds = max(self.max_fsync_seconds, time.monotonic() - synced)
+        self.last_flush_time = time.monotonic()
+        if fsync:
+            self.last_fsync_time = self.last_flush_time
+        self.flushes += 1
+        self.flush_seconds += self.last_flush_time - start
+        self.max_flush_seconds = max(self.max_flush_seconds, self.last_flush_time - start)
+
+    def close(self) -> None:
+        """Write the remaining rows, fsync them if an fsync interval is set, and close the file."""
+        self.flush(sync=True)
+        with self.lock:
+            if self.store is not None:
+                self.store.close()
+            elif self.file is not None:
+                self.file.close()
+                self.file = None
+                self.writer = None
+
+    def export_csv(self) -> None:
+        """Write the columnar store out as the CSV log, for consumers of the text logs (FileMerger)."""
+        if self.store is None:
+            return
+        with self.lock:
+            self.store.flush()
+            rows = ColumnReader(self.store.path).to_csv(self.file_path)
+        print(f"[DataLogger] Exported {rows} rows to {self.file_path}")
 
     def __call__(self) -> None:
+        self.reset_stats()
         try:
-            while global_vars.pipeline_running or not self.data_queue.empty():
-                self.data_log()
-                # Small sleep to prevent CPU thrashing if queue is empty
-                if self.data_queue.empty():
-                    time.sleep(0.01)
+            while global_vars.pipeline_running or any(thread.is_alive() for thread in self.producers):
+                # Wake up for the next flush at the latest
+                wait = self.last_flush_time + self.flush_interval - time.monotonic()
+                self.data_log(timeout=min(max(wait, 0.001), STOP_POLL))
+            # Drain what is left once the pipeline stops
+            while self.data_log():
+                pass
         finally:
             # Ensure remaining data is written when thread exits
-            if self.buffer:
-                self._flush_buffer()
+            self.close()
+            print(f"[DataLogger] {self.file_path} stats: {self.stats()}")
@@ -1,14 +1,39 @@
+import collections
 import csv
+import functools
 import heapq
+import itertools
 import os
+import threading
+import time
 
 class FileMerger:
-    def __init__(self, input_files: list, output_path: str) -> None:
+    """
+    Merges CSV logs of [timestamp, values...] rows into one timeline: every output row is the
+    timestamp of one input row followed by the latest values of every input (0 before its first row).
+
+    mode:
+      - "stream" (default): lazy per-file readers, parsed `chunk_size` bytes at a time, merged
+        with heapq.merge and written in batches; memory stays constant with the session length.
+        The inputs must be sorted by timestamp, as DataLogger appends them; rows going back in
+        time are counted and reported.
+      - "heap": loads every row and heap-sorts them all, for inputs that are not sorted.
+    """
+    def __init__(self, input_files: list, output_path: str, mode: str = "stream", chunk_size: int = 1 << 20,
+                 write_batch: int = 4096) -> None:
+        if mode not in ("stream", "heap"):
+            raise ValueError(f"Unknown merge mode: {mode}")
         self.input_files = input_files
         self.output_path = output_path
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.write_batch = write_batch
         self.heap = []
         self.last_values = [None] * len(self.input_files)
         self.max_values_length = 0  # 记录最大的values长度
+        self.row_counts = [0] * len(self.input_files)
+        self.out_of_order = 0
+        self.rows_written = 0
         with open(self.output_path, 'w'):
             pass
 
@@ -86,21 +111,218 @@ class FileMerger:
                     writer.writerow(row)
                     row_count += 1
                 
+                self.rows_written = row_count
                 print(f"[FileMerger] Successfully wrote {row_count} rows to {self.output_path}")
         except Exception as e:
             print(f"[FileMerger] Error writing CSV: {e}")
             raise
 
+    def read_rows(self, idx: int, file: str):
+        """
+        Lazily parse one input, `chunk_size` bytes of lines at a time.
+        :return: generator of (timestamp, idx, values)
+        """
+        last_timestamp = None
+        with open(file, 'r', newline='') as f:
+            while True:
+                lines = f.readlines(self.chunk_size)
+                if not lines:
+                    break
+                for row in csv.reader(lines):
+                    if len(row) < 2:  # 至少需要timestamp和一个值
+                        print(f"[FileMerger] Skipping invalid row in {file}: {row}")
+                        continue
+                    try:
+                        timestamp = float(row[0])
+                        values = [float(x) for x in row[1:]]
+                    except ValueError:
+                        print(f"[FileMerger] Skipping invalid row in {file}: {row}")
+                        continue
+                    if last_timestamp is not None and timestamp < last_timestamp:
+                        self.out_of_order += 1
+                    last_timestamp = timestamp
+                    self.row_counts[idx] += 1
+                    yield timestamp, idx, values
+
+    def open_readers(self) -> list:
+        """
+        Open a reader per existing input and peek at its first row, which sets the padding width.
+        :return: the readers, each starting again with its first row
+        """
+        readers = []
+        for idx, file in enumerate(self.input_files):
+            if not os.path.exists(file):
+                print(f"[FileMerger] Warning: File does not exist: {file}")
+                continue
+            print(f"[FileMerger] Streaming {file} (size: {os.path.getsize(file)} bytes)")
+            reader = self.read_rows(idx, file)
+            first = next(reader, None)
+            if first is None:
+                print(f"[FileMerger] Warning: No valid rows in {file}")
+                continue
+            self.max_values_length = max(self.max_values_length, len(first[2]))
+            readers.append(itertools.chain([first], reader))
+        return readers
+
+    def merge_stream(self) -> None:
+        """Merge the sorted inputs row by row with bounded memory (see the class docstring)."""
+        readers = self.open_readers()
+        if not readers:
+            print(f"[FileMerger] No data to write")
+            return
+        # Inputs without a row yet are padded with zeros of the widest first row
+        self.last_values = [[0] * self.max_values_length for _ in self.input_files]
+        batch = []
+        with open(self.output_path, 'a', newline='', buffering=self.chunk_size) as f:
+            writer = csv.writer(f)
+            # (timestamp, idx, values): equal timestamps keep the order of the inputs, as in the heap mode
+            for timestamp, idx, values in heapq.merge(*readers):
+                self.last_values[idx] = values
+                row = [timestamp]
+                for vals in self.last_values:
+                    row.extend(vals)
+                batch.append(row)
+                if len(batch) >= self.write_batch:
+                    writer.writerows(batch)
+                    self.rows_written += len(batch)
+                    batch.clear()
+            writer.writerows(batch)
+            self.rows_written += len(batch)
+        for idx, count in enumerate(self.row_counts):
+            print(f"[FileMerger] Loaded {count} rows from {self.input_files[idx]}")
+        if self.out_of_order:
+            print(f"[FileMerger] Warning: {self.out_of_order} rows went back in time; "
+                  f"the merge is only ordered for sorted inputs (use mode=\"heap\")")
+        print(f"[FileMerger] Successfully wrote {self.rows_written} rows to {self.output_path}")
+
     def __call__(self) -> None:
         print(f"[FileMerger] Merging files: {self.input_files}")
         print(f"[FileMerger] Output path: {self.output_path}")
         
         try:
-            self.load_csv()
-            self.write_csv()
+            if self.mode == "stream":
+                self.merge_stream()
+            else:
+                self.load_csv()
+                self.write_csv()
             print(f"[FileMerger] Successfully merged {len(self.input_files)} files into {self.output_path}")
         except Exception as e:
             print(f"[FileMerger] Error during merge process: {e}")
             import traceback
             traceback.print_exc()
             raise
+
+
+def logged_value(value) -> float:
+    """A value as it reads back from a DataLogger CSV (numpy scalars such as float16 are written with str)."""
+    return float(value) if isinstance(value, (float, int)) else float(str(value))
+
+
+class OnlineMerger:
+    """
+    FileMerger's merge done while capturing: the DataLoggers hand their rows over as they flush
+    them (`add`, used as their "row_sink"), and rows are written to `output_path` as soon as no
+    input can still deliver an earlier one, in the same format as FileMerger.
+
+    A row is ready once every input has logged up to its timestamp, so the rows held back are
+    those of the input running ahead. An input that has not logged anything for `idle_timeout`
+    seconds, e.g. the rPPG while no face is found or an ECG that is not connected, no longer
+    holds the others back; rows it logs later than the ones already written are still written,
+    out of order, and counted in `late_rows`.
+
+    Ready rows are optionally fed to an OnlineNormalizer. `finish` writes the rows still
+    pending; a later run of the pipeline appends to the same merged log, as FileMerger over the
+    appended logs would.
+    """
+    def __init__(self, input_files: list, output_path: str, normalizer=None, idle_timeout: float = 5.0,
+                 widths: list = None) -> None:
+        self.input_files = input_files
+        self.output_path = output_path
+        self.normalizer = normalizer
+        self.idle_timeout = idle_timeout
+        # Values per row of each input, for the zero padding before its first row
+        self.widths = widths or [1] * len(input_files)
+        self.lock = threading.Lock()
+        self.pending = [collections.deque() for _ in input_files]
+        self.latest = [None] * len(input_files)
+        # Host monotonic time of the last rows of each input (of the first rows of any input before)
+        self.last_seen = [None] * len(input_files)
+        self.last_values = [[0] * max(self.widths) for _ in input_files]
+        self.last_written = None
+        self.late_rows = 0
+        self.rows_written = 0
+        self.file = None
+        self.writer = None
+        with open(self.output_path, 'w'):
+            pass
+
+    def sink(self, path: str):
+        """:return: the row sink for the DataLogger writing `path`"""
+        return functools.partial(self.add, self.input_files.index(path))
+
+    def add(self, idx: int, rows: list) -> None:
+        """Take rows ([timestamp, values...]) logged for input `idx` and write the ones that are ready."""
+        with self.lock:
+            now = time.monotonic()
+            self.last_seen = [now if i == idx or seen is None else seen for i, seen in enumerate(self.last_seen)]
+            pending = self.pending[idx]
+            for row in rows:
+                timestamp = logged_value(row[0])
+                pending.append((timestamp, [logged_value(x) for x in row[1:]]))
+                if self.latest[idx] is None or timestamp > self.latest[idx]:
+                    self.latest[idx] = timestamp
+            self._write(self._watermark(now))
+
+    def _watermark(self, now: float):
+        """:return: timestamp up to which every input still logging has logged, None while one has not started"""
+        active = [latest for latest, seen in zip(self.latest, self.last_seen) if now - seen < self.idle_timeout]
+        if any(latest is None for latest in active):
+            return None
+        return min(active, default=None)
+
+    def _write(self, watermark) -> None:
+        if watermark is None:
+            return
+        batch = []
+        while True:
+            # The earliest pending row; equal timestamps keep the order of the inputs, as in FileMerger
+            idx = min((i for i, pending in enumerate(self.pending) if pending),
+                      key=lambda i: self.pending[i][0][0], default=None)
+            if idx is None or self.pending[idx][0][0] > watermark:
+                break
+            timestamp, values = self.pending[idx].popleft()
+            if self.last_written is not None and timestamp < self.last_written:
+                self.late_rows += 1
+            else:
+                self.last_written = timestamp
+            self.last_values[idx] = values
+            row = [timestamp]
+            for vals in self.last_values:
+                row.extend(vals)
+            batch.append(row)
+        if not batch:
+            return
+        if self.file is None:
+            self.file = open(self.output_path, 'a', newline='', buffering=1 << 16)
+            self.writer = csv.writer(self.file)
+        self.writer.writerows(batch)
+        self.rows_written += len(batch)
+        if self.normalizer is not None:
+            self.normalizer.update([row[1:] for row in batch])
+
+    def finish(self) -> None:
+        """Write every pending row and close the merged log."""
+        with self.lock:
+            self._write(float("inf"))
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                self.writer = None
+        if self.late_rows:
+            print(f"[OnlineMerger] Warning: {self.late_rows} rows were logged after later rows of an idle "
+                  f"input had been written, and were written out of order")
+        print(f"[OnlineMerger] {self.rows_written} rows merged into {self.output_path}")
+
+    def __call__(self) -> None:
+        # Called at stop like FileMerger; the rows are already merged
+        self.finish()
@@ -1,29 +1,226 @@
-import pandas as pd
+import json
+import os
+
+import numpy as np
+
+MODES = ("zscore", "robust", "window")
+
+
+def read_chunks(path: str, chunk_bytes: int = 1 << 22):
+    """
+    Parse a numeric CSV (no header) about `chunk_bytes` of lines at a time.
+    :return: generator of (rows, columns) float64 arrays
+    """
+    with open(path, 'r') as f:
+        while True:
+            lines = f.readlines(chunk_bytes)
+            if not lines:
+                break
+            yield np.loadtxt(lines, delimiter=",", dtype=np.float64, ndmin=2)
+
+
+def write_rows(f, table: np.ndarray, slice_rows: int = 8192) -> None:
+    """
+    Write float rows like pandas' to_csv: shortest round-trip repr, NaN as an empty field, "\n" line ends.
+    Formatted `slice_rows` at a time, as the text takes several times the memory of the floats.
+    """
+    for start in range(0, len(table), slice_rows):
+        part = table[start:start + slice_rows]
+        text = part.astype(str)
+        nan = np.isnan(part)
+        if nan.any():
+            text[nan] = ""
+        f.write("\n".join(map(",".join, text.tolist())) + "\n")
+
+
+class RunningStats:
+    """Per-column mean and sample variance, updated batch by batch (Welford, batches combined as in Chan et al.)."""
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, values: np.ndarray) -> None:
+        if not len(values):
+            return
+        count = len(values)
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+        if self.mean is None:
+            self.count, self.mean, self.m2 = count, mean, m2
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def std(self) -> np.ndarray:
+        """:return: standard deviation with ddof=1 like pandas, NaN below two rows"""
+        if self.count < 2:
+            return np.full_like(self.mean, np.nan)
+        return np.sqrt(self.m2 / (self.count - 1))
+
 
 class Normalizer:
-    def __init__(self, rawpath: str, outpath: str) -> None:
+    """
+    Standardizes every column of the merged log except the timestamp and writes the result
+    (with a "0,1,2..." header, as the pandas implementation did).
+
+    The CSV is parsed once, in chunks, into a binary float64 file next to the output, read
+    back through a memory map; every chunk is standardized in place and written out, so the
+    memory use does not grow with the session length.
+
+    mode:
+      - "zscore" (default): (x - mean) / std over the session, std with ddof=1
+      - "robust": (x - median) / IQR over the session, for logs with motion or contact spikes
+      - "window": z-score within consecutive windows of `window` seconds of the timestamps
+    A column without spread (std or IQR 0) becomes empty fields (NaN).
+    """
+    def __init__(self, rawpath: str, outpath: str, mode: str = "zscore", window: float = 10.0,
+                 chunk_rows: int = 65536) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown normalization mode: {mode}")
         self.rawpath = rawpath
         self.outpath = outpath
+        self.mode = mode
+        self.window = window
+        self.chunk_rows = chunk_rows
+        self.data_path = outpath + ".f8"
         self.data = None
+        self.stats = None
 
     def load(self):
-        # Load CSV file
-        self.data = pd.read_csv(self.rawpath, header=None)
+        """Parse the CSV into the binary file (and the running z-score statistics) and map it."""
+        self.stats = RunningStats()
+        rows, columns = 0, None
+        with open(self.data_path, 'wb') as f:
+            for table in read_chunks(self.rawpath):
+                if columns is not None and table.shape[1] != columns:
+                    raise ValueError(f"Inconsistent column count in {self.rawpath}")
+                columns = table.shape[1]
+                table.tofile(f)
+                self.stats.update(table[:, 1:])
+                rows += len(table)
+        if not rows:
+            raise ValueError(f"No data to normalize in {self.rawpath}")
+        self.data = np.memmap(self.data_path, dtype=np.float64, mode="r", shape=(rows, columns))
+
+    def factors(self) -> tuple:
+        """:return: (center, scale) per value column for the "zscore" and "robust" modes"""
+        if self.mode == "zscore":
+            return self.stats.mean, self.stats.std()
+        # One column in memory at a time
+        center, scale = [], []
+        for i in range(1, self.data.shape[1]):
+            q25, median, q75 = np.percentile(np.array(self.data[:, i]), [25, 50, 75])
+            center.append(median)
+            scale.append(q75 - q25)
+        return np.array(center), np.array(scale)
 
-    def normalize(self):
-        # Perform standard deviation normalization on all columns except the first
+    def blocks(self):
+        """:return: generator of (start, stop, center, scale) row ranges to standardize"""
+        if self.mode != "window":
+            center, scale = self.factors()
+            for start in range(0, len(self.data), self.chunk_rows):
+                yield start, min(start + self.chunk_rows, len(self.data)), center, scale
+            return
+        timestamps = self.data[:, 0]
+        start = 0
+        while start < len(self.data):
+            stop = max(int(np.searchsorted(timestamps, timestamps[start] + self.window, side="left")), start + 1)
+            stats = RunningStats()
+            stats.update(np.array(self.data[start:stop, 1:]))
+            yield start, stop, stats.mean, stats.std()
+            start = stop
+
+    def normalize(self, f) -> None:
+        """Standardize the mapped rows block by block and write them."""
         if self.data is None:
             raise ValueError("Please load data first")
-        first_col = self.data.iloc[:, 0]
-        rest = self.data.iloc[:, 1:]
-        normalized = (rest - rest.mean()) / rest.std()
-        self.data = pd.concat([first_col, normalized], axis=1)
+        for start, stop, center, scale in self.blocks():
+            block = np.array(self.data[start:stop])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                np.subtract(block[:, 1:], center, out=block[:, 1:])
+                np.divide(block[:, 1:], scale, out=block[:, 1:])
+            write_rows(f, block)
 
     def __call__(self):
-        # Save the normalized data to a new CSV file
-        self.load()
-        self.normalize()
-        if self.data is None:
-            raise ValueError("No data to save")
-        self.data.to_csv(self.outpath, index=False)
-        print(f"[Normalizer] Normalized data saved to {self.outpath}")
\ No newline at end of file
+        try:
+            self.load()
+            with open(self.outpath, 'w', newline='', buffering=1 << 20) as f:
+                f.write(",".join(map(str, range(self.data.shape[1]))) + "\n")
+                self.normalize(f)
+        finally:
+            self.data = None
+            if os.path.exists(self.data_path):
+                os.remove(self.data_path)
+        print(f"[Normalizer] Normalized data saved to {self.outpath} ({self.mode})")
+
+
+class OnlineNormalizer:
+    """
+    Normalizer with running statistics: the merged rows are fed while capturing (`update`, by
+    OnlineMerger), and the per-column mean and sample standard deviation are kept with Welford's
+    method, batches combined as in Chan et al. At stop (`__call__`) the scale factors are written
+    to `factors_path` as JSON (labelled with their mode, "zscore"), and, if `rescale` is set,
+    `normalized_log.csv` in one chunked pass over the merged log, in Normalizer's format; without
+    it the stop does not depend on the session length and the factors stand in for the normalized
+    log. The running statistics are z-score factors only: in the other Normalizer modes ("robust",
+    "window") no factors are written and the normalized log is always left to Normalizer.
+    """
+    def __init__(self, rawpath: str, outpath: str, factors_path: str = None, rescale: bool = True,
+                 mode: str = "zscore") -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown normalization mode: {mode}")
+        self.rawpath = rawpath
+        self.outpath = outpath
+        self.factors_path = factors_path
+        self.rescale = rescale
+        self.mode = mode
+        self.stats = RunningStats()
+
+    @property
+    def count(self) -> int:
+        return self.stats.count
+
+    def update(self, rows) -> None:
+        """Add rows of values (the merged columns without the timestamp)."""
+        self.stats.update(np.asarray(rows, dtype=np.float64))
+
+    def factors(self) -> tuple:
+        """:return: (mean, std) per column; std with ddof=1 like pandas, NaN below two rows"""
+        if self.stats.mean is None:
+            raise ValueError("No data to normalize")
+        return self.stats.mean, self.stats.std()
+
+    def write_factors(self) -> None:
+        mean, std = self.factors()
+        with open(self.factors_path, "w") as f:
+            json.dump({"mode": "zscore", "rows": self.count, "mean": mean.tolist(),
+                       "std": [None if not np.isfinite(x) else x for x in std.tolist()]}, f, indent=2)
+        print(f"[Normalizer] Normalization factors saved to {self.factors_path}")
+
+    def write_normalized(self) -> None:
+        mean, std = self.factors()
+        with open(self.outpath, 'w', newline='', buffering=1 << 20) as f:
+            header = False
+            for table in read_chunks(self.rawpath):
+                if not header:
+                    f.write(",".join(map(str, range(table.shape[1]))) + "\n")
+                    header = True
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    np.subtract(table[:, 1:], mean, out=table[:, 1:])
+                    np.divide(table[:, 1:], std, out=table[:, 1:])
+                write_rows(f, table)
+        print(f"[Normalizer] Normalized data saved to {self.outpath}")
+
+    def __call__(self):
+        if self.mode != "zscore":
+            print(f"[Normalizer] No running factors for mode {self.mode}, writing the normalized log")
+            Normalizer(self.rawpath, self.outpath, mode=self.mode)()
+            return
+        if self.factors_path:
+            self.write_factors()
+        if self.rescale:
+            self.write_normalized()
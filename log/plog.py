@@ -9,56 +9,99 @@ import subprocess
 import glob
 
 class PictureLogger():
+    """
+    Logs the cropped face frames of a session as a video.
+
+    Two modes are supported, selected by ``config["mode"]``:
+      - "png" (default): every frame is written as a PNG and the video is assembled
+        by ffmpeg's concat demuxer once the pipeline stops.
+      - "stream": frames are fed into a long-lived cv2.VideoWriter as they arrive,
+        and the real per-frame timestamps are appended to a sidecar CSV
+        (``<video>_timestamps.csv``), so the video is finished as soon as the
+        writer is released.
+
+    Single-channel frames (the IR crops in gray mode) are written as grayscale PNGs and
+    to a grayscale VideoWriter, without a colour conversion.
+    """
     def __init__(self, config: dict) -> None:
         self.video_path = config["video_path"]
         self.data_queue = config["data_queue"]
         self.image_path = config["image_path"]
+        self.mode = config.get("mode", "png")
+        self.fps = config.get("fps", 30)  # nominal container frame rate in stream mode
+        self.fourcc = config.get("fourcc", "mp4v")
+        self.timestamps_path = os.path.splitext(self.video_path)[0] + "_timestamps.csv"
         self.lock = threading.Lock()
 
         self.timestamps = []
         self.frame_count = 0
+        self.writer = None
+        self.timestamps_file = None
         
         # 确保目录存在
         os.makedirs(self.image_path, exist_ok=True)
         # 确保视频文件的目录存在
         os.makedirs(os.path.dirname(self.video_path), exist_ok=True)
 
-    def save_image(self, index: int, image: np.ndarray, timestamp: float) -> None:
+    @staticmethod
+    def _to_bgr(image: np.ndarray) -> np.ndarray:
         if image.max() <= 1.0:
             image = (image * 255).astype(np.uint8)
-        if image.ndim == 3 and image.shape[2] == 4:
+        if image.ndim == 3 and image.shape[2] == 1:
+            image = image[:, :, 0]
+        if image.ndim == 2:
+            return image
+        if image.shape[2] == 4:
             image = image[:, :, :3]
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+    def save_image(self, index: int, image: np.ndarray, timestamp: float) -> None:
+        image = self._to_bgr(image)
         filename = f"{self.image_path}/frame_{index:06d}.png"
         cv2.imwrite(filename, image)
         self.timestamps.append(timestamp)
 
-    def save_video(self) -> None:
-        # 检查是否有帧需要保存
-        if self.frame_count == 0:
-            print("[PictureLogger] No frames to save, skipping video creation")
-            return
-            
-        txt_path = os.path.join(self.image_path, "timestamps.txt")
-        
-        # 确保视频输出目录存在
-        video_dir = os.path.dirname(self.video_path)
-        if video_dir and not os.path.exists(video_dir):
-            os.makedirs(video_dir, exist_ok=True)
-            print(f"[PictureLogger] Created video directory: {video_dir}")
-        
-        # 计算平均帧率
-        total_duration = 0.0
-        frame_durations = []
-        
-        with open(txt_path, "w") as f:
-            for i in range(self.frame_count - 1):
-                dt = self.timestamps[i + 1] - self.timestamps[i]
-                frame_durations.append(dt)
-                total_duration += dt
-                f.write(f"file 'frame_{i:06d}.png'\n")
-                f.write(f"duration {dt:.6f}\n")
-            f.write(f"file 'frame_{self.frame_count - 1:06d}.png'\n")
+    def _open_writer(self, width: int, height: int, is_color: bool = True) -> None:
+        self.writer = cv2.VideoWriter(
+            self.video_path,
+            cv2.VideoWriter_fourcc(*self.fourcc),
+            self.fps,
+            (width, height),
+            is_color
+        )
+        if not self.writer.isOpened():
+            self.writer = None
+            raise RuntimeError(f"Unable to open video writer for {self.video_path}")
+        self.timestamps_file = open(self.timestamps_path, "w", buffering=8192)
+        print(f"[PictureLogger] Streaming {width}x{height} {'colour' if is_color else 'grayscale'} frames to {self.video_path}")
+
+    def stream_image(self, index: int, image: np.ndarray, timestamp: float) -> None:
+        image = self._to_bgr(image)
+        if image.dtype != np.uint8:
+            image = np.clip(image, 0, 255).astype(np.uint8)
+        if self.writer is None:
+            self._open_writer(image.shape[1], image.shape[0], image.ndim == 3)
+        self.writer.write(image)
+        self.timestamps_file.write(f"{index},{timestamp}\n")
+        self.timestamps.append(timestamp)
+
+    def close_stream(self) -> None:
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+        if self.timestamps_file is not None:
+            self.timestamps_file.close()
+            self.timestamps_file = None
+        if self.frame_count > 0:
+            self._log_statistics()
+            print(f"[PictureLogger] Successfully saved video to {os.path.abspath(self.video_path)}")
+            print(f"[PictureLogger] Frame timestamps saved to {self.timestamps_path}")
+        self.timestamps.clear()
+        self.frame_count = 0
+
+    def _log_statistics(self) -> None:
+        frame_durations = [self.timestamps[i + 1] - self.timestamps[i] for i in range(len(self.timestamps) - 1)]
+        total_duration = sum(frame_durations)
 
         # 计算并打印帧率统计信息
         if self.frame_count > 1 and total_duration > 0:
@@ -91,6 +134,29 @@ class PictureLogger():
         else:
             print(f"[PictureLogger] Insufficient data to calculate frame rate (frames: {self.frame_count})")
 
+    def save_video(self) -> None:
+        # 检查是否有帧需要保存
+        if self.frame_count == 0:
+            print("[PictureLogger] No frames to save, skipping video creation")
+            return
+            
+        txt_path = os.path.join(self.image_path, "timestamps.txt")
+        
+        # 确保视频输出目录存在
+        video_dir = os.path.dirname(self.video_path)
+        if video_dir and not os.path.exists(video_dir):
+            os.makedirs(video_dir, exist_ok=True)
+            print(f"[PictureLogger] Created video directory: {video_dir}")
+        
+        with open(txt_path, "w") as f:
+            for i in range(self.frame_count - 1):
+                dt = self.timestamps[i + 1] - self.timestamps[i]
+                f.write(f"file 'frame_{i:06d}.png'\n")
+                f.write(f"duration {dt:.6f}\n")
+            f.write(f"file 'frame_{self.frame_count - 1:06d}.png'\n")
+
+        self._log_statistics()
+
         # 使用绝对路径
         abs_video_path = os.path.abspath(self.video_path)
         
@@ -188,12 +254,20 @@ class PictureLogger():
                 continue
             try:
                 for image, timestamp in zip(images, timestamps):
-                    self.save_image(self.frame_count, image, timestamp)
+                    if self.mode == "stream":
+                        self.stream_image(self.frame_count, image, timestamp)
+                    else:
+                        self.save_image(self.frame_count, image, timestamp)
                     self.frame_count += 1
             except Exception as e:
                 print(f"[PictureLogger] Error processing image: {e}")
                 continue
-                
+
+        if self.mode == "stream":
+            print(f"[PictureLogger] Streamed {self.frame_count} frames to {self.video_path}")
+            self.close_stream()
+            return
+
         print(f"[PictureLogger] Saved {self.frame_count} images to {self.image_path}")
         if self.frame_count > 0:
             self.save_video()
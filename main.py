@@ -8,34 +8,32 @@ import csv
 import json
 import gc
 from datetime import datetime
-from scipy.signal import butter, filtfilt, welch
 
 import global_vars
 from bluetooth.listen import Bluetooth
 from capture.camera import CameraCapture
+from capture.ring import FrameRing
 from model.physnet import PhysNet
 from model.step import Step
 from preprocess.mp import MediaPipePreprocess
+from preprocess.workers import ProcessPreprocess
+from preprocess.roi import ROIPreprocess, SharedROI
 from ecg.ecg import ECG
+from ecg.publisher import ECGChunk
+from ecg.processing import ECGProcessor
 from log.dlog import DataLogger
+from log.columnar import ECG_COLUMNS, RPEAK_COLUMNS, RPPG_COLUMNS
 from log.plog import PictureLogger
-from log.merge import FileMerger
-from log.normalize import Normalizer
-from peripherals.peripherals import Peripherals
+from log.merge import FileMerger, OnlineMerger
+from log.normalize import Normalizer, OnlineNormalizer
 from peripheralmanager.peripmanager import PeripheralManager
 from network.wifi import WiFiManager
-from network.uploader import ServerUploader
+from utils.ringbuffer import RingBuffer
+from utils.streaming_hr import StreamingHR
+from utils.sqi import QualitySummary, SignalQuality
+from utils.timebase import TimeBase
 
 
-def bandpass_filter(data, lowcut=0.5, highcut=3, fs=30, order=3):
-    b, a = butter(order, [lowcut, highcut], fs=fs, btype='band')
-    return filtfilt(b, a, data)
-
-
-def get_hr(y, sr=30, min=30, max=180):
-    f, Pxx = welch(y, sr, nfft=1e5 / sr, nperseg=np.min((len(y) - 1, 256)))
-    return f[(f > min / 60) & (f < max / 60)][np.argmax(Pxx[(f > min / 60) & (f < max / 60)])] * 60
-
 class SessionManager:
     """管理会话数据的类"""
     def __init__(self, base_data_dir="./data"):
@@ -153,9 +151,12 @@ class SessionManager:
             "images_dir": os.path.join(self.current_session_dir, "images"),
             "ir_images_dir": os.path.join(self.current_session_dir, "ir_images"),
             "ecg_log": os.path.join(self.current_session_dir, "ecg_log.csv"),
+            "rpeak_log": os.path.join(self.current_session_dir, "rpeak_log.csv"),
+            "quality_summary": os.path.join(self.current_session_dir, "quality_summary.json"),
             "rppg_log": os.path.join(self.current_session_dir, "rppg_log.csv"),
             "merged_log": os.path.join(self.current_session_dir, "merged_log.csv"),
             "normalized_log": os.path.join(self.current_session_dir, "normalized_log.csv"),
+            "normalization": os.path.join(self.current_session_dir, "normalization.json"),
             "main_log": os.path.join(self.current_session_dir, "log.csv"),
         }
     
@@ -200,12 +201,16 @@ class BluetoothHandler:
         self.bluetooth = Bluetooth()
         self.rx_queue = queue.Queue()
         self.tx_queue = queue.Queue()
+        if self.pipeline:
+            # 采集过程中的质量信息经蓝牙发送
+            self.pipeline.status_queue = self.tx_queue
         
         # Device status
         self.device_id = 1
         self.session_manager = SessionManager()
         
-        # Server uploader
+        # Server uploader（在这里导入：paramiko 只在设备上安装，replay.py 导入本模块时不需要它）
+        from network.uploader import ServerUploader
         self.server_uploader = ServerUploader()
         
         # Thread management
@@ -253,6 +258,9 @@ class BluetoothHandler:
     def _handle_set_time(self, payload):
         """Handle set_time command"""
         print(f"[BluetoothHandler] Set time: {payload.get('time')}")
+        if self.pipeline and payload.get("time") is not None:
+            # 以手机时间为会话时钟的基准，采集中的所有时间戳随之对齐
+            self.pipeline.timebase.set_wall_time(float(payload["time"]))
         return "success"
 
     def _handle_start_capture(self, payload):
@@ -506,6 +514,7 @@ class BluetoothHandler:
     def set_pipeline(self, pipeline):
         """Set the pipeline reference"""
         self.pipeline = pipeline
+        self.pipeline.status_queue = self.tx_queue
 
     def get_session_manager(self):
         """获取会话管理器"""
@@ -520,11 +529,23 @@ class Pipeline:
         self.ir_preprocess = config["ir_preprocess"]
         self.model = config["model"]
         self.ecg = config["ecg"]
+        # 统一的会话时钟（单调时钟 + 墙钟锚点），摄像头和 ECG 的时间戳都基于它
+        self.timebase = config.get("timebase") or TimeBase()
+        # 可选的 ECG 处理阶段（滤波 + R 波检测），None 表示不启用
+        self.ecg_processor = config.get("ecg_processor")
         self.interrupt_hotkey = config["interrupt_hotkey"]
         self.log = config["log"]
         self.perip_manager = config["perip_manager"]
-        self.frame_queue = queue.Queue(maxsize=config["max_queue_size"])
-        self.ir_frame_queue = queue.Queue(maxsize=config["max_queue_size"])
+        if config.get("frame_ring"):
+            # 预分配的帧环形缓冲区，内存有界且采集循环中无额外分配
+            ring_config = config["frame_ring"]
+            self.frame_queue = FrameRing(ring_config["slots"], ring_config.get("policy", "overwrite_oldest"),
+                                         shared=ring_config.get("shared", False))
+            self.ir_frame_queue = FrameRing(ring_config["slots"], ring_config.get("policy", "overwrite_oldest"),
+                                            shared=ring_config.get("shared", False))
+        else:
+            self.frame_queue = queue.Queue(maxsize=config["max_queue_size"])
+            self.ir_frame_queue = queue.Queue(maxsize=config["max_queue_size"])
         self.preprocess_queue = queue.Queue(maxsize=config["max_queue_size"])
         self.result_queue = queue.Queue(maxsize=config["max_queue_size"])
         self.log_result_queue = queue.Queue(maxsize=config["max_queue_size"])
@@ -534,59 +555,108 @@ class Pipeline:
         self.raw_ecg_queue = queue.Queue(maxsize=config["max_queue_size"])
         self.display_queue = queue.Queue(maxsize=config["max_queue_size"])
         self.monitor_ecg_queue = queue.Queue(maxsize=config["max_queue_size"])
-        self.inference_results = []
+        self.processing_ecg_queue = queue.Queue(maxsize=config["max_queue_size"])
+        self.rpeak_queue = queue.Queue(maxsize=config["max_queue_size"])
         self.max_display_points = config["max_display_points"]
+        self.inference_results = RingBuffer(self.max_display_points)
         self.time_limit = config["time_limit"]
         self.threads = []
+        self.data_log_threads = []
+        self.producer_threads = []
         self.hr = None
         self.csv_file = config["log_path"]
         global_vars.pipeline_running = False
-        self.heart_rate_buffer = []
         # 添加显示相关属性
         self.last_display_update = 0
         self.display_update_interval = 1.0  # 每1秒更新一次显示
+        # rPPG 的实际采样率：降帧处理（target_fps）时低于相机帧率
+        target_fps = getattr(self.preprocess, "target_fps", None)
+        rppg_fs = min(target_fps, config["fps"]) if target_fps else config["fps"]
+        # 流式心率估计：窗口长度（秒），每秒更新一次，采样率由时间戳估计
+        self.hr_estimator = StreamingHR({
+            "fs": rppg_fs,
+            "window": config.get("hr_window", 6),
+            "update_interval": self.display_update_interval,
+            "peak_refine": config.get("hr_peak_refine", False),
+        })
         
-        # 添加ECG质量监测相关属性
-        self.ecg_buffer = []
-        self.ecg_window_size = config.get("ecg_window_size", 512)  # 1 sec
+        # 信号质量指数（SQI）：rPPG 与 ECG 各一个，每秒更新一次，取代固定的极差阈值
+        self.rppg_sqi = SignalQuality(config.get("rppg_sqi", {"fs": rppg_fs}))
+        self.ecg_sqi = SignalQuality(config.get("ecg_sqi", {
+            "fs": 512, "low_cut": 0.5, "high_cut": 40, "harmonics": 0,
+            "rails": (-32768, 32767),
+            # ECG 按峰度分级（kSQI），频谱信噪比只记录
+            "snr": None, "kurtosis": (3.5, 5),
+        }))
         self.ecg_quality = "normal"  # 初始质量状态
-        self.ecg_quality_thresholds = {
-            "normal": 6000,    # 极差小于5000为正常
-            "warning": 8000,   # 极差5000-8000为警告
-            # 极差大于8000为错误
-        }
+        self.ecg_quality_levels = {"good": "normal", "fair": "warning", "poor": "error"}
+        # 会话质量汇总，停止时写入 quality_summary.json
+        self.quality_summary = QualitySummary(config.get("min_good_seconds", 30))
+        self.quality_summary_path = "./quality_summary.json"
+        # 质量信息经蓝牙发送（status_queue 由 BluetoothHandler 设置），rPPG 质量差时不显示心率
+        self.status_queue = None
+        self.quality_publish_interval = config.get("quality_publish_interval", 5.0)
+        self.last_quality_publish = 0
+        self.display_quality_gate = config.get("display_quality_gate", True)
         # 在Pipeline.__init__方法中添加这些属性
         self.last_ecg_quality_display = 0
         self.ecg_quality_display_interval = 1.0  # 每秒显示一次ECG质量信息
 
+        # "png": per-frame PNG + ffmpeg at stop; "stream": encode while capturing
+        self.picture_log_mode = config.get("picture_log_mode", "png")
+        # 在线合并：采集过程中合并 rPPG/ECG 日志并累计归一化统计量，停止时不再整文件处理；None 表示停止时合并
+        self.online_merge = config.get("online_merge")
+        # 数据日志格式："csv" 文本行，或 "columnar" 按列的二进制文件（ecg_log.cols 等，可按需导出 CSV）
+        self.log_format = config.get("log_format", "csv")
+        # 归一化方式："zscore"（全程均值/标准差）、"robust"（中位数/四分位距）或 "window"（按时间窗口）
+        self.normalize_mode = config.get("normalize_mode", "zscore")
+        # 日志文件 fsync 间隔（秒）：越短断电时丢失的数据越少，越长 SD 卡写入越少；None 交给操作系统回写
+        self.log_fsync_interval = config.get("log_fsync_interval")
+
         # 初始化日志记录器（默认路径，会在启动时更新）
+        self._create_merge_stages(["./ecg_log.csv", "./rppg_log.csv"], "merged_log.csv", "normalized_log.csv",
+                                  "normalization.json")
         self.ecglogger = DataLogger({
             "log_path": "./ecg_log.csv",
             "data_queue": self.raw_ecg_queue,
+            "row_sink": self._row_sink("./ecg_log.csv"),
+            "format": self.log_format,
+            "columns": ECG_COLUMNS,
+            "fsync_interval": self.log_fsync_interval,
         })
         self.rppglogger = DataLogger({
             "log_path": "./rppg_log.csv",
             "data_queue": self.log_result_queue,
+            "row_sink": self._row_sink("./rppg_log.csv"),
+            "format": self.log_format,
+            "columns": RPPG_COLUMNS,
+            "fsync_interval": self.log_fsync_interval,
+        })
+        # R 波时间线: [timestamp, rr, hr]
+        self.rpeaklogger = DataLogger({
+            "log_path": "./rpeak_log.csv",
+            "data_queue": self.rpeak_queue,
+            "format": self.log_format,
+            "columns": RPEAK_COLUMNS,
+            "fsync_interval": self.log_fsync_interval,
         })
-        self.filemerger = FileMerger(input_files=["./ecg_log.csv", "./rppg_log.csv"], output_path="merged_log.csv")
 
         self.picturelogger = PictureLogger({
             "video_path": "./video.mp4",
             "data_queue": self.log_queue,
-            "image_path": "./images"
+            "image_path": "./images",
+            "mode": self.picture_log_mode,
+            "fps": config["fps"],
         })
 
         self.irpicturelogger = PictureLogger({
             "video_path": "./ir_video.mp4",
             "data_queue": self.ir_log_queue,
-            "image_path": "./ir_images"
+            "image_path": "./ir_images",
+            "mode": self.picture_log_mode,
+            "fps": config["fps"],
         })
 
-        self.normalizer = Normalizer(rawpath="merged_log.csv", outpath="normalized_log.csv")
-
-        # Initialize the heart rate buffer for the sliding window (10 seconds)
-        self.heart_rate_buffer = []
-
         # Open CSV file in append mode and write header if it's empty
         if not os.path.exists(self.csv_file):
             with open(self.csv_file, mode='w', newline='') as file:
@@ -596,6 +666,31 @@ class Pipeline:
         if self.log:
             print(f"[Pipeline] Pipeline initialized")
 
+    def _create_merge_stages(self, input_files: list, merged_log: str, normalized_log: str, normalization: str) -> None:
+        """创建合并与归一化阶段：在线模式下由数据日志记录器在写入时送入数据"""
+        if self.online_merge is None:
+            self.filemerger = FileMerger(input_files=input_files, output_path=merged_log)
+            self.normalizer = Normalizer(rawpath=merged_log, outpath=normalized_log, mode=self.normalize_mode)
+            return
+        # rescale=False 时只保存每列的均值/标准差（normalization.json），不再写出 normalized_log.csv
+        self.normalizer = OnlineNormalizer(
+            rawpath=merged_log,
+            outpath=normalized_log,
+            factors_path=normalization,
+            rescale=self.online_merge.get("rescale", True),
+            mode=self.normalize_mode,
+        )
+        self.filemerger = OnlineMerger(
+            input_files=input_files,
+            output_path=merged_log,
+            normalizer=self.normalizer,
+            idle_timeout=self.online_merge.get("idle_timeout", 5.0),
+        )
+
+    def _row_sink(self, log_path: str):
+        """日志记录器写入的数据行送往在线合并（离线模式下为 None）"""
+        return self.filemerger.sink(log_path) if self.online_merge is not None else None
+
     def update_session_paths(self, session_paths):
         """更新会话路径"""
         # 确保所有目录存在
@@ -617,23 +712,47 @@ class Pipeline:
 
         # 更新各个日志记录器的路径
         # 确保日志文件的目录存在
-        for log_path in [session_paths["ecg_log"], session_paths["rppg_log"]]:
+        for log_path in [session_paths["ecg_log"], session_paths["rppg_log"], session_paths["rpeak_log"]]:
             os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        # 确保合并和归一化文件的目录存在
+        for path in [session_paths["merged_log"], session_paths["normalized_log"]]:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # 合并阶段先于日志记录器创建，在线模式下记录器把写入的数据行送给它
+        self._create_merge_stages(
+            [session_paths["rppg_log"], session_paths["ecg_log"]],
+            session_paths["merged_log"],
+            session_paths["normalized_log"],
+            session_paths.get("normalization", os.path.join(session_paths["session_dir"], "normalization.json")),
+        )
         
         self.ecglogger = DataLogger({
             "log_path": session_paths["ecg_log"],
             "data_queue": self.raw_ecg_queue,
+            "row_sink": self._row_sink(session_paths["ecg_log"]),
+            "format": self.log_format,
+            "columns": ECG_COLUMNS,
+            "fsync_interval": self.log_fsync_interval,
         })
         
         self.rppglogger = DataLogger({
             "log_path": session_paths["rppg_log"],
             "data_queue": self.log_result_queue,
+            "row_sink": self._row_sink(session_paths["rppg_log"]),
+            "format": self.log_format,
+            "columns": RPPG_COLUMNS,
+            "fsync_interval": self.log_fsync_interval,
+        })
+
+        self.rpeaklogger = DataLogger({
+            "log_path": session_paths["rpeak_log"],
+            "data_queue": self.rpeak_queue,
+            "format": self.log_format,
+            "columns": RPEAK_COLUMNS,
+            "fsync_interval": self.log_fsync_interval,
         })
-        
-        self.filemerger = FileMerger(
-            input_files=[session_paths["rppg_log"], session_paths["ecg_log"]], 
-            output_path=session_paths["merged_log"]
-        )
+
+        self.quality_summary_path = session_paths["quality_summary"]
 
         # 确保视频文件的目录存在
         for video_path in [session_paths["video_path"], session_paths["ir_video_path"]]:
@@ -642,29 +761,25 @@ class Pipeline:
         self.picturelogger = PictureLogger({
             "video_path": session_paths["video_path"],
             "data_queue": self.log_queue,
-            "image_path": session_paths["images_dir"]
+            "image_path": session_paths["images_dir"],
+            "mode": self.picture_log_mode,
+            "fps": self.config["fps"],
         })
 
         self.irpicturelogger = PictureLogger({
             "video_path": session_paths["ir_video_path"],
             "data_queue": self.ir_log_queue,
-            "image_path": session_paths["ir_images_dir"]
+            "image_path": session_paths["ir_images_dir"],
+            "mode": self.picture_log_mode,
+            "fps": self.config["fps"],
         })
 
-        # 确保合并和归一化文件的目录存在
-        for path in [session_paths["merged_log"], session_paths["normalized_log"]]:
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-
-        self.normalizer = Normalizer(
-            rawpath=session_paths["merged_log"], 
-            outpath=session_paths["normalized_log"]
-        )
-        
         print(f"[Pipeline] Pipeline paths updated for session: {session_paths['session_dir']}")
 
 
-    def exchange_data(self, result_queue: queue.Queue, main_queue: queue.Queue) -> None:
-        while global_vars.pipeline_running:
+    def exchange_data(self, result_queue: queue.Queue, main_queue: queue.Queue, producer: threading.Thread = None) -> None:
+        # 停止后继续转发，直到模型线程输出完最后的结果（PhysNet 在停止时输出剩余的 BVP）
+        while global_vars.pipeline_running or (producer is not None and producer.is_alive()) or not result_queue.empty():
             try:
                 results, timestamps = result_queue.get(timeout=0.5)
             except:
@@ -672,12 +787,14 @@ class Pipeline:
             for result, timestamp in zip(results, timestamps):
                 main_queue.put([timestamp, result])
 
-    def results(self) -> None:
-        while global_vars.pipeline_running:
+    def results(self, producer: threading.Thread = None) -> None:
+        # 同样处理完数据交换线程停止后转发的结果
+        while global_vars.pipeline_running or (producer is not None and producer.is_alive()) or not self.main_queue.empty():
             try:
                 result = self.main_queue.get(timeout=0.5)
             except:
-                print("[Pipeline] No results in the queue, waiting...")
+                if global_vars.pipeline_running:
+                    print("[Pipeline] No results in the queue, waiting...")
                 continue
             
             # 处理ECG质量监测
@@ -689,27 +806,22 @@ class Pipeline:
             if len(result) >= 2:
                 timestamp, inference_result = result[0], result[1]
                 
-                # 只添加推理结果，不添加时间戳
+                # 只添加推理结果，不添加时间戳（环形缓冲区，自动保持大小限制）
                 self.inference_results.append(inference_result)
                 
-                # 保持缓冲区大小限制
-                if len(self.inference_results) > self.max_display_points:
-                    self.inference_results.pop(0)
-                
-                # 使用推理结果作为心率数据
-                new_heart_rate = inference_result
-                self.heart_rate_buffer.append(new_heart_rate)
-            
-            # Ensure we only keep enough data for 10 seconds (e.g., 300 data points if fps = 30)
-            if len(self.heart_rate_buffer) > self.config["fps"] * 6:
-                self.heart_rate_buffer.pop(0)
-
-            # Calculate heart rate when there is enough data (10 seconds worth)
-            if len(self.heart_rate_buffer) >= self.config["fps"] * 6:
-                # Apply the bandpass filter
-                filtered_data = bandpass_filter(np.array(self.heart_rate_buffer), lowcut=0.5, highcut=3)
-                # Get the heart rate from the filtered data
-                heart_rate = get_hr(filtered_data)
+                # 使用推理结果作为心率数据；心率只在每个更新间隔重新计算一次
+                try:
+                    heart_rate = self.hr_estimator.update(inference_result, timestamp)
+                except Exception as e:
+                    # 估计失败不能让结果线程退出
+                    print(f"[Pipeline] Error estimating heart rate: {e}")
+                    heart_rate = None
+                self._process_rppg_quality(inference_result, timestamp)
+            else:
+                heart_rate = None
+
+            # 停止后显示已清空，不再更新
+            if heart_rate is not None and global_vars.pipeline_running:
                 self.hr = heart_rate
                 
                 # 更新显示
@@ -720,59 +832,99 @@ class Pipeline:
                 
                 # 控制ECG质量信息的显示频率
                 if current_time - self.last_ecg_quality_display >= self.ecg_quality_display_interval:
-                    print(f"[Pipeline] Heart Rate: {heart_rate:.1f} BPM, ECG Quality: {self.ecg_quality}")
+                    ecg_hr = self.ecg_processor.hr if self.ecg_processor else None
+                    ecg_hr = f"{ecg_hr:.1f} BPM" if ecg_hr is not None else "n/a"
+                    print(f"[Pipeline] Heart Rate: {heart_rate:.1f} BPM, ECG Heart Rate: {ecg_hr}, ECG Quality: {self.ecg_quality}")
                     self.last_ecg_quality_display = current_time
 
     def _process_ecg_quality(self):
         """处理ECG数据质量监测"""
         try:
-            # 从monitor_ecg_queue获取ECG数据
+            # 从monitor_ecg_queue获取ECG数据，本次收到的样本一次性送入SQI
+            ecg_values = []
+            ecg_times = []
             while not self.monitor_ecg_queue.empty():
                 try:
                     ecg_data = self.monitor_ecg_queue.get_nowait()
-                    # ecg_data可能是单个值或包含时间戳的列表
-                    if isinstance(ecg_data, (list, tuple)) and len(ecg_data) > 1:
-                        ecg_value = ecg_data[1]  # 假设格式为[timestamp, value]
-                    else:
-                        ecg_value = float(ecg_data)
-                    
-                    self.ecg_buffer.append(ecg_value)
-                    
-                    # 保持窗口大小
-                    if len(self.ecg_buffer) > self.ecg_window_size:
-                        self.ecg_buffer.pop(0)
+                    # ecg_data是数据块或[timestamp, value]
+                    if isinstance(ecg_data, ECGChunk):
+                        ecg_values.extend(ecg_data.values.tolist())
+                        ecg_times.extend(ecg_data.timestamps.tolist())
+                        continue
+                    ecg_times.append(float(ecg_data[0]))
+                    ecg_values.append(float(ecg_data[1]))
                         
                 except queue.Empty:
                     break
                 except (ValueError, TypeError, IndexError) as e:
                     print(f"[Pipeline] Error processing ECG data: {e}")
                     continue
-            
-            # 当有足够数据时计算质量
-            if len(self.ecg_buffer) >= self.ecg_window_size:
-                ecg_array = np.array(self.ecg_buffer)
-                ecg_range = np.max(ecg_array) - np.min(ecg_array)  # 计算极差
-                
-                # 根据极差判断质量
-                if ecg_range <= self.ecg_quality_thresholds["normal"]:
-                    self.ecg_quality = "normal"
-                elif ecg_range <= self.ecg_quality_thresholds["warning"]:
-                    self.ecg_quality = "warning"
-                else:
-                    self.ecg_quality = "error"
-                
-                # 可选：输出调试信息
-                if self.log:
-                    print(f"[Pipeline] ECG Range: {ecg_range:.1f}, Quality: {self.ecg_quality}")
+            if not ecg_values:
+                return
+
+            # SQI 每秒更新一次，其余时间只缓存样本
+            ecg_hr = self.ecg_processor.hr if self.ecg_processor else None
+            indices = self.ecg_sqi.update(ecg_values, ecg_times, hr=ecg_hr)
+            if indices is None:
+                return
+            self.ecg_quality = self.ecg_quality_levels[indices["grade"]]
+            self.quality_summary.add("ecg", indices, self.ecg_sqi.update_interval)
+
+            # 可选：输出调试信息
+            if self.log:
+                print(f"[Pipeline] ECG SQI: kurtosis {indices['kurtosis']:.1f}, flatline {indices['flatline']:.2f}, "
+                      f"clipping {indices['clipping']:.3f}, range {indices['range']:.0f}, Quality: {self.ecg_quality}")
                     
         except Exception as e:
             print(f"[Pipeline] Error in ECG quality processing: {e}")
             self.ecg_quality = "error"  # 处理错误时设为error状态
 
+    def _process_rppg_quality(self, value, timestamp):
+        """rPPG 信号质量，以及 rPPG 与 ECG 心率的一致性"""
+        try:
+            indices = self.rppg_sqi.update(value, timestamp)
+            if indices is None:
+                return
+            self.quality_summary.add("rppg", indices, self.rppg_sqi.update_interval)
+            if self.ecg_processor:
+                self.quality_summary.add_hr_pair(self.hr, self.ecg_processor.hr)
+            self._publish_quality()
+        except Exception as e:
+            print(f"[Pipeline] Error in rPPG quality processing: {e}")
+
+    def _publish_quality(self):
+        """定期把质量信息发送到蓝牙"""
+        current_time = time.time()
+        if self.status_queue is None or current_time - self.last_quality_publish < self.quality_publish_interval:
+            return
+        self.last_quality_publish = current_time
+
+        def rounded(value, digits=1):
+            # JSON 中不能有 NaN/Infinity
+            return round(float(value), digits) if value is not None and np.isfinite(value) else None
+
+        rppg, ecg = self.rppg_sqi.latest or {}, self.ecg_sqi.latest or {}
+        ecg_hr = self.ecg_processor.hr if self.ecg_processor else None
+        self.status_queue.put({
+            "quality": {
+                "rppg": rppg.get("grade"),
+                "rppg_snr": rounded(rppg.get("snr")),
+                "ecg": ecg.get("grade"),
+                "ecg_kurtosis": rounded(ecg.get("kurtosis")),
+                "hr_difference": rounded(self.hr - ecg_hr) if self.hr is not None and ecg_hr is not None else None,
+                "good_seconds": {name: int(self.quality_summary.good_seconds(name)) for name in ("rppg", "ecg")},
+            }
+        })
+
     def update_heart_rate_display(self, heart_rate):
         """更新心率显示到外设管理器"""
         try:
             if self.perip_manager and heart_rate is not None:
+                if self.display_quality_gate and (self.rppg_sqi.latest or {}).get("grade") == "poor":
+                    # rPPG 信号质量差时不显示心率
+                    self.perip_manager.refresh_display(0)
+                    print("[Pipeline] rPPG quality poor, heart rate not displayed")
+                    return
                 # 确保心率在合理范围内
                 hr_display = max(30, min(200, int(round(heart_rate))))
                 self.perip_manager.refresh_display(hr_display)
@@ -794,6 +946,7 @@ class Pipeline:
 
     def start(self) -> None:
         self.clear()
+        self.timebase.reset()
         global_vars.pipeline_running = True
         self.last_display_update = 0
         self.threads = [
@@ -823,21 +976,41 @@ class Pipeline:
             ),
             data_thread := threading.Thread(
                 target=self.exchange_data,
-                args=(self.result_queue, self.main_queue),
+                args=(self.result_queue, self.main_queue, model_thread),
                 daemon=True,
                 name="DataExchangeThread",
             ),
             ecg_thread := threading.Thread(
                 target=self.ecg,
-                args=(self.raw_ecg_queue, self.monitor_ecg_queue),
+                args=(self.raw_ecg_queue, self.monitor_ecg_queue,
+                      self.processing_ecg_queue if self.ecg_processor else None),
                 daemon=True,
                 name="ECGThread",
             ),
         ]
-
-        self.threads.append(results_thread := threading.Thread(target=self.results, daemon=True, name="ResultsThread"))
+        # 停止后仍在输出剩余数据的线程，停止时先等它们结束，再等日志记录器
+        self.producer_threads = [model_thread, data_thread]
+        rpeak_log_thread = None
+        if self.ecg_processor:
+            self.threads.append(ecg_processing_thread := threading.Thread(
+                target=self.ecg_processor,
+                args=(self.processing_ecg_queue, self.rpeak_queue),
+                daemon=True,
+                name="ECGProcessingThread",
+            ))
+            self.producer_threads.append(ecg_processing_thread)
+            # 停止后处理线程仍在处理剩余的 ECG，R 波记录器等它结束后再清空队列
+            self.rpeaklogger.producers = [ecg_processing_thread]
+            self.threads.append(rpeak_log_thread := threading.Thread(target=self.rpeaklogger, daemon=True, name="RPeakLogThread"))
+
+        self.threads.append(results_thread := threading.Thread(target=self.results, args=(data_thread,), daemon=True, name="ResultsThread"))
+        self.producer_threads.append(results_thread)
+        self.rppglogger.producers = [results_thread]
         self.threads.append(ecg_log_thread := threading.Thread(target=self.ecglogger, daemon=True, name="ECGLogThread"))
         self.threads.append(rppg_log_thread := threading.Thread(target=self.rppglogger, daemon=True, name="RPPGLogThread"))
+        self.data_log_threads = [ecg_log_thread, rppg_log_thread]
+        if rpeak_log_thread is not None:
+            self.data_log_threads.append(rpeak_log_thread)
         self.threads.append(picture_log_thread := threading.Thread(target=self.picturelogger, daemon=True, name="PictureLogThread"))
         self.threads.append(ir_picture_log_thread := threading.Thread(target=self.irpicturelogger, daemon=True, name="IRPictureLogThread"))
         for thread in self.threads:
@@ -852,10 +1025,32 @@ class Pipeline:
                 print("[Pipeline] Display cleared")
         except Exception as e:
             print(f"[Pipeline] Error clearing display: {e}")
-        time.sleep(1)
+        try:
+            self.quality_summary.write(self.quality_summary_path)
+        except Exception as e:
+            print(f"[Pipeline] Error writing quality summary: {e}")
+        print(f"[Pipeline] Timebase stats: {self.timebase.stats()}")
+        # 先等模型与 ECG 处理线程输出完剩余数据，再等日志记录器写完队列中剩余的数据并关闭文件；
+        # 在线合并随后只需写出尚未合并的行。合并不能与仍在写入的记录器同时进行，共最多等待 30 秒
+        deadline = time.time() + 30
+        for thread in self.producer_threads + self.data_log_threads:
+            thread.join(timeout=2)
+            while thread.is_alive() and time.time() < deadline:
+                print(f"[Pipeline] {thread.name} is still finishing, waiting")
+                thread.join(timeout=2)
+            if thread.is_alive():
+                print(f"[Pipeline] Warning: {thread.name} did not finish, the last rows of the session may be missing")
+        if self.online_merge is None and self.log_format == "columnar":
+            # 离线合并读取 CSV 日志，从按列存储导出；R 波日志同样导出为 CSV（其记录器已在上面结束）
+            self.ecglogger.export_csv()
+            self.rppglogger.export_csv()
+            self.rpeaklogger.export_csv()
         self.filemerger()
-        self.normalizer()
-        time.sleep(1)
+        try:
+            self.normalizer()
+        except Exception as e:
+            # 会话太短时（如无 rPPG 结果且无 ECG）合并文件为空
+            print(f"[Pipeline] Error normalizing logs: {e}")
         self.clear()
         print("[Pipeline] Pipeline stopped")
 
@@ -878,12 +1073,18 @@ class Pipeline:
             "log_result_queue": self.log_result_queue,
             "raw_ecg_queue": self.raw_ecg_queue,
             "display_queue": self.display_queue,
-            "monitor_ecg_queue": self.monitor_ecg_queue
+            "monitor_ecg_queue": self.monitor_ecg_queue,
+            "processing_ecg_queue": self.processing_ecg_queue,
+            "rpeak_queue": self.rpeak_queue,
         }
         
         # Clear all queues safely
         for name, q in queues.items():
             try:
+                if isinstance(q, FrameRing):
+                    print(f"[Pipeline] {name} stats: {q.stats()}")
+                    q.clear()
+                    continue
                 while not q.empty():
                     try:
                         q.get_nowait()
@@ -893,14 +1094,17 @@ class Pipeline:
                 print(f"[Pipeline] Error clearing {name}: {e}")
         
         # Reset object state
-        self.inference_results = []
+        self.inference_results.clear()
         self.hr = None
-        self.heart_rate_buffer = []  # Also clear the heart rate buffer
-        self.ecg_buffer = []  # 清空ECG缓冲区
+        self.hr_estimator.reset()  # Also clear the heart rate buffer
+        self.rppg_sqi.reset()
+        self.ecg_sqi.reset()
+        self.quality_summary.reset()
         self.ecg_quality = "normal"  # 重置ECG质量状态
 
         self.last_display_update = 0
         self.last_ecg_quality_display = 0
+        self.last_quality_publish = 0
         
         collected = gc.collect()
         print(f"[Pipeline] Garbage collector collected {collected} objects")
@@ -908,6 +1112,37 @@ class Pipeline:
         print("[Pipeline] Pipeline resources cleared")
 
 
+# ONNX Runtime 会话参数
+ONNX_SESSION = {
+    "intra_op_num_threads": 2,
+    "inter_op_num_threads": 1,
+    "graph_optimization_level": "all",
+    "execution_mode": "sequential",
+}
+
+
+def create_model(model_choice: str, onnx_session: dict, state_path: str = "./model/models/onnx/state.pkl"):
+    """创建 Step 或 PhysNet 模型（main 与 replay.py 共用）；Step 停止时把状态写回 state_path"""
+    if model_choice == "Step":
+        return Step(
+            model_path="./model/models/onnx/step.onnx",
+            state_path=state_path,
+            dt=1 / 30,
+            session_config=onnx_session,
+            io_binding=True,
+            # dt 由帧时间戳计算，掉帧/降帧时不影响状态积分
+            dynamic_dt=True,
+        )
+    return PhysNet(
+        model_path="./model/models/onnx/physnet.onnx",
+        session_config=onnx_session,
+        window=128,
+        stride=16,
+        # 每个样本至少经过 3 个窗口平均后输出（约 1.5 秒延迟）
+        emit_delay=32,
+    )
+
+
 def main():
     model_choice, log_path, time_limit = "Step", "./log.csv", 60
     rgb_cam = '/dev/v4l/by-id/usb-Sonix_Technology_Co.__Ltd._RGB_CAMERA_SN0008-video-index0'
@@ -919,43 +1154,84 @@ def main():
     print("[Main] Log Path:", log_path)
     print("[Main] Time Limit:", time_limit)
 
+    # 会话时钟：摄像头帧和 ECG 样本共用，漂移由各自的设备时钟估计
+    timebase = TimeBase()
+
     print("[Main] Loading Peripherals...")
+    # wiringpi 只在设备上可用，在这里导入，使 replay.py 能在没有硬件的机器上导入本模块
+    from peripherals.peripherals import Peripherals
     peripherals = Peripherals()
     ecg = ECG({
-        "bmd101": {"serial_port": "/dev/ttyS0"},
+        "bmd101": {"serial_port": "/dev/ttyS0", "mode": "stream"},
+        "timebase": timebase,
+        # 按块（64 个样本）发布给日志和质量监测，而不是逐样本入队
+        "chunk_size": 64,
         "max_queue_size": 512,
     })
+    # ECG 滤波（0.5 Hz 高通 + 50 Hz 陷波）与 Pan-Tompkins R 波检测
+    ecg_processor = ECGProcessor({"fs": 512, "powerline": 50})
     peripmanager = PeripheralManager("/dev/ttyS3")
     print("[Main] Loading Peripherals...Done")
 
+    # IR 单通道模式：IR 只取亮度（MJPG 直接解码为灰度），日志和视频也保存单通道
+    ir_single_channel = True
+    # IR 裁剪复用 RGB 的人脸框（按时间戳匹配并经标定的映射变换），
+    # 只在匹配不到时才对 IR 运行 FaceMesh；标定：python -m preprocess.calibrate
+    ir_roi_from_rgb = True
+
     print("[Main] Loading Camera...")
     cap = cv2.VideoCapture(rgb_cam)
     ir_cap = cv2.VideoCapture(ir_cam)
-    capture = CameraCapture(cap, ir_cap)
+    # 每个摄像头独立的采集线程；MJPG 降低 USB 带宽（解码占 CPU），YUYV 反之
+    # buffer_size=1 使取到的总是最新帧
+    capture = CameraCapture(cap, ir_cap, timebase, {
+        "rgb": {"fourcc": "MJPG", "width": 640, "height": 480, "fps": 30, "buffer_size": 1},
+        "ir": {"fourcc": "MJPG", "width": 640, "height": 480, "fps": 30, "buffer_size": 1, "gray": ir_single_channel},
+        "sync_grabs": True,
+    })
     print("[Main] Loading Camera...Done")
     target_size = 36 if model_choice == "Step" else 32
-    batch_size = 1 if model_choice == "Step" else 128
+    # PhysNet 在模型内部按滑动窗口缓存帧，预处理逐帧输出
+    batch_size = 1
+    # 预处理工作进程数，0 表示在主进程的线程中运行
+    preprocess_workers = {"rgb": 2, "ir": 1}
     print("[Main] Loading MediaPipe...")
-    preprocess = MediaPipePreprocess({
+    preprocess_params = {
         "target_size": (target_size, target_size),
         "mesh_display": False,
-    })
-    ir_preprocess = MediaPipePreprocess({
+        "tracking": True,
+        "redetect_interval": 10,
+        # 降帧处理（如 15）以节省 CPU，None 表示处理全部帧；仅 Step（dynamic_dt）支持
+        "target_fps": None,
+    }
+    ir_preprocess_params = {
         "target_size": (target_size, target_size),
         "mesh_display": False,
-    })
-    
-    print("[Main] Loading MediaPipe...Done")
-    if model_choice == "Step":
-        model = Step(
-            model_path="./model/models/onnx/step.onnx",
-            state_path="./model/models/onnx/state.pkl",
-            dt=1 / 30
-        )
+        # 以下仅用于 ir_roi_from_rgb
+        "mapping": "./roi_mapping.json",
+        "max_offset": 0.05,
+        "max_wait": 0.2,
+        "fallback": True,
+        "tracking": True,
+        "redetect_interval": 10,
+    }
+    if ir_roi_from_rgb:
+        # RGB 预处理把人脸框交给 IR 裁剪
+        shared_roi = SharedROI()
+        preprocess_params["roi_sink"] = shared_roi
+    if preprocess_workers["rgb"] > 0:
+        preprocess = ProcessPreprocess(dict(preprocess_params, workers=preprocess_workers["rgb"]))
     else:
-        model = PhysNet(
-            model_path="./model/models/onnx/physnet.onnx"
-        )
+        preprocess = MediaPipePreprocess(preprocess_params)
+    if ir_roi_from_rgb:
+        ir_preprocess = ROIPreprocess(ir_preprocess_params, shared_roi)
+    elif preprocess_workers["ir"] > 0:
+        ir_preprocess = ProcessPreprocess(dict(ir_preprocess_params, workers=preprocess_workers["ir"]))
+    else:
+        ir_preprocess = MediaPipePreprocess(ir_preprocess_params)
+
+    print("[Main] Loading MediaPipe...Done")
+    model = create_model(model_choice, ONNX_SESSION)
     print("[Main] Loading Model...Done")
     print("[Main] Loading Pipeline...")
     pipeline = Pipeline({
@@ -964,13 +1240,25 @@ def main():
         "ir_preprocess": ir_preprocess,
         "model": model,
         "ecg": ecg,
+        "ecg_processor": ecg_processor,
+        "timebase": timebase,
         "interrupt_hotkey": "esc",
         "max_queue_size": 512,
+        "frame_ring": {"slots": 16, "policy": "overwrite_oldest", "shared": True},
         "batch_size": batch_size,
         "max_display_points": 128,
         "time_limit": time_limit,
         "log_path": log_path,
         "fps": 30,
+        "picture_log_mode": "stream",
+        # 采集时在线合并日志并累计归一化统计量；停止时一次遍历写出 normalized_log.csv（服务器读取的会话内容），
+        # 另存每列的均值/标准差（normalization.json）。rescale=False 只保存后者，停止耗时与会话长度无关，
+        # 但需服务器端先支持
+        "online_merge": {"idle_timeout": 5.0, "rescale": True},
+        # "columnar": ECG/rPPG/R 波日志按列二进制存储（体积约为 CSV 的 1/2），需要时用 python -m log.columnar export 导出 CSV
+        "log_format": "csv",
+        # 每 10 秒 fsync 一次日志：断电时最多丢失约 10 秒的数据，同时减少 SD 卡的写入次数
+        "log_fsync_interval": 10.0,
         "perip_manager": peripmanager,
         "log": True,
     })
@@ -986,7 +1274,7 @@ def main():
         while True:
             if global_vars.pipeline_running:
                 if pipeline.inference_results:
-                    print("[Main] Latest Inference Results:", pipeline.inference_results[-5:])
+                    print("[Main] Latest Inference Results:", pipeline.inference_results[-5:].tolist())
                 else:
                     print("[Main] No inference results yet.")
             time.sleep(1)
@@ -995,6 +1283,12 @@ def main():
 
     print("[Main] Releasing resources...")
     bluetooth_handler.stop()
+    for stage in (preprocess, ir_preprocess):
+        if isinstance(stage, ProcessPreprocess):
+            stage.close()
+    for ring in (pipeline.frame_queue, pipeline.ir_frame_queue):
+        if isinstance(ring, FrameRing):
+            ring.close()
     cap.release()
 
 
@@ -1,19 +1,176 @@
-from queue import Queue
-import onnxruntime as ort
+import threading
+from queue import Queue, Empty
 import numpy as np
 from .base import ModelBase
+from .session import create_session
 import global_vars
 
 
 class PhysNet(ModelBase):
-    def __init__(self, model_path: str):
+    """
+    The PhysNet model: a window of `window` frames in, one BVP sample per frame out.
+
+    Frames are written into a preallocated (window, H, W, 3) float32 ring as they arrive, and
+    a window is run every `stride` frames, so consecutive windows overlap by window - stride
+    frames. Inference runs on a worker thread: the ring is unrolled into one of two float64
+    input buffers (double buffering), so frames keep flowing into the ring while the previous
+    window is being inferred.
+
+    The outputs of overlapping windows (already normalised per window by the model) are
+    stitched into one continuous BVP stream by weighted overlap-add with a Hann window.
+    A frame is emitted `emit_delay` frames after the end of the window that produced it:
+    with the default (window - stride) every frame is final, i.e. averaged over all the
+    windows that cover it; a smaller delay lowers the latency, at the cost of averaging the
+    newest frames over fewer windows. stride = window with emit_delay = 0 reproduces the
+    original non-overlapping behaviour.
+
+    At the end of the pipeline the stream is flushed: the windows in flight are finished, one
+    last window is run on the newest frames if some arrived after the last window, and the
+    frames held back by the delay are emitted with the windows that cover them so far. A
+    session shorter than one window gives no output.
+    """
+    INPUT_NAME = "x.1"
+    # Longest wait for the inference thread to finish at the end of the pipeline
+    FLUSH_TIMEOUT = 10.0
+
+    def __init__(self, model_path: str, session_config: dict = None, window: int = 128, stride: int = None,
+                 emit_delay: int = None):
         super().__init__()
-        self.model = ort.InferenceSession(model_path)
+        self.model = create_session(model_path, session_config)
+        self.window = window
+        self.stride = stride or window
+        self.emit_delay = emit_delay if emit_delay is not None else window - self.stride
+        if not 0 < self.stride <= window or not 0 <= self.emit_delay <= window - self.stride:
+            raise ValueError(f"Invalid PhysNet stride {self.stride} / emit_delay {self.emit_delay} for window {window}")
+        # Never exactly zero at the edges, so a frame seen by a single window still has a weight
+        self.weights = np.hanning(window + 2)[1:-1].astype(np.float32)
+        self.frames = None
+        self.timestamps = np.zeros(window, dtype=np.float64)
+        self.inputs = None
+        self.windows_run = 0
+        self.windows_skipped = 0
+
+    def _allocate(self, shape: tuple) -> None:
+        self.frames = np.empty((self.window, *shape), dtype=np.float32)
+        self.inputs = [np.empty((1, self.window, *shape), dtype=np.float64) for _ in range(2)]
+
+    def _reset_stream(self) -> None:
+        self.count = 0  # frames written since start
+        self.next_window = self.window  # frame count at which the next window is due
+        self.acc = np.zeros(self.window, dtype=np.float32)
+        self.weight_sum = np.zeros(self.window, dtype=np.float32)
+        self.acc_start = 0  # absolute index of acc[0]
+        self.acc_timestamps = None  # timestamps of the frames in acc
+        self.emitted = 0  # absolute index of the next frame to emit
+        self.submitted = 0  # frame count at the end of the last window submitted
+
+    def _submit(self, jobs: Queue, free: Queue, timeout: float = None) -> None:
+        """
+        Unroll the ring into a free input buffer and hand it to the inference thread.
+        :param timeout: seconds to wait for a free buffer; None skips the window if none is free
+        """
+        try:
+            buffer = free.get_nowait() if timeout is None else free.get(timeout=timeout)
+        except Empty:
+            # Inference is behind: skip this window, the next one covers the frames anyway
+            self.windows_skipped += 1
+            return
+        start = self.count - self.window
+        head = self.count % self.window  # ring position of the oldest frame
+        tail = self.window - head
+        batch = self.inputs[buffer][0]
+        np.divide(self.frames[head:], 255.0, out=batch[:tail])
+        np.divide(self.frames[:head], 255.0, out=batch[tail:])
+        timestamps = np.concatenate((self.timestamps[head:], self.timestamps[:head]))
+        jobs.put((buffer, start, timestamps))
+        self.submitted = self.count
+
+    def _stitch(self, start: int, bvp: np.ndarray, timestamps: np.ndarray, result_queue: Queue) -> None:
+        """Overlap-add one window's output and emit the frames that are due."""
+        shift = start - self.acc_start
+        if shift >= self.window:
+            self.acc[:] = 0
+            self.weight_sum[:] = 0
+        elif shift > 0:
+            self.acc[:-shift] = self.acc[shift:]
+            self.acc[-shift:] = 0
+            self.weight_sum[:-shift] = self.weight_sum[shift:]
+            self.weight_sum[-shift:] = 0
+        self.acc_start = start
+        self.acc_timestamps = timestamps
+        self.acc += bvp * self.weights
+        self.weight_sum += self.weights
+
+        begin = max(self.emitted, start) - start
+        end = self.window - self.emit_delay
+        if end > begin:
+            values = self.acc[begin:end] / self.weight_sum[begin:end]
+            result_queue.put((values.tolist(), timestamps[begin:end].tolist()))
+            self.emitted = start + end
+
+    def _flush(self, result_queue: Queue) -> None:
+        """Emit the frames held back by emit_delay, averaged over the windows stitched so far."""
+        if self.acc_timestamps is None:
+            return
+        begin = max(self.emitted - self.acc_start, 0)
+        if begin < self.window:
+            values = self.acc[begin:] / self.weight_sum[begin:]
+            result_queue.put((values.tolist(), self.acc_timestamps[begin:].tolist()))
+            self.emitted = self.acc_start + self.window
+
+    def _infer(self, jobs: Queue, free: Queue, result_queue: Queue, stop: threading.Event) -> None:
+        while not stop.is_set() or not jobs.empty():
+            try:
+                buffer, start, timestamps = jobs.get(timeout=0.1)
+            except Empty:
+                continue
+            try:
+                bvp = self.model.run(None, {self.INPUT_NAME: self.inputs[buffer]})[0][0]
+            except Exception as e:
+                print(f"[PhysNet] Inference failed: {e}")
+                continue
+            finally:
+                free.put(buffer)
+            self.windows_run += 1
+            self._stitch(start, bvp, timestamps, result_queue)
 
     def __call__(self, preprocess_queue: Queue, result_queue: Queue):
+        self._reset_stream()
+        jobs = Queue()
+        free = Queue()
+        free.put(0)
+        free.put(1)
+        stop = threading.Event()
+        worker = threading.Thread(
+            target=self._infer,
+            args=(jobs, free, result_queue, stop),
+            daemon=True,
+            name="PhysNetInferenceThread",
+        )
+        worker.start()
         while global_vars.pipeline_running:
-            frame, timestamp = preprocess_queue.get()
-            batch = np.array([frame]).astype("float64") / 255.0
-            input_dict = {"x.1": batch}
-            result = self.model.run(None, input_dict)
-            result_queue.put((result[0][0], timestamp))
+            try:
+                frames, timestamps = preprocess_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            for frame, timestamp in zip(frames, timestamps):
+                if self.frames is None:
+                    self._allocate(frame.shape)
+                slot = self.count % self.window
+                self.frames[slot] = frame
+                self.timestamps[slot] = timestamp
+                self.count += 1
+                if self.count >= self.next_window:
+                    self._submit(jobs, free)
+                    self.next_window += self.stride
+        # Frames that arrived after the last window (or whose window was skipped) get one
+        # last window on the newest frames, waiting for a buffer instead of skipping it
+        if self.frames is not None and self.count >= self.window and self.count > self.submitted:
+            self._submit(jobs, free, timeout=self.FLUSH_TIMEOUT)
+        stop.set()
+        worker.join(timeout=self.FLUSH_TIMEOUT)
+        if worker.is_alive():
+            print("[PhysNet] Warning: inference did not finish, the last BVP samples are dropped")
+        else:
+            self._flush(result_queue)
+        print(f"[PhysNet] {self.windows_run} windows inferred, {self.windows_skipped} skipped")
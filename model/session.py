@@ -0,0 +1,37 @@
+import onnxruntime as ort
+
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def build_session_options(config: dict = None) -> ort.SessionOptions:
+    """
+    Build ONNX Runtime session options from a config dict.
+    :param config: optional keys
+      - "intra_op_num_threads": threads used inside an operator (0 = ORT default)
+      - "inter_op_num_threads": threads used across operators in parallel mode (0 = ORT default)
+      - "graph_optimization_level": "disable" / "basic" / "extended" / "all"
+      - "execution_mode": "sequential" / "parallel"
+    :return: ort.SessionOptions
+    """
+    config = config or {}
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = config.get("intra_op_num_threads", 0)
+    options.inter_op_num_threads = config.get("inter_op_num_threads", 0)
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[config.get("graph_optimization_level", "all")]
+    options.execution_mode = EXECUTION_MODES[config.get("execution_mode", "sequential")]
+    return options
+
+
+def create_session(model_path: str, config: dict = None) -> ort.InferenceSession:
+    return ort.InferenceSession(model_path, sess_options=build_session_options(config), providers=["CPUExecutionProvider"])
@@ -3,30 +3,122 @@ import pickle
 import onnxruntime as ort
 import numpy as np
 from .base import ModelBase
+from .session import create_session
 import global_vars
 
 
 class Step(ModelBase):
-    def __init__(self, model_path, state_path, dt: float):
+    """
+    The Step model: one frame in, one BVP sample out, with recurrent state carried between frames.
+
+    With `io_binding=True` the session runs on preallocated buffers bound once through
+    ONNX Runtime IOBinding: the input frame is converted in place, and the recurrent state
+    ping-pongs between two buffer sets (the outputs of one run are the inputs of the next),
+    so no per-frame dicts or arrays are built.
+
+    With `dynamic_dt=True` the dt input is taken from the spacing of the frame timestamps
+    instead of the nominal `dt`, so dropped or deliberately skipped frames are integrated
+    over the time that actually passed. The measured dt is clamped to [min_dt, max_dt];
+    the nominal dt is used for the first frame and after a gap longer than `max_dt`
+    (the state is not meant to bridge such gaps anyway).
+    """
+    INPUT_NAME = "arg_0.1"
+    DT_NAME = "onnx::Mul_37"
+
+    def __init__(self, model_path, state_path, dt: float, session_config: dict = None, io_binding: bool = False,
+                 dynamic_dt: bool = False, min_dt: float = None, max_dt: float = None):
         super().__init__()
         self.model_path = model_path
         self.state_path = state_path
-        self.model = ort.InferenceSession(model_path)
+        self.model = create_session(model_path, session_config)
         with open(state_path, "rb") as f:
             self.state = pickle.load(f)
+        # 0-d array so that the IOBinding input sees in-place updates
         self.dt = np.array(dt).astype("float16")
+        self.nominal_dt = dt
+        self.dynamic_dt = dynamic_dt
+        self.min_dt = min_dt if min_dt is not None else dt / 4
+        self.max_dt = max_dt if max_dt is not None else dt * 4
+        self.last_timestamp = None
+        self.io_binding = io_binding
+        if io_binding:
+            self._init_io_binding()
+
+    def _init_io_binding(self) -> None:
+        input_shape = next(i.shape for i in self.model.get_inputs() if i.name == self.INPUT_NAME)
+        self.output_names = [o.name for o in self.model.get_outputs()]
+        self.state_names = list(self.state)
+        self.image = np.zeros(input_shape, dtype=np.float16)
+        self.bvp = np.zeros((1, 1), dtype=np.float16)
+        self.state_buffers = [
+            [np.array(self.state[name], dtype=np.float16) for name in self.state_names],
+            [np.empty_like(self.state[name], dtype=np.float16) for name in self.state_names],
+        ]
+        # OrtValues share memory with the numpy buffers above
+        image_value = ort.OrtValue.ortvalue_from_numpy(self.image)
+        dt_value = ort.OrtValue.ortvalue_from_numpy(self.dt)
+        bvp_value = ort.OrtValue.ortvalue_from_numpy(self.bvp)
+        state_values = [[ort.OrtValue.ortvalue_from_numpy(b) for b in buffers] for buffers in self.state_buffers]
+        self.bindings = []
+        for src, dst in ((0, 1), (1, 0)):
+            binding = self.model.io_binding()
+            binding.bind_ortvalue_input(self.INPUT_NAME, image_value)
+            binding.bind_ortvalue_input(self.DT_NAME, dt_value)
+            binding.bind_ortvalue_output(self.output_names[0], bvp_value)
+            for name, output_name, src_value, dst_value in zip(
+                    self.state_names, self.output_names[1:], state_values[src], state_values[dst]):
+                binding.bind_ortvalue_input(name, src_value)
+                binding.bind_ortvalue_output(output_name, dst_value)
+            self.bindings.append(binding)
+        self.current = 0
+        # Keep the OrtValues alive for as long as the bindings are used
+        self._ort_values = (image_value, dt_value, bvp_value, state_values)
+
+    def update_dt(self, timestamp: float) -> None:
+        """Set the dt input from the time elapsed since the previous frame."""
+        if self.last_timestamp is None:
+            dt = self.nominal_dt
+        else:
+            dt = timestamp - self.last_timestamp
+            if dt <= 0 or dt > self.max_dt:
+                dt = self.nominal_dt
+            elif dt < self.min_dt:
+                dt = self.min_dt
+        self.last_timestamp = timestamp
+        self.dt[()] = dt
+
+    def infer(self, frame: np.ndarray, timestamp: float = None) -> float:
+        """
+        Run one frame through the model and advance the recurrent state.
+        :param frame: (36, 36, 3) image with values in [0, 255]
+        :param timestamp: capture time of the frame in seconds, used when `dynamic_dt` is set
+        :return: the BVP sample
+        """
+        if self.dynamic_dt and timestamp is not None:
+            self.update_dt(timestamp)
+        if not self.io_binding:
+            image = np.array([[frame]]).astype("float16") / 255.0
+            input_dict = {self.INPUT_NAME: image, self.DT_NAME: self.dt, **self.state}
+            result = self.model.run(None, input_dict)
+            self.state = dict(zip(list(input_dict)[2:], result[1:]))
+            return result[0][0, 0]
+        self.image[0, 0] = frame
+        np.divide(self.image, 255.0, out=self.image)
+        self.model.run_with_iobinding(self.bindings[self.current])
+        self.current ^= 1
+        return self.bvp[0, 0]
+
+    def get_state(self) -> dict:
+        if not self.io_binding:
+            return self.state
+        return {name: buffer.copy() for name, buffer in zip(self.state_names, self.state_buffers[self.current])}
 
     def __call__(self, preprocess_queue: Queue, result_queue: Queue):
         while global_vars.pipeline_running:
-            # TODO: Calculate `dt` dynamically
             try:
-                frame, timestamp = preprocess_queue.get(timeout=0.5)
+                frames, timestamps = preprocess_queue.get(timeout=0.5)
             except:
                 continue
-            image = np.array([frame]).astype("float16") / 255.0
-            input_dict = {"arg_0.1": image, "onnx::Mul_37": self.dt, **self.state}
-            result = self.model.run(None, input_dict)
-            self.state = dict(zip(list(input_dict)[2:], result[1:]))
-            result_queue.put([[result[0][0, 0]], timestamp])
+            result_queue.put([[self.infer(frame, timestamp) for frame, timestamp in zip(frames, timestamps)], timestamps])
         with open(self.state_path, "wb") as f:
-            pickle.dump(self.state, f)
+            pickle.dump(self.get_state(), f)
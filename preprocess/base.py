@@ -1,6 +1,9 @@
 from abc import abstractmethod
 from queue import Queue
 
+import cv2
+import numpy as np
+
 
 class PreprocessBase:
     def __init__(self):
@@ -9,3 +12,55 @@ class PreprocessBase:
     @abstractmethod
     def __call__(self, frame_queue: Queue, preprocess_queue: Queue, side_queue: Queue, log_queue:Queue, batch_size: int):
         pass
+
+
+class FrameDecimator:
+    """
+    Lets frames through at (at most) a target rate, judged by their capture timestamps.
+    Used to run preprocessing below the camera frame rate on purpose; the timestamps of the
+    kept frames still go downstream, so the model sees the real spacing between them.
+    """
+    def __init__(self, target_fps: float = None, tolerance: float = 0.25):
+        self.interval = 1.0 / target_fps if target_fps else 0.0
+        self.tolerance = tolerance * self.interval
+        self.next_time = None
+        self.skipped = 0
+
+    def accept(self, timestamp: float) -> bool:
+        if not self.interval:
+            return True
+        if self.next_time is not None and timestamp < self.next_time - self.tolerance:
+            self.skipped += 1
+            return False
+        # Stay on the target grid unless the stream fell behind it
+        if self.next_time is None or timestamp - self.next_time >= self.interval:
+            self.next_time = timestamp + self.interval
+        else:
+            self.next_time += self.interval
+        return True
+
+
+class BoxCropper:
+    """
+    Crops a normalized box out of an image and resizes it, for 3-channel and single-channel
+    frames alike. The resize runs on uint8 into a reused buffer; the only float conversion
+    is the float32 copy handed downstream.
+    """
+    def __init__(self):
+        self.resized = None
+
+    def __call__(self, image: np.ndarray, box: np.ndarray, size: tuple[int, int]):
+        """
+        :param box: normalized [x_min, y_min, x_max, y_max]
+        :param size: target size (width, height)
+        :return: float32 (height, width[, channels]) crop, or None if the box is empty
+        """
+        height, width = image.shape[:2]
+        roi = image[int(box[1] * height):int(box[3] * height), int(box[0] * width):int(box[2] * width)]
+        if roi.size == 0:
+            return None
+        if self.resized is None or self.resized.shape != (size[1], size[0], *roi.shape[2:]) \
+                or self.resized.dtype != roi.dtype:
+            self.resized = np.empty((size[1], size[0], *roi.shape[2:]), dtype=roi.dtype)
+        cv2.resize(roi, size, dst=self.resized, interpolation=cv2.INTER_AREA)
+        return self.resized.astype(np.float32)
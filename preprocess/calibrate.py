@@ -0,0 +1,66 @@
+"""
+One-off calibration of the RGB -> IR ROI mapping (preprocess.roi.ROIMapping).
+
+Both cameras are grabbed back to back; on every pair where FaceMesh finds the face in
+both images, the 468 landmarks give 468 point correspondences. Once enough pairs have
+been collected a homography (or affine transform) is fitted with RANSAC and written as
+JSON, to be loaded by ROIPreprocess through its "mapping" param. Move the head around the
+field of view while it runs, so the points cover the area the face will be in.
+
+Run from the repository root:
+    python -m preprocess.calibrate --rgb /dev/video0 --ir /dev/video2 --pairs 30 --output roi_mapping.json
+"""
+import argparse
+
+import cv2
+import numpy as np
+
+from .mp import MediaPipePreprocess
+from .roi import ROIMapping
+
+
+def landmarks(preprocess: MediaPipePreprocess, image: np.ndarray):
+    """:return: (468, 2) normalized landmarks of the face in an RGB image, or None"""
+    box, _ = preprocess.detect_box(image)
+    return None if box is None else preprocess.landmarks.T.copy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rgb", required=True, help="RGB camera device")
+    parser.add_argument("--ir", required=True, help="IR camera device")
+    parser.add_argument("--pairs", type=int, default=30, help="frame pairs with a face in both images")
+    parser.add_argument("--model", choices=("homography", "affine"), default="homography")
+    parser.add_argument("--output", default="roi_mapping.json")
+    args = parser.parse_args()
+
+    cap, ir_cap = cv2.VideoCapture(args.rgb), cv2.VideoCapture(args.ir)
+    preprocess = MediaPipePreprocess({"target_size": (36, 36), "mesh_display": False})
+    rgb_points, ir_points = [], []
+    attempts = 0
+    while len(rgb_points) < args.pairs and attempts < args.pairs * 20:
+        attempts += 1
+        if not (cap.grab() and ir_cap.grab()):
+            continue
+        (success, frame), (ir_success, ir_frame) = cap.retrieve(), ir_cap.retrieve()
+        if not (success and ir_success):
+            continue
+        rgb = landmarks(preprocess, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        ir = landmarks(preprocess, cv2.cvtColor(ir_frame, cv2.COLOR_BGR2RGB))
+        if rgb is None or ir is None:
+            continue
+        rgb_points.append(rgb)
+        ir_points.append(ir)
+        print(f"[Calibrate] {len(rgb_points)}/{args.pairs} pairs")
+    cap.release()
+    ir_cap.release()
+    if not rgb_points:
+        raise SystemExit("[Calibrate] No frame pair with a face in both images")
+
+    mapping = ROIMapping.estimate(np.concatenate(rgb_points), np.concatenate(ir_points), args.model)
+    mapping.save(args.output)
+    print(f"[Calibrate] {args.model} from {mapping.points} points, rms {mapping.rms:.4f} (normalized), saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
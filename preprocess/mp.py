@@ -1,15 +1,24 @@
-from queue import Queue
+from queue import Queue, Empty
 import mediapipe as mp
 import numpy as np
 import cv2
 from typing import Any
 import global_vars
-from .base import PreprocessBase
+from capture.ring import FrameRing
+from .base import PreprocessBase, FrameDecimator, BoxCropper
+from .tracker import ROITracker
 
 mp_face_mesh = mp.solutions.face_mesh
 mp_drawing = mp.solutions.drawing_utils
 mp_drawing_styles = mp.solutions.drawing_styles
 
+# A serialized NormalizedLandmarkList is a run of 17-byte records:
+# 0x0a 0x0f (landmark, 15 bytes) 0x0d x:f32 0x15 y:f32 0x1d z:f32
+LANDMARK_RECORD_SIZE = 17
+LANDMARK_RECORD = np.dtype({"names": ["x", "y"], "formats": ["<f4", "<f4"], "offsets": [3, 8], "itemsize": LANDMARK_RECORD_SIZE})
+LANDMARK_TAG_OFFSETS = np.array([0, 1, 2, 7, 12])
+LANDMARK_TAGS = np.array([0x0A, 0x0F, 0x0D, 0x15, 0x1D], dtype=np.uint8)
+
 
 class MediaPipePreprocess(PreprocessBase):
     def __init__(self, params):
@@ -20,6 +29,83 @@ class MediaPipePreprocess(PreprocessBase):
             static_image_mode=True,
             max_num_faces=1
         )
+        # Tracking mode: run FaceMesh every `redetect_interval` frames (or when tracking is lost)
+        # and follow the box with optical flow in between
+        self.tracking = params.get("tracking", False)
+        self.redetect_interval = params.get("redetect_interval", 10)
+        self.tracker = ROITracker(params.get("tracker"))
+        self.frames_since_detection = 0
+        self.detections = 0
+        self.tracking_losses = 0
+        # Frame-skip mode: only frames at `target_fps` (by timestamp) are processed
+        self.target_fps = params.get("target_fps")
+        # Reused buffers: landmark coordinates (row 0: x, row 1: y) and the uint8 resize output
+        self.landmarks = np.empty((2, 468), dtype=np.float32)
+        self.cropper = BoxCropper()
+        # Face boxes are shared with the IR crop (preprocess.roi.SharedROI) when given
+        self.roi_sink = params.get("roi_sink")
+        self.last_box = None
+
+    def landmark_box(self, face_landmarks) -> np.ndarray:
+        """
+        Bounding box of a face's landmarks.
+        The landmarks are read in bulk from the serialized protobuf into `self.landmarks`;
+        if the message does not have the plain x/y/z layout, they are read field by field.
+        :param face_landmarks: a NormalizedLandmarkList from FaceMesh
+        :return: normalized box [x_min, y_min, x_max, y_max]
+        """
+        count = len(face_landmarks.landmark)
+        if self.landmarks.shape[1] != count:
+            self.landmarks = np.empty((2, count), dtype=np.float32)
+        raw = np.frombuffer(face_landmarks.SerializeToString(), dtype=np.uint8)
+        if raw.size == count * LANDMARK_RECORD_SIZE and \
+                (raw.reshape(count, LANDMARK_RECORD_SIZE)[:, LANDMARK_TAG_OFFSETS] == LANDMARK_TAGS).all():
+            records = raw.view(LANDMARK_RECORD)
+            self.landmarks[0] = records["x"]
+            self.landmarks[1] = records["y"]
+        else:
+            self.landmarks[0] = np.fromiter((landmark.x for landmark in face_landmarks.landmark), np.float32, count)
+            self.landmarks[1] = np.fromiter((landmark.y for landmark in face_landmarks.landmark), np.float32, count)
+        box = np.concatenate([self.landmarks.min(axis=1), self.landmarks.max(axis=1)])
+        return np.clip(box, 0, 1.0)
+
+    def detect_box(self, image: np.ndarray) -> Any:
+        """
+        Run FaceMesh on an image and take the bounding box of the landmarks.
+        :param image: RGB image
+        :return: (normalized box [x_min, y_min, x_max, y_max] or None, FaceMesh results)
+        """
+        self.detections += 1
+        results = self.face_mesh.process(image)
+        if not results.multi_face_landmarks:
+            return None, results
+        return self.landmark_box(results.multi_face_landmarks[0]), results
+
+    def locate_face(self, image: np.ndarray) -> Any:
+        """
+        Find the face box, either by detection on every frame or, in tracking mode,
+        by following the last detected box until the next scheduled re-detection.
+        :param image: RGB image
+        :return: (normalized box or None, FaceMesh results or None when the box was tracked)
+        """
+        if not self.tracking:
+            return self.detect_box(image)
+        height, width, _ = image.shape
+        scale = np.array([width, height, width, height], dtype=np.float32)
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        self.frames_since_detection += 1
+        if self.tracker.active and self.frames_since_detection < self.redetect_interval:
+            box = self.tracker.update(gray)
+            if box is not None:
+                return np.clip(box / scale, 0, 1.0), None
+            self.tracking_losses += 1
+        box, results = self.detect_box(image)
+        self.frames_since_detection = 0
+        if box is not None:
+            self.tracker.init(gray, box * scale)
+        else:
+            self.tracker.reset()
+        return box, results
 
     def crop_resize(self, image: np.ndarray, size: tuple[int, int]) -> Any:
         """
@@ -28,11 +114,13 @@ class MediaPipePreprocess(PreprocessBase):
         :param size: target image size (width, height)
         :return: cropped and resized image
         """
-        height, width, _ = image.shape
-        results = self.face_mesh.process(image)
-        raw_image = np.copy(image)
-        if results.multi_face_landmarks and len(results.multi_face_landmarks) > 0:
-            if self.mesh_display:
+        box, results = self.locate_face(image)
+        self.last_box = box
+        # The full frame is only copied when the mesh overlay is drawn on it
+        raw_image = image
+        if self.mesh_display:
+            raw_image = np.copy(image)
+            if results is not None and results.multi_face_landmarks:
                 for face_landmarks in results.multi_face_landmarks:
                     mp_drawing.draw_landmarks(
                         image=raw_image,
@@ -41,29 +129,44 @@ class MediaPipePreprocess(PreprocessBase):
                         landmark_drawing_spec=None,
                         connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_tesselation_style(),
                     )
-            multi_landmarks = results.multi_face_landmarks[0]
-            landmarks = np.array(
-                [(landmark.x, landmark.y) for landmark in
-                 multi_landmarks.landmark])
-            x_min, y_min = np.min(landmarks, axis=0)
-            x_max, y_max = np.max(landmarks, axis=0)
-            box = np.clip(np.array([x_min, y_min, x_max, y_max]), 0, 1.0)
-            cropped_resized = cv2.resize(
-                image[int(box[1] * height):int(box[3] * height), int(box[0] * width):int(box[2] * width)].astype("float32"),
-                size,
-                interpolation=cv2.INTER_AREA
-            )
-            return cropped_resized, raw_image
-        else:
+        if box is None:
             return None, raw_image
+        return self.crop_box(image, box, size), raw_image
+
+    def crop_box(self, image: np.ndarray, box: np.ndarray, size: tuple[int, int]) -> Any:
+        """
+        Crop a normalized box out of an image and resize it to a given size (see BoxCropper).
+        :return: float32 (height, width, 3) crop, or None if the box is empty
+        """
+        return self.cropper(image, box, size)
 
     def __call__(self, frame_queue: Queue, preprocess_queue: Queue, log_queue: Queue, batch_size: int):
         cropped_frames = []
         timestamps = []
         size = 0
+        use_ring = isinstance(frame_queue, FrameRing)
+        decimator = FrameDecimator(self.target_fps)
         while global_vars.pipeline_running:
-            frame, timestamp = frame_queue.get()
-            preprocessed, raw = self.crop_resize(frame, self.target_size)
+            if use_ring:
+                # Read the frame in place; the slot goes back to the ring once it has been cropped
+                try:
+                    index, frame, timestamp = frame_queue.get(timeout=0.5)
+                except Empty:
+                    continue
+                try:
+                    if not decimator.accept(timestamp):
+                        continue
+                    preprocessed, raw = self.crop_resize(frame, self.target_size)
+                finally:
+                    frame_queue.release(index)
+            else:
+                frame, timestamp = frame_queue.get()
+                if not decimator.accept(timestamp):
+                    continue
+                preprocessed, raw = self.crop_resize(frame, self.target_size)
+            if self.roi_sink is not None:
+                # Frames without a face are passed on too: the IR crop knows then not to wait for a box
+                self.roi_sink.update(self.last_box, timestamp)
             if preprocessed is not None:
                 cropped_frames.append(preprocessed)
                 timestamps.append(timestamp)
@@ -0,0 +1,56 @@
+from queue import Queue, Empty
+
+import numpy as np
+
+import global_vars
+from capture.ring import FrameRing
+from .base import PreprocessBase, FrameDecimator, BoxCropper
+
+# The whole frame as a normalized box
+FULL_FRAME = np.array([0.0, 0.0, 1.0, 1.0], dtype=np.float32)
+
+
+class PassthroughPreprocess(PreprocessBase):
+    """
+    Preprocess for frames that already are face crops, e.g. the videos of a recorded
+    session played by capture.replay.ReplayCapture: every frame is only resized to the
+    target size and handed on as float32, batched like MediaPipePreprocess.
+
+    params:
+      - "target_size": crop size (width, height)
+      - "target_fps": optional frame-skip rate, as in MediaPipePreprocess
+    """
+    def __init__(self, params: dict) -> None:
+        super().__init__()
+        self.target_size = params["target_size"]
+        self.target_fps = params.get("target_fps")
+        self.cropper = BoxCropper()
+
+    def __call__(self, frame_queue: Queue, preprocess_queue: Queue, log_queue: Queue, batch_size: int):
+        cropped_frames = []
+        timestamps = []
+        use_ring = isinstance(frame_queue, FrameRing)
+        decimator = FrameDecimator(self.target_fps)
+        while global_vars.pipeline_running:
+            try:
+                if use_ring:
+                    index, frame, timestamp = frame_queue.get(timeout=0.5)
+                else:
+                    frame, timestamp = frame_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            try:
+                cropped = self.cropper(frame, FULL_FRAME, self.target_size) if decimator.accept(timestamp) else None
+            finally:
+                if use_ring:
+                    frame_queue.release(index)
+            if cropped is None:
+                continue
+            cropped_frames.append(cropped)
+            timestamps.append(timestamp)
+            if len(cropped_frames) >= batch_size:
+                if preprocess_queue is not None:
+                    preprocess_queue.put((cropped_frames, timestamps))
+                log_queue.put((cropped_frames, timestamps))
+                cropped_frames = []
+                timestamps = []
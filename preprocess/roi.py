@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+from bisect import bisect_left
+from collections import deque
+from queue import Queue, Empty
+
+import cv2
+import numpy as np
+
+import global_vars
+from capture.ring import FrameRing
+from .base import PreprocessBase, FrameDecimator, BoxCropper
+
+
+class SharedROI:
+    """
+    The face boxes found on the RGB stream over the last `history` seconds, handed from the
+    RGB preprocess to the IR crop. Boxes are normalized [x_min, y_min, x_max, y_max] with
+    their frame timestamp; frames in which no face was found are recorded with a None box,
+    so the IR side can tell "no face" from "not processed yet".
+    """
+    def __init__(self, history: float = 2.0) -> None:
+        self.history = history
+        self.cond = threading.Condition()
+        self.timestamps = deque()
+        self.boxes = deque()
+
+    def update(self, box: np.ndarray, timestamp: float) -> None:
+        with self.cond:
+            self.timestamps.append(timestamp)
+            self.boxes.append(None if box is None else np.array(box, dtype=np.float32))
+            while self.timestamps[0] < timestamp - self.history:
+                self.timestamps.popleft()
+                self.boxes.popleft()
+            self.cond.notify_all()
+
+    def latest(self):
+        """:return: (box, timestamp) of the latest face box, or (None, None)"""
+        with self.cond:
+            for box, timestamp in zip(reversed(self.boxes), reversed(self.timestamps)):
+                if box is not None:
+                    return box, timestamp
+        return None, None
+
+    def match(self, timestamp: float, max_offset: float, timeout: float = 0.0):
+        """
+        The RGB face box at `timestamp`: interpolated between the RGB frames on either side
+        of it, or the nearer of them when only one has a face.
+        :param max_offset: largest distance in seconds to a usable RGB frame
+        :param timeout: seconds to wait for the RGB stream to get past `timestamp`
+        :return: normalized box, or None if no RGB box matches
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.timestamps and self.timestamps[-1] >= timestamp, timeout)
+            index = bisect_left(self.timestamps, timestamp)
+            before = (self.timestamps[index - 1], self.boxes[index - 1]) if index > 0 else None
+            after = (self.timestamps[index], self.boxes[index]) if index < len(self.timestamps) else None
+        candidates = [entry for entry in (before, after)
+                      if entry is not None and entry[1] is not None and abs(entry[0] - timestamp) <= max_offset]
+        if len(candidates) == 2 and after[0] > before[0]:
+            weight = (timestamp - before[0]) / (after[0] - before[0])
+            return (1 - weight) * before[1] + weight * after[1]
+        if candidates:
+            return min(candidates, key=lambda entry: abs(entry[0] - timestamp))[1]
+        return None
+
+    def clear(self) -> None:
+        with self.cond:
+            self.timestamps.clear()
+            self.boxes.clear()
+
+
+class ROIMapping:
+    """
+    Fixed transform from normalized RGB image coordinates to normalized IR image coordinates
+    (a 3x3 homography; an affine transform is stored as one with [0, 0, 1] as last row).
+
+    It is estimated once from corresponding points of both cameras, e.g. FaceMesh landmarks
+    found on simultaneous RGB and IR frames (see `python -m preprocess.calibrate`), and
+    stored as JSON: {"model": ..., "matrix": [[...], [...], [...]], "points": n, "rms": ...}.
+    """
+    def __init__(self, matrix: np.ndarray = None, model: str = "identity", rms: float = None, points: int = 0) -> None:
+        self.matrix = np.eye(3) if matrix is None else np.asarray(matrix, dtype=np.float64)
+        self.model = model
+        self.rms = rms
+        self.points = points
+
+    @classmethod
+    def estimate(cls, rgb_points: np.ndarray, ir_points: np.ndarray, model: str = "homography") -> "ROIMapping":
+        """
+        :param rgb_points: (n, 2) normalized RGB coordinates
+        :param ir_points: (n, 2) normalized IR coordinates of the same points
+        :param model: "homography" or "affine"
+        """
+        rgb_points = np.asarray(rgb_points, dtype=np.float64).reshape(-1, 1, 2)
+        ir_points = np.asarray(ir_points, dtype=np.float64).reshape(-1, 1, 2)
+        if model == "homography":
+            matrix, _ = cv2.findHomography(rgb_points, ir_points, cv2.RANSAC, 0.01)
+        elif model == "affine":
+            affine, _ = cv2.estimateAffine2D(rgb_points, ir_points, ransacReprojThreshold=0.01)
+            matrix = None if affine is None else np.vstack([affine, [0, 0, 1]])
+        else:
+            raise ValueError(f"Unknown ROI mapping model: {model}")
+        if matrix is None:
+            raise ValueError("Not enough corresponding points to estimate the ROI mapping")
+        mapping = cls(matrix, model, points=len(rgb_points))
+        errors = mapping.map_points(rgb_points.reshape(-1, 2)) - ir_points.reshape(-1, 2)
+        mapping.rms = float(np.sqrt((errors ** 2).sum(axis=1).mean()))
+        return mapping
+
+    def map_points(self, points: np.ndarray) -> np.ndarray:
+        return cv2.perspectiveTransform(np.asarray(points, dtype=np.float64).reshape(-1, 1, 2), self.matrix).reshape(-1, 2)
+
+    def map_box(self, box: np.ndarray) -> np.ndarray:
+        """:return: normalized IR box enclosing the mapped corners of an RGB box"""
+        if self.model == "identity":
+            return box
+        corners = self.map_points([[box[0], box[1]], [box[2], box[1]], [box[0], box[3]], [box[2], box[3]]])
+        return np.clip(np.concatenate([corners.min(axis=0), corners.max(axis=0)]), 0, 1.0).astype(np.float32)
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"model": self.model, "matrix": self.matrix.tolist(), "points": self.points, "rms": self.rms}, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "ROIMapping":
+        """:return: the mapping stored at `path`, or the identity if there is no such file"""
+        if not path or not os.path.exists(path):
+            print(f"[ROIMapping] No calibration at {path}, using the identity mapping")
+            return cls()
+        with open(path) as f:
+            config = json.load(f)
+        print(f"[ROIMapping] Loaded {config['model']} mapping from {path} (rms {config.get('rms')})")
+        return cls(config["matrix"], config["model"], config.get("rms"), config.get("points", 0))
+
+
+class ROIPreprocess(PreprocessBase):
+    """
+    Crops IR frames with the face box of the RGB stream instead of running FaceMesh on them.
+
+    For each IR frame the RGB box at the same timestamp is taken from the SharedROI
+    (interpolated between the neighbouring RGB frames, waiting up to `max_wait` for the
+    RGB preprocess to get there) and mapped into the IR image by the calibrated ROIMapping.
+    Only when no RGB box matches, i.e. the RGB stream lost the face or lags too far behind,
+    the IR frame goes through its own FaceMesh detection (`fallback`), or is skipped.
+
+    Works on single-channel (luma) frames as well as 3-channel ones; the crops keep the
+    channel count of the frames.
+
+    params:
+      - "target_size": crop size (width, height)
+      - "mapping": path of the ROIMapping JSON, or an ROIMapping (default: identity)
+      - "max_offset": largest distance in seconds between the IR frame and an RGB box (default 0.05)
+      - "max_wait": seconds to wait for the RGB box of a frame (default 0.2)
+      - "fallback": detect the face on the IR frame when no RGB box matches (default True);
+        the MediaPipePreprocess params (e.g. "tracking") apply to this detection
+      - "target_fps": optional frame-skip rate, as in MediaPipePreprocess
+    """
+    def __init__(self, params: dict, roi: SharedROI) -> None:
+        super().__init__()
+        self.params = params
+        self.target_size = params["target_size"]
+        mapping = params.get("mapping")
+        self.mapping = mapping if isinstance(mapping, ROIMapping) else ROIMapping.load(mapping)
+        self.max_offset = params.get("max_offset", 0.05)
+        self.max_wait = params.get("max_wait", 0.2)
+        self.fallback = params.get("fallback", True)
+        self.target_fps = params.get("target_fps")
+        self.roi = roi
+        self.cropper = BoxCropper()
+        self.detector = None  # MediaPipePreprocess, loaded on the first fallback
+        self.reset()
+
+    def reset(self) -> None:
+        # counters
+        self.matched = 0
+        self.detected = 0
+        self.skipped = 0
+
+    def detect(self, frame: np.ndarray):
+        """:return: normalized face box found on the IR frame itself, or None"""
+        if self.detector is None:
+            # Imported here so that MediaPipe is only loaded when the fallback is needed
+            from .mp import MediaPipePreprocess
+            self.detector = MediaPipePreprocess(dict(self.params, mesh_display=False))
+        image = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB) if frame.ndim == 2 else frame
+        box, _ = self.detector.locate_face(image)
+        return box
+
+    def crop(self, frame: np.ndarray, timestamp: float):
+        """:return: float32 crop of the face in `frame`, or None"""
+        box = self.roi.match(timestamp, self.max_offset, self.max_wait)
+        if box is not None:
+            box = self.mapping.map_box(box)
+            self.matched += 1
+        elif self.fallback:
+            box = self.detect(frame)
+            self.detected += 1
+        cropped = self.cropper(frame, box, self.target_size) if box is not None else None
+        if cropped is None:
+            self.skipped += 1
+        return cropped
+
+    def stats(self) -> dict:
+        return {"matched": self.matched, "detected": self.detected, "skipped": self.skipped}
+
+    def __call__(self, frame_queue: Queue, preprocess_queue: Queue, log_queue: Queue, batch_size: int):
+        cropped_frames = []
+        timestamps = []
+        use_ring = isinstance(frame_queue, FrameRing)
+        decimator = FrameDecimator(self.target_fps)
+        self.reset()
+        while global_vars.pipeline_running:
+            try:
+                if use_ring:
+                    index, frame, timestamp = frame_queue.get(timeout=0.5)
+                else:
+                    frame, timestamp = frame_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            try:
+                cropped = self.crop(frame, timestamp) if decimator.accept(timestamp) else None
+            finally:
+                if use_ring:
+                    frame_queue.release(index)
+            if cropped is None:
+                continue
+            cropped_frames.append(cropped)
+            timestamps.append(timestamp)
+            if len(cropped_frames) >= batch_size:
+                if preprocess_queue is not None:
+                    preprocess_queue.put((cropped_frames, timestamps))
+                log_queue.put((cropped_frames, timestamps))
+                cropped_frames = []
+                timestamps = []
+        print(f"[ROIPreprocess] Stats: {self.stats()}")
@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+
+
+class ROITracker:
+    """
+    Follows a face bounding box between full FaceMesh detections with sparse
+    Lucas-Kanade optical flow on the grayscale frame.
+
+    Corners are picked inside the box when it is (re)initialised. On every update
+    the box is shifted by the median point displacement and scaled by the median
+    change of the point spread. Tracking is reported as lost when too few points
+    survive, or when the box leaves the frame or collapses.
+    """
+    def __init__(self, params: dict = None) -> None:
+        params = params or {}
+        self.max_corners = params.get("max_corners", 50)
+        self.min_points = params.get("min_points", 8)
+        self.quality_level = params.get("quality_level", 0.01)
+        self.min_distance = params.get("min_distance", 3)
+        self.max_error = params.get("max_error", 30.0)
+        self.lk_params = dict(
+            winSize=params.get("win_size", (15, 15)),
+            maxLevel=params.get("max_level", 2),
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+        )
+        self.prev_gray = None
+        self.points = None
+        self.box = None  # pixel coordinates [x_min, y_min, x_max, y_max]
+
+    @property
+    def active(self) -> bool:
+        return self.points is not None
+
+    def reset(self) -> None:
+        self.prev_gray = None
+        self.points = None
+        self.box = None
+
+    def init(self, gray: np.ndarray, box: np.ndarray) -> bool:
+        """
+        Start tracking `box` on `gray`.
+        :param gray: single-channel frame
+        :param box: pixel box [x_min, y_min, x_max, y_max]
+        :return: whether enough corners were found to track
+        """
+        height, width = gray.shape[:2]
+        x0, y0, x1, y1 = np.clip(box, 0, [width, height, width, height]).astype(int)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            self.reset()
+            return False
+        mask = np.zeros_like(gray, dtype=np.uint8)
+        mask[y0:y1, x0:x1] = 255
+        points = cv2.goodFeaturesToTrack(
+            gray,
+            maxCorners=self.max_corners,
+            qualityLevel=self.quality_level,
+            minDistance=self.min_distance,
+            mask=mask,
+        )
+        if points is None or len(points) < self.min_points:
+            self.reset()
+            return False
+        self.prev_gray = gray
+        self.points = points
+        self.box = np.asarray(box, dtype=np.float32)
+        return True
+
+    def update(self, gray: np.ndarray):
+        """
+        Track the box into `gray`.
+        :return: the new pixel box, or None if tracking was lost
+        """
+        if not self.active:
+            return None
+        points, status, error = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None, **self.lk_params)
+        if points is None:
+            self.reset()
+            return None
+        good = (status.ravel() == 1) & (error.ravel() < self.max_error)
+        if np.count_nonzero(good) < self.min_points:
+            self.reset()
+            return None
+        old = self.points[good].reshape(-1, 2)
+        new = points[good].reshape(-1, 2)
+
+        shift = np.median(new - old, axis=0)
+        old_spread = np.median(np.linalg.norm(old - np.median(old, axis=0), axis=1))
+        new_spread = np.median(np.linalg.norm(new - np.median(new, axis=0), axis=1))
+        scale = new_spread / old_spread if old_spread > 1e-3 else 1.0
+
+        center = (self.box[:2] + self.box[2:]) / 2 + shift
+        half = (self.box[2:] - self.box[:2]) / 2 * scale
+        box = np.concatenate([center - half, center + half])
+
+        height, width = gray.shape[:2]
+        if half.min() < 2 or box[2] <= 0 or box[3] <= 0 or box[0] >= width or box[1] >= height:
+            self.reset()
+            return None
+        self.prev_gray = gray
+        self.points = new.reshape(-1, 1, 2)
+        self.box = box
+        return box
@@ -0,0 +1,231 @@
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+from queue import Queue, Empty
+
+import numpy as np
+
+import global_vars
+from capture.ring import FrameRing
+from .base import PreprocessBase, FrameDecimator
+
+
+def _worker_main(params: dict, task_queue, result_queue) -> None:
+    """
+    Body of a preprocess worker process.
+    Tasks are (seq, slot, timestamp, shm_name, shape, dtype) tuples pointing at a frame in a
+    shared FrameRing; the crop and the face box (or None) are sent back with the same seq,
+    slot and timestamp.
+    """
+    # Imported here so that MediaPipe is only loaded inside the worker
+    from .mp import MediaPipePreprocess
+
+    preprocess = MediaPipePreprocess(params)
+    attached = {}
+    result_queue.put(("ready", None, None, None, None))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        seq, slot, timestamp, shm_name, shape, dtype = task
+        if shm_name not in attached:
+            attached[shm_name] = shared_memory.SharedMemory(name=shm_name)
+        frames = np.ndarray(shape, dtype=dtype, buffer=attached[shm_name].buf)
+        try:
+            cropped, _ = preprocess.crop_resize(frames[slot], preprocess.target_size)
+            box = preprocess.last_box
+        except Exception as e:
+            print(f"[PreprocessWorker] Error processing frame {seq}: {e}")
+            cropped, box = None, None
+        del frames
+        result_queue.put((seq, slot, timestamp, cropped, box))
+    for shm in attached.values():
+        shm.close()
+
+
+class ProcessPreprocess(PreprocessBase):
+    """
+    Runs MediaPipePreprocess in worker processes, so face cropping is not bound by the GIL
+    of the main interpreter.
+
+    Frames reach the workers through shared memory: if the frame queue is a shared
+    FrameRing the workers read the capture slots directly, otherwise each frame is copied
+    once into a private shared ring. Frames are dealt round-robin to the workers (so the
+    tracking mode of each worker sees every n-th frame), and the crops are put back in
+    capture order before being batched exactly like MediaPipePreprocess does.
+
+    params: the MediaPipePreprocess params, plus
+      - "workers": number of worker processes (default 2)
+      - "max_in_flight": frames handed out but not returned yet, per worker (default 2)
+      - "start_method": multiprocessing start method (default "spawn")
+      - "roi_sink": preprocess.roi.SharedROI that receives the face boxes, in capture order
+
+    At the end of the pipeline the frames already handed out are waited for (up to
+    DRAIN_TIMEOUT seconds) and published in capture order; a last partial batch is dropped.
+    """
+    DRAIN_TIMEOUT = 2.0
+
+    def __init__(self, params: dict) -> None:
+        super().__init__()
+        self.params = dict(params, mesh_display=False)
+        # Stays in this process: the workers send their boxes back with the crops
+        self.roi_sink = self.params.pop("roi_sink", None)
+        self.target_size = params["target_size"]
+        self.num_workers = params.get("workers", 2)
+        self.max_in_flight = params.get("max_in_flight", 2) * self.num_workers
+        self.target_fps = params.get("target_fps")
+        self.context = multiprocessing.get_context(params.get("start_method", "spawn"))
+        self.result_queue = self.context.Queue()
+        self.task_queues = []
+        self.processes = []
+        self.staging = None
+        # Task numbers keep counting across sessions, so that a result arriving after its session
+        # ended is recognised; its slot is still released from `outstanding` (seq -> ring)
+        self.seq = 0
+        self.outstanding = {}
+        for i in range(self.num_workers):
+            task_queue = self.context.Queue()
+            process = self.context.Process(
+                target=_worker_main,
+                args=(self.params, task_queue, self.result_queue),
+                daemon=True,
+                name=f"PreprocessWorker-{i}",
+            )
+            process.start()
+            self.task_queues.append(task_queue)
+            self.processes.append(process)
+        # Wait until every worker has loaded FaceMesh
+        for _ in range(self.num_workers):
+            self.result_queue.get()
+        print(f"[ProcessPreprocess] {self.num_workers} worker processes ready")
+
+    def close(self) -> None:
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=2)
+        if self.staging is not None:
+            self.staging.close()
+            self.staging = None
+        print("[ProcessPreprocess] Worker processes stopped")
+
+    def _next_frame(self, frame_queue, decimator: FrameDecimator):
+        """
+        :return: (ring, slot, timestamp) of the next frame in a shared ring
+        :raises queue.Empty: if no frame is available yet, or the frame was skipped by `decimator`
+        """
+        if isinstance(frame_queue, FrameRing) and frame_queue.shared:
+            slot, _, timestamp = frame_queue.get(timeout=0.5)
+            if not decimator.accept(timestamp):
+                frame_queue.release(slot)
+                raise Empty
+            return frame_queue, slot, timestamp
+        if isinstance(frame_queue, FrameRing):
+            ring_slot, frame, timestamp = frame_queue.get(timeout=0.5)
+            try:
+                if not decimator.accept(timestamp):
+                    raise Empty
+                return self._stage(frame, timestamp)
+            finally:
+                frame_queue.release(ring_slot)
+        frame, timestamp = frame_queue.get(timeout=0.5)
+        if not decimator.accept(timestamp):
+            raise Empty
+        return self._stage(frame, timestamp)
+
+    def _stage(self, frame: np.ndarray, timestamp: float):
+        """Copy a frame that is not in shared memory into the private shared ring."""
+        if self.staging is None:
+            self.staging = FrameRing(self.max_in_flight + 2, "drop_newest", dtype=frame.dtype, shared=True)
+        while True:
+            acquired = self.staging.acquire(frame.shape)
+            if acquired is not None:
+                break
+            time.sleep(0.001)
+        slot, view = acquired
+        np.copyto(view, frame)
+        # Committed and taken straight away: the slot is only tracked as "in use" from here on
+        self.staging.commit(slot, timestamp)
+        self.staging.get()
+        return self.staging, slot, timestamp
+
+    def __call__(self, frame_queue, preprocess_queue: Queue, log_queue: Queue, batch_size: int):
+        in_flight = threading.Semaphore(self.max_in_flight)
+        rings = self.outstanding
+        first_seq = self.seq
+        stop = threading.Event()
+        collector = threading.Thread(
+            target=self._collect,
+            args=(rings, first_seq, in_flight, stop, preprocess_queue, log_queue, batch_size),
+            daemon=True,
+            name="PreprocessCollectorThread",
+        )
+        collector.start()
+
+        decimator = FrameDecimator(self.target_fps)
+        while global_vars.pipeline_running:
+            if not in_flight.acquire(timeout=0.5):
+                continue
+            try:
+                ring, slot, timestamp = self._next_frame(frame_queue, decimator)
+            except Empty:
+                in_flight.release()
+                continue
+            rings[self.seq] = ring
+            self.task_queues[self.seq % self.num_workers].put(
+                (self.seq, slot, timestamp, ring.shm_name, ring.buffer.shape, ring.buffer.dtype.str)
+            )
+            self.seq += 1
+
+        # The collector publishes the frames already handed out before it ends
+        stop.set()
+        collector.join(timeout=self.DRAIN_TIMEOUT + 1)
+
+    def _collect(self, rings: dict, first_seq: int, in_flight: threading.Semaphore, stop: threading.Event,
+                 preprocess_queue: Queue, log_queue: Queue, batch_size: int) -> None:
+        cropped_frames = []
+        timestamps = []
+        pending = {}
+        next_seq = first_seq
+        deadline = None
+        done = False
+        while not done:
+            if stop.is_set():
+                # Drain the results still in flight, then publish everything left
+                if deadline is None:
+                    deadline = time.time() + self.DRAIN_TIMEOUT
+                done = not any(seq >= first_seq for seq in list(rings)) or time.time() >= deadline
+            if not done:
+                try:
+                    seq, slot, timestamp, cropped, box = self.result_queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                ring = rings.pop(seq, None)
+                if ring is not None:
+                    ring.release(slot)
+                if seq < first_seq or ring is None:
+                    # Late result of an earlier session (its slot is released above): not published
+                    continue
+                in_flight.release()
+                pending[seq] = (timestamp, cropped, box)
+
+            # Emit in capture order; a result that never arrives is skipped once the window is full,
+            # or at the end
+            while pending and (done or next_seq in pending or len(pending) >= self.max_in_flight):
+                if next_seq not in pending:
+                    next_seq = min(pending)
+                timestamp, cropped, box = pending.pop(next_seq)
+                next_seq += 1
+                if self.roi_sink is not None:
+                    self.roi_sink.update(box, timestamp)
+                if cropped is None:
+                    continue
+                cropped_frames.append(cropped)
+                timestamps.append(timestamp)
+                if len(cropped_frames) >= batch_size:
+                    if preprocess_queue is not None:
+                        preprocess_queue.put((cropped_frames, timestamps))
+                    log_queue.put((cropped_frames, timestamps))
+                    cropped_frames = []
+                    timestamps = []
@@ -0,0 +1,202 @@
+"""
+Offline replay of a recorded session through the full Pipeline, without cameras, BMD101,
+Bluetooth or the display.
+
+The session's `video.mp4`, `ir_video.mp4` and `ecg_log.csv` are played into the same queues
+the cameras and the ECG fill on the device (capture.replay.ReplayCapture, ecg.replay.ReplayECG),
+paced by one ReplayClock: `--speed 1` keeps the recorded timing, `--speed 0` publishes as fast
+as the pipeline takes the data (lossless, the full queues hold the sources back). Everything
+downstream runs as on the device: preprocess, model, heart rate and quality, ECG processing,
+the loggers, and the merge/normalize at stop. The recordings hold the face crops, so the
+frames go through PassthroughPreprocess instead of FaceMesh.
+
+The outputs are written to their own session directory (`--output`, default
+`replay/<session>`). Reported at the end: throughput (frames per second, times real time),
+the end-to-end latency of the rPPG results (from the release of a frame into the frame queue
+to its result reaching the logger) and how late the sources ran against their schedule.
+
+With `--json`, the run is also written as an "end_to_end" stage of a benchmarks.harness
+report (frame-to-result latency, CPU and peak RSS of the whole process), comparable between
+commits with `python -m benchmarks.compare`.
+
+Run from the repository root:
+    python replay.py data/patient_000005 --speed 1
+    python replay.py data/patient_000005 --speed 0 --json benchmarks/results/replay.json
+"""
+import argparse
+import contextlib
+import os
+import queue
+import shutil
+import time
+
+import numpy as np
+
+import global_vars
+from benchmarks.harness import Report, RSSSampler, summarize
+from capture.replay import ReplayCapture
+from ecg.processing import ECGProcessor
+from ecg.replay import ReplayECG
+from main import ONNX_SESSION, Pipeline, SessionManager, create_model
+from preprocess.passthrough import PassthroughPreprocess
+from utils.replay import ReplayClock
+from utils.timebase import TimeBase
+
+
+class LatencyQueue(queue.Queue):
+    """The rPPG log queue, timing every result from the release of its frame."""
+    def __init__(self, release_times: dict, maxsize: int = 0) -> None:
+        super().__init__(maxsize)
+        self.release_times = release_times
+        self.latencies = []
+
+    def put(self, item, block=True, timeout=None):
+        released = self.release_times.pop(item[0], None)
+        if released is not None:
+            self.latencies.append(time.monotonic() - released)
+        super().put(item, block, timeout)
+
+
+def create_pipeline(args, capture: ReplayCapture, ecg: ReplayECG, model, timebase: TimeBase) -> Pipeline:
+    target_size = 36 if args.model == "Step" else 32
+    preprocess_params = {"target_size": (target_size, target_size), "target_fps": args.target_fps}
+    return Pipeline({
+        "capture": capture,
+        "preprocess": PassthroughPreprocess(preprocess_params),
+        "ir_preprocess": PassthroughPreprocess(preprocess_params),
+        "model": model,
+        "ecg": ecg,
+        "ecg_processor": ECGProcessor({"fs": 512, "powerline": 50}),
+        "timebase": timebase,
+        "interrupt_hotkey": "esc",
+        "max_queue_size": 512,
+        # Plain bounded queues: a full queue holds the replay back instead of dropping frames
+        "frame_ring": None,
+        "batch_size": 1,
+        "max_display_points": 128,
+        "time_limit": 0,
+        "log_path": os.path.join(args.output, "log.csv"),
+        "fps": 30,
+        "picture_log_mode": "stream",
+        "log_format": args.log_format,
+        "online_merge": {"idle_timeout": 5.0, "rescale": not args.factors_only} if args.merge == "online" else None,
+        "perip_manager": None,
+        "log": args.verbose,
+    })
+
+
+def wait_until_drained(pipeline: Pipeline, capture: ReplayCapture, ecg: ReplayECG, idle: float = 1.0) -> float:
+    """
+    Wait until the videos have been played, the ECG up to their last frame (or to its end), and the
+    pipeline's queues stayed empty for `idle` seconds. ECG recorded past the videos is not waited for:
+    without rPPG results the quality monitor stops draining its queue.
+    :return: host monotonic time at which the queues ran empty
+    """
+    while not capture.done.wait(0.5):
+        if not global_vars.pipeline_running:
+            return time.monotonic()
+    end = max(stream.last_timestamp or 0.0 for stream in (capture.rgb, capture.ir))
+    while not ecg.done.wait(0.05) and (ecg.bmd101.played or 0.0) < end:
+        if not global_vars.pipeline_running:
+            return time.monotonic()
+    queues = [pipeline.frame_queue, pipeline.ir_frame_queue, pipeline.preprocess_queue, pipeline.result_queue,
+              pipeline.main_queue, pipeline.log_result_queue, pipeline.raw_ecg_queue, pipeline.processing_ecg_queue]
+    empty_since = None
+    while global_vars.pipeline_running:
+        if any(not q.empty() for q in queues):
+            empty_since = None
+        elif empty_since is None:
+            empty_since = time.monotonic()
+        elif time.monotonic() - empty_since >= idle:
+            return empty_since
+        time.sleep(0.01)
+    return time.monotonic()
+
+
+def report(clock: ReplayClock, capture: ReplayCapture, ecg: ReplayECG, latencies: list, elapsed: float) -> None:
+    stats = capture.stats()
+    frames = stats["rgb"]["frames"]
+    print(f"[Replay] {frames} RGB / {stats['ir']['frames']} IR frames, {ecg.bmd101.stats()['samples']} ECG samples "
+          f"in {elapsed:.2f} s: {frames / elapsed:.1f} frames/s, {clock.span() / elapsed:.2f}x real time")
+    for name in ("rgb", "ir"):
+        print(f"[Replay] {name} behind schedule p50/p95: {stats[name]['latency_p50_ms']:.1f}/"
+              f"{stats[name]['latency_p95_ms']:.1f} ms")
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+        print(f"[Replay] {len(latencies)} rPPG results, frame-to-result latency p50/p95/p99: "
+              f"{p50:.1f}/{p95:.1f}/{p99:.1f} ms" + ("" if clock.speed else " (unpaced: mostly time spent in the full queues)"))
+    else:
+        print("[Replay] No rPPG results")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("session", help="recorded session directory, e.g. data/patient_000005")
+    parser.add_argument("--speed", type=float, default=1.0, help="1: recorded timing, 0: as fast as possible")
+    parser.add_argument("--output", help="directory for the replay's logs and videos (default: replay/<session>)")
+    parser.add_argument("--model", choices=("Step", "PhysNet"), default="Step")
+    parser.add_argument("--target-fps", type=float, default=None, help="preprocess frame-skip rate")
+    parser.add_argument("--chunk-size", type=int, default=64, help="ECG chunk size, 0: one item per sample")
+    parser.add_argument("--ir-gray", action="store_true", help="replay the IR video as single-channel frames")
+    parser.add_argument("--verbose", action="store_true", help="pipeline log output (ECG quality every second)")
+    parser.add_argument("--merge", choices=("online", "offline"), default="online",
+                        help="merge the logs while replaying, or at stop (FileMerger + Normalizer)")
+    parser.add_argument("--factors-only", action="store_true",
+                        help="online merge: only write the normalization factors at stop, not normalized_log.csv")
+    parser.add_argument("--log-format", choices=("csv", "columnar"), default="csv",
+                        help="ECG/rPPG/R-peak logs as CSV or as columnar stores (log.columnar)")
+    parser.add_argument("--json", help="write the run as a benchmark report to this path")
+    args = parser.parse_args()
+    session_dir = os.path.normpath(args.session)
+    args.output = os.path.abspath(args.output or os.path.join("replay", os.path.basename(session_dir)))
+    if os.path.abspath(session_dir) == args.output:
+        raise SystemExit("[Replay] The output directory must not be the recorded session")
+
+    clock = ReplayClock(args.speed)
+    capture = ReplayCapture(session_dir, clock, {"ir": {"gray": args.ir_gray}})
+    ecg = ReplayECG({"log_path": os.path.join(session_dir, "ecg_log.csv"), "chunk_size": args.chunk_size}, clock)
+    timebase = TimeBase()
+
+    sessions = SessionManager(os.path.dirname(args.output))
+    sessions.current_session_dir = args.output
+    session_paths = sessions.get_session_paths()
+    # Step writes its state back at stop; the replay keeps a copy, so every run starts from the same state
+    state_path = os.path.join(args.output, "state.pkl")
+    shutil.copyfile("./model/models/onnx/state.pkl", state_path)
+    model = create_model(args.model, ONNX_SESSION, state_path)
+    # The Pipeline opens its default logs in the working directory before the session paths are set
+    with contextlib.chdir(args.output):
+        pipeline = create_pipeline(args, capture, ecg, model, timebase)
+    pipeline.log_result_queue = LatencyQueue(capture.release_times, pipeline.log_result_queue.maxsize)
+    pipeline.update_session_paths(session_paths)
+
+    print(f"[Replay] Replaying {session_dir} at {'full speed' if not args.speed else f'{args.speed:g}x'} "
+          f"into {args.output}")
+    clock.reset()
+    with RSSSampler() as sampler:
+        pipeline.start()
+        started, cpu_started = time.monotonic(), time.process_time()
+        try:
+            drained = wait_until_drained(pipeline, capture, ecg)
+        except KeyboardInterrupt:
+            print("[Replay] Interrupted")
+            drained = time.monotonic()
+        elapsed, cpu_seconds = drained - started, time.process_time() - cpu_started
+        latencies = list(pipeline.log_result_queue.latencies)
+    stopping = time.monotonic()
+    pipeline.stop()
+    stop_seconds = time.monotonic() - stopping
+    capture.release()
+    report(clock, capture, ecg, latencies, elapsed)
+    print(f"[Replay] Stop to upload-ready ({args.merge} merge): {stop_seconds:.2f} s")
+    if args.json:
+        results = Report({key: value for key, value in vars(args).items() if key != "output"})
+        record = results.add("end_to_end", summarize(latencies, capture.stats()["rgb"]["frames"], elapsed,
+                                                     cpu_seconds, sampler, "frame"))
+        record["realtime_factor"] = clock.span() / elapsed
+        record["stop_seconds"] = stop_seconds
+        results.write(args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 from scipy.signal import welch, butter, filtfilt
 import numpy as np
-import pandas as pd
 
 
 def bandpass_filter(data, low_cut=0.5, high_cut=3, fs=30, order=3):
@@ -20,6 +19,8 @@ def get_hr(y, sr=30, hr_min=30, hr_max=180):
 
 
 def get_average_heartrate_from_csv_file(path: str, fps: int) -> float:
+    # pandas is only needed here (a log with a "bvp" header) and is slow to import
+    import pandas as pd
     bvps = np.array(pd.read_csv(path)["bvp"].values)
     bvps = bandpass_filter(bvps, fs=fps)
     hrs = []
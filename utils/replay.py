@@ -0,0 +1,62 @@
+import threading
+import time
+
+import global_vars
+
+
+class ReplayClock:
+    """
+    Paces the sources of a recorded session (capture.replay, ecg.replay) on one shared schedule.
+
+    Every source registers the first timestamp it will replay; the earliest one becomes the
+    origin, released on the first `wait` of a run. A sample recorded at `timestamp` is then
+    due `(timestamp - origin) / speed` seconds later on the host monotonic clock, so the
+    frames and the ECG keep their recorded spacing and alignment. With `speed` 0 (or None)
+    nothing waits: the sources publish as fast as the queues take their items.
+    """
+    def __init__(self, speed: float = 1.0) -> None:
+        self.speed = speed or 0.0
+        self.lock = threading.Lock()
+        self.origin = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new run: the schedule starts again on the next `wait`."""
+        with self.lock:
+            self.started = None
+            self.latest = None
+
+    def register(self, timestamp: float) -> None:
+        """Declare the first timestamp of a source."""
+        with self.lock:
+            if self.origin is None or timestamp < self.origin:
+                self.origin = timestamp
+
+    def due(self, timestamp: float) -> float:
+        """:return: host monotonic time at which the sample recorded at `timestamp` is due"""
+        with self.lock:
+            if self.started is None:
+                self.started = time.monotonic()
+            if self.latest is None or timestamp > self.latest:
+                self.latest = timestamp
+            if not self.speed:
+                return time.monotonic()
+            return self.started + (timestamp - (self.origin or 0.0)) / self.speed
+
+    def span(self) -> float:
+        """:return: recorded seconds played so far in this run"""
+        with self.lock:
+            return self.latest - self.origin if self.latest is not None else 0.0
+
+    def wait(self, timestamp: float):
+        """
+        Sleep until the sample recorded at `timestamp` is due.
+        :return: the due time (host monotonic), or None if the pipeline stopped meanwhile
+        """
+        due = self.due(timestamp)
+        while global_vars.pipeline_running:
+            remaining = due - time.monotonic()
+            if remaining <= 0:
+                return due
+            time.sleep(min(remaining, 0.5))
+        return None
@@ -0,0 +1,125 @@
+from collections import deque
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    A fixed-capacity numpy ring buffer for sample streams.
+
+    Every value is stored twice, at `i` and `i + capacity`, so the last `capacity` values
+    are always one contiguous slice of the storage: ``view()`` returns them oldest first
+    without copying, and appending never shifts data (unlike ``list.pop(0)``).
+
+    With ``track_extrema=True`` the running ``min()`` and ``max()`` of the stored values are
+    kept in monotonic deques, at O(1) amortized cost per appended value.
+    """
+    def __init__(self, capacity: int, dtype=np.float64, track_extrema: bool = False) -> None:
+        if capacity < 1:
+            raise ValueError("RingBuffer capacity must be at least 1")
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=dtype)
+        self.head = 0  # storage index of the next write
+        self.size = 0
+        self.track_extrema = track_extrema
+        self.count = 0  # values appended since the last clear
+        # (sequence number, value) pairs, values decreasing in `maxima` and increasing in `minima`
+        self.maxima = deque()
+        self.minima = deque()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+    def __iter__(self):
+        return iter(self.view())
+
+    @property
+    def full(self) -> bool:
+        return self.size == self.capacity
+
+    def _track(self, value, sequence: int) -> None:
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        self.maxima.append((sequence, value))
+        while self.minima and self.minima[-1][1] >= value:
+            self.minima.pop()
+        self.minima.append((sequence, value))
+        # Drop the extrema that have left the buffer
+        oldest = sequence - self.capacity + 1
+        while self.maxima[0][0] < oldest:
+            self.maxima.popleft()
+        while self.minima[0][0] < oldest:
+            self.minima.popleft()
+
+    def append(self, value) -> None:
+        head = self.head
+        self.data[head] = value
+        self.data[head + self.capacity] = value
+        self.head = (head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        if self.track_extrema:
+            self._track(float(value), self.count)
+        self.count += 1
+
+    def extend(self, values) -> None:
+        """Append several values; cheaper than repeated ``append`` calls."""
+        values = np.asarray(values, dtype=self.data.dtype).ravel()
+        if self.track_extrema:
+            # Compare plain Python numbers: much cheaper than numpy scalars
+            for sequence, value in enumerate(values[-self.capacity:].tolist(),
+                                             self.count + max(0, len(values) - self.capacity)):
+                self._track(value, sequence)
+        self.count += len(values)
+        if len(values) >= self.capacity:
+            values = values[-self.capacity:]
+            self.data[:self.capacity] = values
+            self.data[self.capacity:] = values
+            self.head = 0
+            self.size = self.capacity
+            return
+        for start, chunk in ((self.head, values[:self.capacity - self.head]),
+                             (0, values[self.capacity - self.head:])):
+            self.data[start:start + len(chunk)] = chunk
+            self.data[start + self.capacity:start + self.capacity + len(chunk)] = chunk
+        self.head = (self.head + len(values)) % self.capacity
+        self.size = min(self.size + len(values), self.capacity)
+
+    def view(self) -> np.ndarray:
+        """
+        The stored values, oldest first, as a read-only view.
+        The view is only valid until the next append.
+        """
+        start = self.head + self.capacity - self.size
+        view = self.data[start:start + self.size]
+        view.flags.writeable = False
+        return view
+
+    def last(self):
+        if not self.size:
+            raise IndexError("RingBuffer is empty")
+        return self.data[self.head + self.capacity - 1]
+
+    def max(self):
+        if not self.size:
+            raise ValueError("RingBuffer is empty")
+        if not self.track_extrema:
+            return self.view().max()
+        return self.maxima[0][1]
+
+    def min(self):
+        if not self.size:
+            raise ValueError("RingBuffer is empty")
+        if not self.track_extrema:
+            return self.view().min()
+        return self.minima[0][1]
+
+    def clear(self) -> None:
+        self.head = 0
+        self.size = 0
+        self.count = 0
+        self.maxima.clear()
+        self.minima.clear()
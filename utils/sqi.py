@@ -0,0 +1,315 @@
+import json
+import time
+
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi
+
+from .ringbuffer import RingBuffer
+from .streaming_hr import bandpass_sos, hann
+
+GRADES = ("poor", "fair", "good")
+
+
+def spectral_snr(signal: np.ndarray, fs: float, low: float, high: float, f0: float = None,
+                 harmonics: int = 2, tolerance: float = 0.1, nfft: int = 1024,
+                 hr_range: tuple = (30, 180)) -> tuple:
+    """
+    Power at the heart-rate peak and its harmonics against the rest of the band.
+    :param f0: fundamental in Hz; if None, the frequency in `hr_range` (BPM) whose harmonics
+               hold the most power (the strongest bin for `harmonics=1`)
+    :param harmonics: number of multiples of f0 counted as signal (0: all within the band)
+    :param tolerance: half-width of each signal bin group in Hz
+    :return: (SNR in dB, f0 in Hz)
+    """
+    n = len(signal)
+    nfft = max(nfft, n)
+    spectrum = np.abs(np.fft.rfft((signal - signal.mean()) * hann(n), nfft)) ** 2
+    freqs = np.fft.rfftfreq(nfft, 1 / fs)
+    band = (freqs >= low) & (freqs <= high)
+    candidates = np.flatnonzero((freqs >= max(low, hr_range[0] / 60)) & (freqs <= hr_range[1] / 60))
+    if not band.any() or (f0 is None and not len(candidates)):
+        return float("nan"), f0
+    if f0 is None:
+        # Mean power over the in-band harmonics of every candidate at once (a plain sum would
+        # favour the lowest candidates, which have the most harmonics in the band)
+        count = harmonics or max(1, int(high / freqs[candidates[0]]))
+        multiples = np.minimum(candidates[:, None] * np.arange(1, count + 1)[None, :], len(spectrum) - 1)
+        in_band = band[multiples] & (candidates[:, None] * np.arange(1, count + 1)[None, :] < len(spectrum))
+        comb = np.where(in_band, spectrum[multiples], 0).sum(axis=1) / np.maximum(in_band.sum(axis=1), 1)
+        f0 = float(freqs[candidates[np.argmax(comb)]])
+    count = harmonics or max(1, int(high / f0))
+    # Distance of each bin to the nearest multiple 1..count of f0
+    multiple = np.clip(np.round(freqs / f0), 1, count)
+    signal_bins = band & (np.abs(freqs - multiple * f0) <= tolerance)
+    noise = spectrum[band & ~signal_bins].sum()
+    power = spectrum[signal_bins].sum()
+    if noise <= 0:
+        return (float("inf") if power > 0 else float("nan")), f0
+    return 10 * np.log10(max(power, 1e-20) / noise), f0
+
+
+def kurtosis(signal: np.ndarray) -> float:
+    """Pearson kurtosis (3 for Gaussian noise; ECG with clear QRS complexes is well above 5)."""
+    centered = signal - signal.mean()
+    variance = np.mean(centered * centered)
+    if variance <= 0:
+        return 0.0
+    return float(np.mean(centered ** 4) / variance ** 2)
+
+
+def flatline_ratio(raw: np.ndarray, min_run: int, tolerance: float = 0.0) -> float:
+    """Fraction of samples in runs of at least `min_run` samples that do not change by more than `tolerance`."""
+    if len(raw) < 2:
+        return 0.0
+    moving = np.flatnonzero(np.abs(np.diff(raw)) > tolerance)
+    # Run lengths between changes, counted in samples
+    edges = np.concatenate(([-1], moving, [len(raw) - 1]))
+    runs = np.diff(edges)
+    return float(runs[runs >= min_run].sum() / len(raw))
+
+
+def clipping_ratio(raw: np.ndarray, low: float = None, high: float = None) -> float:
+    """
+    Fraction of samples at the rails, or at the window minimum/maximum when no rails are given
+    (a clean signal touches each extreme about once).
+    """
+    low = raw.min() if low is None else low
+    high = raw.max() if high is None else high
+    at_rails = np.count_nonzero(raw <= low) + np.count_nonzero(raw >= high)
+    return max(0, at_rails - 2) / len(raw)
+
+
+class SignalQuality:
+    """
+    Rolling signal-quality indices (SQI) for one signal, computed incrementally.
+
+    Samples are only collected on `update`; every `update_interval` seconds of signal the
+    new samples are bandpassed in one block (causal, state carried over) into ring buffers
+    holding the last `window` seconds, and the indices are computed on those:
+      - "snr": spectral SNR in dB around the heart-rate peak and its harmonics
+      - "kurtosis": of the bandpassed signal
+      - "flatline": fraction of the raw window in runs that stay constant for `flat_run` seconds
+      - "clipping": fraction of the raw window stuck at the rails (or window extremes)
+      - "range": peak-to-peak of the raw window
+    and a grade ("good", "fair" or "poor") from the thresholds.
+
+    params:
+      - "fs": nominal sampling rate in Hz; the spectrum uses the rate measured from the timestamps,
+        and the bandpass is redesigned for it when it drifts more than "fs_tolerance" (default 0.1)
+      - "low_cut", "high_cut", "order": bandpass and SNR band (default 0.5, 3, 3)
+      - "window", "update_interval": seconds (default 8, 1)
+      - "harmonics": multiples of the HR counted as signal in the SNR (default 2, 0 for all)
+      - "snr_tolerance": half-width of each harmonic in Hz (default 0.1)
+      - "rails": (low, high) ADC limits for clipping, None for the window extremes
+      - "flat_run", "flat_tolerance": flatline run length in seconds and allowed change (default 0.2, 0)
+      - "snr": (fair, good) SNR thresholds in dB (default (0, 3)), or None to not grade on it
+      - "kurtosis": (fair, good) kurtosis thresholds, or None to not grade on it
+      - "max_flatline", "max_clipping": above these the grade is "poor" (default 0.2, 0.05)
+    """
+    def __init__(self, params: dict = None) -> None:
+        params = params or {}
+        self.nominal_fs = params.get("fs", 30)
+        self.low_cut = params.get("low_cut", 0.5)
+        self.high_cut = params.get("high_cut", 3)
+        self.order = params.get("order", 3)
+        self.window = params.get("window", 8)
+        self.update_interval = params.get("update_interval", 1.0)
+        self.harmonics = params.get("harmonics", 2)
+        self.snr_tolerance = params.get("snr_tolerance", 0.1)
+        self.rails = params.get("rails")
+        self.fs_tolerance = params.get("fs_tolerance", 0.1)
+        self.flat_seconds = params.get("flat_run", 0.2)
+        self.flat_tolerance = params.get("flat_tolerance", 0.0)
+        self.snr_thresholds = params.get("snr", (0.0, 3.0))
+        self.kurtosis_thresholds = params.get("kurtosis")
+        self.max_flatline = params.get("max_flatline", 0.2)
+        self.max_clipping = params.get("max_clipping", 0.05)
+        capacity = int(self.window * self.nominal_fs)
+        self.raw = RingBuffer(capacity, track_extrema=True)
+        self.filtered = RingBuffer(capacity)
+        self.times = RingBuffer(capacity)
+        self.reset()
+
+    def reset(self) -> None:
+        self.raw.clear()
+        self.filtered.clear()
+        self.times.clear()
+        self.pending_values = []
+        self.pending_times = []
+        self._design(self.nominal_fs)
+        self.next_update = None
+        self.latest = None
+        self.cpu_time = 0.0
+
+    def update(self, values, timestamps, hr: float = None):
+        """
+        Add samples.
+        :param values: one sample or a sequence of samples
+        :param timestamps: their times in seconds
+        :param hr: heart rate in BPM from elsewhere (e.g. the ECG), used as the SNR peak if given
+        :return: the new indices (dict) if they were recomputed, otherwise None
+        """
+        if np.ndim(values):
+            self.pending_values.extend(np.asarray(values, dtype=np.float64).tolist())
+            self.pending_times.extend(np.asarray(timestamps, dtype=np.float64).tolist())
+        else:
+            self.pending_values.append(float(values))
+            self.pending_times.append(float(timestamps))
+        if not self.pending_times:
+            return None
+        now = self.pending_times[-1]
+        if self.next_update is None:
+            self.next_update = now + self.update_interval
+        if now < self.next_update:
+            return None
+        self.next_update = max(self.next_update + self.update_interval, now)
+        start = time.process_time()
+        self._consume()
+        indices = self.evaluate(hr)
+        self.cpu_time += time.process_time() - start
+        return indices
+
+    def _consume(self) -> None:
+        values = np.array(self.pending_values)
+        if self.zi is None:
+            self.zi = sosfilt_zi(self.sos) * values[0]
+        filtered, self.zi = sosfilt(self.sos, values, zi=self.zi)
+        self.raw.extend(values)
+        self.filtered.extend(filtered)
+        self.times.extend(self.pending_times)
+        self.pending_values = []
+        self.pending_times = []
+        self._check_rate()
+
+    def _design(self, fs: float) -> None:
+        self.design_fs = fs
+        self.sos = bandpass_sos(self.low_cut, self.high_cut, fs, self.order)
+        self.flat_run = max(2, int(self.flat_seconds * fs))
+        self.zi = None
+
+    def _check_rate(self) -> None:
+        """Redesign the bandpass when the rate measured from the timestamps drifts, as StreamingHR does."""
+        times = self.times.view()
+        if len(times) <= self.nominal_fs or times[-1] <= times[0]:
+            return
+        fs = (len(times) - 1) / (times[-1] - times[0])
+        if abs(fs - self.design_fs) <= self.fs_tolerance * self.design_fs:
+            return
+        design_fs = round(fs)
+        # Below twice the upper cutoff the band cannot be designed; keep the previous filter
+        if self.high_cut < design_fs / 2:
+            self._design(design_fs)
+
+    def grade(self, indices: dict) -> str:
+        if indices["flatline"] > self.max_flatline or indices["clipping"] > self.max_clipping:
+            return "poor"
+        scores = [len(GRADES) - 1]
+        if self.snr_thresholds:
+            scores.append(sum(indices["snr"] >= threshold for threshold in self.snr_thresholds))
+        if self.kurtosis_thresholds:
+            scores.append(sum(indices["kurtosis"] >= threshold for threshold in self.kurtosis_thresholds))
+        return GRADES[min(scores)]
+
+    def evaluate(self, hr: float = None):
+        """:return: the indices over the current window, or None until half a window has been seen"""
+        times = self.times.view()
+        if len(times) < 2 or times[-1] - times[0] < self.window / 2:
+            return None
+        fs = (len(times) - 1) / (times[-1] - times[0])
+        raw = self.raw.view()
+        filtered = self.filtered.view()
+        snr, f0 = spectral_snr(filtered, fs, self.low_cut, self.high_cut, hr / 60 if hr else None,
+                               self.harmonics, self.snr_tolerance)
+        indices = {
+            "time": float(times[-1]),
+            "snr": float(snr),
+            "hr": f0 * 60 if f0 else None,
+            "kurtosis": kurtosis(filtered),
+            "flatline": flatline_ratio(raw, self.flat_run, self.flat_tolerance),
+            "clipping": clipping_ratio(raw, *(self.rails or (None, None))),
+            "range": float(self.raw.max() - self.raw.min()),
+        }
+        indices["grade"] = self.grade(indices)
+        self.latest = indices
+        return indices
+
+
+def _json_safe(value):
+    """`value` with its non-finite floats (NaN, inf) as None, recursively: JSON has no literal for them."""
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    return value
+
+
+class QualitySummary:
+    """
+    Per-session aggregate of the SQI updates and of the rPPG/ECG heart-rate agreement,
+    written as JSON when the session stops. Indices that were never finite (e.g. the SNR of a
+    flat signal) are null.
+
+    `extend_capture` is set when the session has less than `min_good_seconds` of signal
+    graded "good" for a signal, or when the two heart rates agree less than
+    `min_agreement` of the time (within `agreement_tolerance` BPM).
+    """
+    def __init__(self, min_good_seconds: float = 30, agreement_tolerance: float = 5,
+                 min_agreement: float = 0.5) -> None:
+        self.min_good_seconds = min_good_seconds
+        self.agreement_tolerance = agreement_tolerance
+        self.min_agreement = min_agreement
+        self.reset()
+
+    def reset(self) -> None:
+        self.signals = {}
+        self.hr_differences = []
+
+    def add(self, name: str, indices: dict, interval: float) -> None:
+        """Record one SQI update that covers `interval` seconds of signal."""
+        signal = self.signals.setdefault(name, {"seconds": {grade: 0.0 for grade in GRADES}, "indices": []})
+        signal["seconds"][indices["grade"]] += interval
+        signal["indices"].append(indices)
+
+    def add_hr_pair(self, rppg_hr: float, ecg_hr: float) -> None:
+        if rppg_hr is not None and ecg_hr is not None:
+            self.hr_differences.append(rppg_hr - ecg_hr)
+
+    def good_seconds(self, name: str) -> float:
+        signal = self.signals.get(name)
+        return signal["seconds"]["good"] if signal else 0.0
+
+    def agreement(self) -> dict:
+        if not self.hr_differences:
+            return {"pairs": 0}
+        differences = np.abs(self.hr_differences)
+        return {
+            "pairs": len(differences),
+            "mean_abs_difference": float(differences.mean()),
+            "within_tolerance": float(np.mean(differences <= self.agreement_tolerance)),
+        }
+
+    def summary(self) -> dict:
+        signals = {}
+        for name, signal in self.signals.items():
+            indices = signal["indices"]
+            finite = {key: [i[key] for i in indices if np.isfinite(i[key])]
+                      for key in ("snr", "kurtosis", "flatline", "clipping", "range")}
+            signals[name] = {
+                "updates": len(indices),
+                "seconds_by_grade": signal["seconds"],
+                "median": {key: float(np.median(values)) if values else None for key, values in finite.items()},
+                "worst_flatline": max(finite["flatline"], default=None),
+                "worst_clipping": max(finite["clipping"], default=None),
+            }
+        agreement = self.agreement()
+        extend = any(self.good_seconds(name) < self.min_good_seconds for name in self.signals) or not self.signals
+        if agreement["pairs"]:
+            extend = extend or agreement["within_tolerance"] < self.min_agreement
+        return _json_safe({"signals": signals, "hr_agreement": agreement, "extend_capture": extend})
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2, allow_nan=False)
+        print(f"[QualitySummary] Quality summary written to {path}")
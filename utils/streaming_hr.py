@@ -0,0 +1,172 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, sosfilt, sosfilt_zi, find_peaks
+
+from .ringbuffer import RingBuffer
+
+
+@lru_cache(maxsize=32)
+def bandpass_sos(low_cut: float, high_cut: float, fs: float, order: int = 3) -> np.ndarray:
+    """Butterworth bandpass in second-order sections, designed once per parameter set."""
+    return butter(N=order, Wn=[low_cut, high_cut], fs=fs, btype="band", output="sos")
+
+
+@lru_cache(maxsize=8)
+def hann(length: int) -> np.ndarray:
+    window = np.hanning(length)
+    window.flags.writeable = False
+    return window
+
+
+class StreamingHR:
+    """
+    Heart rate from a BVP stream, computed incrementally.
+
+    Each sample goes through a causal bandpass (sosfilt with its state carried between
+    calls) into a ring buffer holding the last `window` seconds. The heart rate itself is
+    only recomputed every `update_interval` seconds of signal: a Hann-windowed, zero-padded
+    FFT of the buffer, with the peak frequency refined by parabolic interpolation. The
+    sampling rate for the spectrum is measured from the timestamps, so dropped frames do
+    not bias the result; the filter is redesigned (from a cache) when the measured rate
+    drifts more than `fs_tolerance` away from the rate it was designed for.
+
+    With `peak_refine=True` the spectral estimate is checked against the median interval
+    between pulse peaks, and replaced by it when both agree within `peak_tolerance`.
+
+    params:
+      - "fs": nominal sampling rate in Hz (default 30)
+      - "low_cut", "high_cut", "order": bandpass (default 0.5, 3, 3)
+      - "window": seconds of signal used for the spectrum (default 6)
+      - "update_interval": seconds of signal between heart-rate updates (default 1)
+      - "nfft": FFT length (default 1024)
+      - "hr_min", "hr_max": search band in BPM (default 30, 180)
+      - "peak_refine": refine with peak intervals (default False)
+    """
+    def __init__(self, params: dict = None) -> None:
+        params = params or {}
+        self.nominal_fs = params.get("fs", 30)
+        self.low_cut = params.get("low_cut", 0.5)
+        self.high_cut = params.get("high_cut", 3)
+        self.order = params.get("order", 3)
+        self.window = params.get("window", 6)
+        self.update_interval = params.get("update_interval", 1.0)
+        self.nfft = params.get("nfft", 1024)
+        self.hr_min = params.get("hr_min", 30)
+        self.hr_max = params.get("hr_max", 180)
+        self.peak_refine = params.get("peak_refine", False)
+        self.peak_tolerance = params.get("peak_tolerance", 0.1)
+        self.fs_tolerance = params.get("fs_tolerance", 0.1)
+        # Room for the window at up to twice the nominal rate
+        capacity = int(self.window * self.nominal_fs * 2)
+        self.values = RingBuffer(capacity)
+        self.times = RingBuffer(capacity)
+        self.reset()
+
+    def reset(self) -> None:
+        self.values.clear()
+        self.times.clear()
+        self.design_fs = self.nominal_fs
+        self.sos = bandpass_sos(self.low_cut, self.high_cut, self.design_fs, self.order)
+        self.zi = None
+        self.next_update = None
+        self.hr = None
+        self.updates = 0
+
+    def measured_fs(self) -> float:
+        times = self.times.view()
+        if len(times) < 2 or times[-1] <= times[0]:
+            return self.design_fs
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def _filter(self, values: np.ndarray) -> np.ndarray:
+        if self.zi is None:
+            # Start in steady state for the first sample, so the stream does not ring up from zero
+            self.zi = sosfilt_zi(self.sos) * values[0]
+        filtered, self.zi = sosfilt(self.sos, values, zi=self.zi)
+        return filtered
+
+    def _check_rate(self) -> bool:
+        """
+        Redesign the filter when the measured rate has drifted from the design rate.
+        :return: False if the measured rate is too low for the band (Nyquist at or below
+                 `high_cut`): the previous filter is kept and the estimate is not usable
+        """
+        fs = self.measured_fs()
+        if abs(fs - self.design_fs) > self.fs_tolerance * self.design_fs and len(self.times) > self.nominal_fs:
+            design_fs = round(fs)
+            if self.high_cut >= design_fs / 2:
+                return False
+            self.design_fs = design_fs
+            self.sos = bandpass_sos(self.low_cut, self.high_cut, self.design_fs, self.order)
+            self.zi = None
+        return True
+
+    def spectral_hr(self, signal: np.ndarray, fs: float) -> float:
+        n = len(signal)
+        nfft = max(self.nfft, n)
+        spectrum = np.abs(np.fft.rfft((signal - signal.mean()) * hann(n), nfft)) ** 2
+        freqs = np.fft.rfftfreq(nfft, 1 / fs)
+        band = np.flatnonzero((freqs > self.hr_min / 60) & (freqs < self.hr_max / 60))
+        k = band[np.argmax(spectrum[band])]
+        # Parabolic interpolation of the peak bin
+        offset = 0.0
+        if 0 < k < len(spectrum) - 1:
+            a, b, c = np.log(spectrum[k - 1:k + 2] + 1e-20)
+            denominator = a - 2 * b + c
+            if denominator < 0:
+                offset = 0.5 * (a - c) / denominator
+        return (k + offset) * fs / nfft * 60
+
+    def peak_hr(self, signal: np.ndarray, times: np.ndarray, fs: float, hr_estimate: float):
+        """Heart rate from the median interval between pulse peaks, or None if there are too few."""
+        distance = max(1, int(0.6 * fs * 60 / hr_estimate))
+        peaks, _ = find_peaks(signal, distance=distance)
+        if len(peaks) < 3:
+            return None
+        return 60.0 / np.median(np.diff(times[peaks]))
+
+    def _estimate(self, end: float):
+        """:return: the heart rate over the last window, or None if a gap left too little signal in it"""
+        times = self.times.view()
+        start = np.searchsorted(times, end - self.window)
+        times = times[start:]
+        signal = self.values.view()[start:]
+        if len(times) < 16 or times[-1] - times[0] < self.window / 2:
+            return None
+        fs = (len(times) - 1) / (times[-1] - times[0])
+        hr = self.spectral_hr(signal, fs)
+        if self.peak_refine:
+            hr_peaks = self.peak_hr(signal, times, fs, hr)
+            if hr_peaks is not None and abs(hr_peaks - hr) <= self.peak_tolerance * hr:
+                hr = hr_peaks
+        return hr
+
+    def update(self, values, timestamps):
+        """
+        Add BVP samples.
+        :param values: one sample or a sequence of samples
+        :param timestamps: their capture times in seconds
+        :return: the new heart rate in BPM if it was recomputed, otherwise None
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=np.float64))
+        if not len(values):
+            return None
+        self.values.extend(self._filter(values))
+        self.times.extend(timestamps)
+        now = timestamps[-1]
+        if self.next_update is None:
+            # First estimate once a full window has been seen
+            self.next_update = now + self.window
+        if now < self.next_update:
+            return None
+        self.next_update += self.update_interval
+        if self.next_update <= now:
+            self.next_update = now + self.update_interval
+        hr = self._estimate(now)
+        if not self._check_rate() or hr is None:
+            return None
+        self.hr = hr
+        self.updates += 1
+        return hr
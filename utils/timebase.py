@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class ClockMapper:
+    """
+    Maps the timestamps of a device clock (camera buffer times, ECG sample counts) onto
+    the host monotonic clock, with the offset and the drift between both estimated online.
+
+    Every observation pairs a device time with the host time at which it was seen; the
+    difference is the device offset plus a delivery latency that is never negative. The
+    smallest difference in each `bucket` seconds of device time is kept, and a line fitted
+    through those minima over the last `window` seconds, then lowered onto the lowest of
+    them, gives offset and drift: the lower envelope of the observations.
+
+    Once the drift is fitted, a whole bucket lying more than `max_step` above the envelope
+    means the device clock has stepped back against the host (lost ECG samples, dropped
+    camera buffers): the kept minima are moved up by the step, so the drift estimate
+    survives it. A device clock that goes
+    backwards restarts the fit.
+    """
+    def __init__(self, window: float = 60.0, bucket: float = 1.0, max_step: float = 0.05) -> None:
+        self.window = window
+        self.bucket = bucket
+        self.max_step = max_step
+        self.reset()
+
+    def reset(self) -> None:
+        self.origin = None  # first device time, fits are done relative to it
+        self.minima = deque()  # (device time, smallest host - device) per bucket
+        self.current = None  # [bucket index, device time, difference] of the open bucket
+        self.intercept = None
+        self.slope = 0.0
+        self.last_device = None
+        # counters
+        self.observations = 0
+        self.steps = 0
+
+    def observe(self, device_time: float, host_time: float) -> None:
+        if self.last_device is not None and device_time < self.last_device:
+            # The device clock went backwards: a restarted device
+            self.reset()
+            self.steps += 1
+        if self.origin is None:
+            self.origin = device_time
+        self.last_device = device_time
+        self.observations += 1
+        x = device_time - self.origin
+        difference = host_time - device_time
+        index = int(x // self.bucket)
+        if self.current is not None and index == self.current[0]:
+            if difference < self.current[2]:
+                self.current[1:] = [x, difference]
+        else:
+            if self.current is not None:
+                self._close_bucket()
+            self.current = [index, x, difference]
+        if self.intercept is None or difference < self._envelope(x):
+            # Never map a device time to later than it was seen on the host
+            self.intercept = difference - self.slope * x
+
+    def _envelope(self, x: float) -> float:
+        return self.intercept + self.slope * x
+
+    def _close_bucket(self) -> None:
+        _, x, difference = self.current
+        step = difference - self._envelope(x)
+        if len(self.minima) >= 3 and step > self.max_step:
+            # Every observation of this bucket came late by more than max_step (before the
+            # drift is fitted a slow device clock would look like steps)
+            self.minima = deque((mx, md + step) for mx, md in self.minima)
+            self.intercept += step
+            self.steps += 1
+        self.minima.append((x, difference))
+        while self.minima and self.minima[0][0] < x - self.window:
+            self.minima.popleft()
+        if len(self.minima) >= 3:
+            xs, ds = np.array(self.minima).T
+            slope, intercept = np.polyfit(xs, ds, 1)
+            self.slope = float(slope)
+            self.intercept = float(intercept + min(0.0, (ds - (intercept + slope * xs)).min()))
+
+    def map(self, device_time):
+        """:return: host time for a device time (scalar or array)"""
+        if self.intercept is None:
+            raise ValueError("ClockMapper has no observations")
+        device_time = np.asarray(device_time, dtype=np.float64)
+        host = device_time + self.intercept + self.slope * (device_time - self.origin)
+        return float(host) if np.ndim(host) == 0 else host
+
+    @property
+    def drift(self) -> float:
+        """Rate of the host clock against the device clock, minus 1 (e.g. 1e-4 = 100 ppm)."""
+        return self.slope
+
+    def stats(self) -> dict:
+        return {"observations": self.observations, "steps": self.steps,
+                "offset": self.intercept, "drift_ppm": self.slope * 1e6}
+
+
+class TimeBase:
+    """
+    One session clock for every stage.
+
+    Timestamps are taken from the host monotonic clock, which NTP or manual changes of the
+    wall clock cannot move while capturing, and expressed as Unix time through an anchor:
+    the wall-clock time at `reset`, or the phone's time once `set_wall_time` (set_time) has
+    been received. Device clocks (camera buffer timestamps, the ECG sample clock) are
+    registered by name and mapped through their own ClockMapper onto the monotonic clock.
+    """
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.clocks = {}
+        self.synced = False
+        self.offset = 0.0  # phone time - device wall-clock time at the last set_time
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a session: re-anchor to the wall clock unless the phone's time is known, and reset the device clocks."""
+        with self.lock:
+            if not self.synced:
+                self.anchor_monotonic = time.monotonic()
+                self.anchor_wall = time.time()
+            for clock in self.clocks.values():
+                clock.reset()
+
+    def to_session(self, monotonic_time):
+        """Session time (Unix seconds) of a host monotonic time (scalar or array)."""
+        return monotonic_time + (self.anchor_wall - self.anchor_monotonic)
+
+    def now(self) -> float:
+        return self.to_session(time.monotonic())
+
+    def set_wall_time(self, wall_time: float, monotonic_time: float = None) -> None:
+        """
+        Align the session clock with an external wall clock (the phone's set_time).
+        :param wall_time: Unix time of the external clock
+        :param monotonic_time: host monotonic time at which `wall_time` was valid (default: now)
+        """
+        monotonic_time = time.monotonic() if monotonic_time is None else monotonic_time
+        with self.lock:
+            self.offset = wall_time - (time.time() - (time.monotonic() - monotonic_time))
+            self.anchor_monotonic = monotonic_time
+            self.anchor_wall = wall_time
+            self.synced = True
+        print(f"[TimeBase] Session clock set, {self.offset * 1e3:.1f} ms from the system clock")
+
+    def clock(self, name: str, **params) -> ClockMapper:
+        """The ClockMapper registered as `name`, created with `params` on first use."""
+        with self.lock:
+            if name not in self.clocks:
+                self.clocks[name] = ClockMapper(**params)
+            return self.clocks[name]
+
+    def from_device(self, name: str, device_time: float, monotonic_time: float = None) -> float:
+        """
+        Session time of a device timestamp, observed at `monotonic_time` (default: now).
+        """
+        monotonic_time = time.monotonic() if monotonic_time is None else monotonic_time
+        clock = self.clock(name)
+        clock.observe(device_time, monotonic_time)
+        return self.to_session(clock.map(device_time))
+
+    def stats(self) -> dict:
+        return {"synced": self.synced, "offset": self.offset,
+                **{name: clock.stats() for name, clock in self.clocks.items()}}